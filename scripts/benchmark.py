@@ -0,0 +1,414 @@
+"""
+CSRD Pipeline Benchmarks
+========================
+Times each pipeline stage at parameterized sizes, from the original
+24 months x 1 site up to 20 years x 5,000 sites:
+
+- generate: generate_emissions_data / generate_portfolio_data
+- export_excel / export_parquet: create_excel_report / write_parquet_dataset
+- load_cold / load_warm: generate_visuals.load_data (including validation)
+  without and with the columnar cache
+- validate: the Emissions_Data schema and consistency rules on the rows
+- render_stacked / render_intensity / render_quality: the chart functions
+  (matplotlib already imported)
+- startup_cli / startup_render_help / startup_generate_help /
+  startup_validate_help / startup_render_noop: wall time of `csrd.py --help`,
+  `csrd.py render|generate|validate --help` and a re-render with nothing
+  changed, each in a fresh interpreter (imports included)
+
+Every stage runs in its own process, so its peak RSS is not inflated by
+earlier stages; inputs a stage needs (generated rows, the workbook) are
+prepared outside the timed section. Results (wall time, peak RSS, rows/sec)
+are appended to a JSON history and compared against a stored baseline;
+stages slower or larger than the baseline by more than the tolerance are
+flagged as regressions (exit code 1).
+
+Usage:
+    python scripts/benchmark.py --sizes xs s
+    python scripts/benchmark.py --sizes xs s --save-baseline
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'benchmarks')
+HISTORY_FILE = 'history.json'
+BASELINE_FILE = 'baseline.json'
+
+# Benchmark sizes: reporting months x sites (1 site = the single-site model)
+SIZES = {
+    'xs': {'months': 24, 'sites': 1},
+    's': {'months': 60, 'sites': 50},
+    'm': {'months': 120, 'sites': 500},
+    'l': {'months': 240, 'sites': 5000},
+}
+
+STAGES = ['generate', 'export_excel', 'export_parquet', 'load_cold', 'load_warm', 'validate',
+          'render_stacked', 'render_intensity', 'render_quality',
+          'startup_cli', 'startup_render_help', 'startup_generate_help', 'startup_validate_help',
+          'startup_render_noop']
+
+# CLI invocations timed by the startup stages (csrd.py arguments)
+STARTUP_COMMANDS = {
+    'startup_cli': ['--help'],
+    'startup_render_help': ['render', '--help'],
+    'startup_generate_help': ['generate', '--help'],
+    'startup_validate_help': ['validate', '--help'],
+    'startup_render_noop': ['render', '--input', '{workbook}', '--rollup', '{rollup}',
+                            '--output-dir', '{charts}', '--dpi', '{dpi}'],
+}
+CLI_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'csrd.py')
+
+# Runs a CLI command and reports the peak RSS of its own address space
+# (ru_maxrss of a child also counts the parent's memory it was forked from)
+STARTUP_RUNNER = '''
+import atexit, os, runpy, sys
+def report_peak():
+    with open('/proc/self/status') as f:
+        kb = next(int(line.split()[1]) for line in f if line.startswith('VmHWM'))
+    sys.stderr.write(f'\\npeak_rss_kb={kb}\\n')
+if os.path.exists('/proc/self/status'):
+    atexit.register(report_peak)
+sys.argv = sys.argv[1:]
+sys.path.insert(0, os.path.dirname(sys.argv[0]))
+runpy.run_path(sys.argv[0], run_name='__main__')
+'''
+
+# Last reporting month of multi-site benchmark runs
+END_MONTH = '2024-12'
+
+# Regressions: relative slowdown / RSS growth over the baseline, and the
+# wall-time noise floor below which differences are ignored (seconds)
+DEFAULT_TOLERANCE = 0.20
+NOISE_FLOOR_SECONDS = 0.05
+
+# Chart resolution used by the render stages
+RENDER_DPI = 100
+
+
+# =====================================
+# Stage setup
+# =====================================
+
+def synthetic_roster(n_sites):
+    """Facility roster of n_sites sites cycling through routes and countries"""
+    from generate_mock_data import PROCESS_ROUTES, ROSTER_OVERRIDES
+
+    routes = list(PROCESS_ROUTES)
+    i = np.arange(n_sites)
+    return pd.DataFrame({
+        'facility_id': [f'BM-{k:05d}' for k in i],
+        'entity': [f'Benchmark Entity {k % 10}' for k in i],
+        'facility_name': [f'Benchmark Site {k}' for k in i],
+        'location': 'Benchmark',
+        'country': np.where(i % 4 == 3, 'FI', 'SE'),
+        'capacity_tonnes': 100000 + (i % 5) * 100000,
+        'process_route': [routes[k % len(routes)] for k in i],
+        **{col: np.nan for col in ROSTER_OVERRIDES},
+        'start_date': '2000-01-01',
+        'end_date': np.nan,
+    })
+
+
+def _generate(size):
+    """Generate rows for a benchmark size; returns (df, company_info)"""
+    from generate_mock_data import generate_emissions_data, generate_portfolio_data
+
+    spec = SIZES[size]
+    if spec['sites'] == 1:
+        return generate_emissions_data(n_months=spec['months'])
+    end = pd.Period(END_MONTH, freq='M')
+    start = end - spec['months'] + 1
+    return generate_portfolio_data(synthetic_roster(spec['sites']), start.to_timestamp(),
+                                   end.to_timestamp())
+
+
+def _stage_inputs(stage, size, workdir):
+    """
+    Untimed setup for a stage; returns (callable to time, rows processed),
+    (callable returning its row count, None) or (None, reason skipped)
+    """
+    import generate_visuals as visuals
+    from generate_mock_data import SHARD_SIZE, create_excel_report
+    from report_writers import EXCEL_MAX_ROWS, write_parquet_dataset
+    from rollup_store import build_rollup, save_rollup
+    from validation import validate_emissions
+
+    rows_path = os.path.join(workdir, f'{size}.pkl')
+    workbook = os.path.join(workdir, f'{size}.xlsx')
+
+    if stage == 'generate':
+        def run():
+            df, company_info = _generate(size)
+            pd.to_pickle((df, company_info), rows_path)
+            return len(df)
+        return run, None
+
+    df, company_info = pd.read_pickle(rows_path)
+    if stage == 'export_excel':
+        if len(df) > EXCEL_MAX_ROWS:
+            return None, f'{len(df):,} rows exceed the Excel row limit'
+        return lambda: create_excel_report(df, company_info, workbook), len(df)
+    if stage == 'export_parquet':
+        # Facility shards, as iter_portfolio_batches() streams them
+        output_dir = os.path.join(workdir, f'{size}_parquet')
+        batches = [df]
+        if 'Facility_ID' in df.columns:
+            shard = pd.factorize(df['Facility_ID'])[0] // SHARD_SIZE
+            batches = [batch for _, batch in df.groupby(shard, sort=True)]
+        return lambda: write_parquet_dataset(batches, company_info, output_dir), len(df)
+
+    if stage in ('load_cold', 'load_warm'):
+        if not os.path.exists(workbook):
+            return None, 'no workbook at this size'
+        cache_dir = os.path.join(workdir, '.cache')
+        if stage == 'load_cold' and os.path.isdir(cache_dir):
+            for name in os.listdir(cache_dir):
+                os.remove(os.path.join(cache_dir, name))
+        elif stage == 'load_warm':
+            visuals.load_data(workbook)
+        return lambda: visuals.load_data(workbook), len(df)
+
+    if stage == 'validate':
+        return lambda: validate_emissions(df), len(df)
+
+    if stage in STARTUP_COMMANDS:
+        paths = {'workbook': workbook, 'rollup': os.path.join(workdir, f'{size}_rollup'),
+                 'charts': os.path.join(workdir, f'{size}_charts'), 'dpi': RENDER_DPI}
+        args = [arg.format(**paths) for arg in STARTUP_COMMANDS[stage]]
+        if stage == 'startup_render_noop':
+            if not os.path.exists(workbook):
+                return None, 'no workbook at this size'
+            # Untimed first render (in this process, so the peak RSS of
+            # children is the timed run's) records the run found unchanged
+            save_rollup(build_rollup(df), paths['rollup'])
+            sys.argv = ['csrd render'] + args[1:] + ['--workers', '1']
+            visuals.main()
+        return lambda: _run_startup([CLI_PATH] + args), 0
+
+    # Chart libraries load untimed (the startup stages include imports)
+    visuals.chart_rc()
+
+    chart = stage.replace('render_', '')
+    output_path = os.path.join(workdir, f'{size}_{chart}.png')
+    if chart == 'quality':
+        rollup = build_rollup(df)
+        return lambda: visuals.create_data_quality_chart(None, output_path, rollup=rollup,
+                                                         dpi=RENDER_DPI), len(df)
+    monthly = visuals._monthly_view(df[visuals.chart_columns(chart)])
+    draw = {'stacked': visuals.create_stacked_bar_chart,
+            'intensity': visuals.create_intensity_trend_chart}[chart]
+    return lambda: draw(monthly, output_path, dpi=RENDER_DPI), len(df)
+
+
+def _run_startup(command):
+    """Run a CLI command in a fresh interpreter; returns its peak RSS in MiB (or None)"""
+    completed = subprocess.run([sys.executable, '-c', STARTUP_RUNNER] + command,
+                               capture_output=True, text=True, check=True)
+    peaks = [line for line in completed.stderr.splitlines() if line.startswith('peak_rss_kb=')]
+    return int(peaks[-1].split('=')[1]) / 2 ** 10 if peaks else None
+
+
+def _peak_rss_mb():
+    """Peak resident set size of this process in MiB"""
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def run_stage(stage, size, workdir):
+    """Run and time one stage in this process; returns its result record"""
+    run, rows = _stage_inputs(stage, size, workdir)
+    record = {'stage': stage, 'size': size, **SIZES[size]}
+    if run is None:
+        return {**record, 'skipped': rows}
+
+    started = time.perf_counter()
+    counted = run()
+    seconds = time.perf_counter() - started
+    peak_rss_mb = _peak_rss_mb()
+    if stage in STARTUP_COMMANDS:
+        # Startup stages return the CLI process's peak RSS instead of a row count
+        peak_rss_mb = counted or peak_rss_mb
+        counted = None
+    rows = counted if rows is None else rows
+    return {**record, 'rows': int(rows), 'seconds': round(seconds, 4),
+            'rows_per_sec': round(rows / seconds, 1) if seconds > 0 else None,
+            'peak_rss_mb': round(peak_rss_mb, 1)}
+
+
+# =====================================
+# Suite, history and baseline
+# =====================================
+
+def _run_isolated(stage, size, workdir):
+    """run_stage() in a fresh interpreter, so peak RSS covers this stage only"""
+    result_path = os.path.join(workdir, f'{size}.{stage}.json')
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--stage', stage, '--size', size,
+         '--workdir', workdir, '--result', result_path],
+        capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {'stage': stage, 'size': size, **SIZES[size],
+                'error': completed.stderr.strip().splitlines()[-1:]}
+    with open(result_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def run_suite(sizes, stages=STAGES):
+    """Run stages for each size in order (later stages use earlier outputs)"""
+    results = []
+    with tempfile.TemporaryDirectory(prefix='csrd-bench-') as workdir:
+        for size in sizes:
+            for stage in stages:
+                result = _run_isolated(stage, size, workdir)
+                results.append(result)
+                _print_result(result)
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+                              ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _load_json(path, default):
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    return default
+
+
+def _save_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def benchmark_run(results):
+    """History entry for one suite run: environment plus stage results"""
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+
+
+def find_regressions(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Stages slower or with a higher peak RSS than their baseline result
+    (same stage and size) by more than `tolerance`
+    """
+    reference = {(r['stage'], r['size']): r for r in baseline.get('results', [])
+                 if 'seconds' in r}
+    regressions = []
+    for result in results:
+        base = reference.get((result['stage'], result['size']))
+        if base is None or 'seconds' not in result:
+            continue
+        slower = (result['seconds'] > base['seconds'] * (1 + tolerance)
+                  and result['seconds'] - base['seconds'] > NOISE_FLOOR_SECONDS)
+        larger = result['peak_rss_mb'] > base['peak_rss_mb'] * (1 + tolerance)
+        if slower or larger:
+            regressions.append({
+                'stage': result['stage'], 'size': result['size'],
+                'seconds': result['seconds'], 'baseline_seconds': base['seconds'],
+                'peak_rss_mb': result['peak_rss_mb'], 'baseline_peak_rss_mb': base['peak_rss_mb'],
+            })
+    return regressions
+
+
+def _print_result(result):
+    label = f"{result['stage']:<21} {result['size']:<3}"
+    if 'skipped' in result:
+        print(f"{label} skipped: {result['skipped']}")
+    elif 'error' in result:
+        print(f"{label} [ERROR] {' '.join(result['error'])}")
+    else:
+        print(f"{label} {result['rows']:>10,} rows {result['seconds']:>9.3f}s "
+              f"{result['rows_per_sec'] or 0:>12,.0f} rows/s {result['peak_rss_mb']:>8.1f} MiB")
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(description='Benchmark the CSRD data pipeline stages')
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=['xs', 's'],
+                        help='Benchmark sizes to run (xs: 24 months x 1 site ... '
+                             'l: 20 years x 5,000 sites)')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--output-dir', default=BENCHMARK_DIR,
+                        help='Directory of the JSON history and baseline (default: data/benchmarks)')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Relative slowdown or RSS growth flagged as a regression')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Store this run as the baseline for later comparisons')
+    # Internal: run a single stage (used for per-stage process isolation)
+    parser.add_argument('--stage', help=argparse.SUPPRESS)
+    parser.add_argument('--size', help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stage:
+        _save_json(args.result, run_stage(args.stage, args.size, args.workdir))
+        return
+
+    print("=" * 60)
+    print("CSRD Pipeline Benchmarks")
+    print("=" * 60)
+    if 'generate' not in args.stages:
+        parser.error('--stages must include generate (later stages use its rows)')
+
+    run = benchmark_run(run_suite(args.sizes, [s for s in STAGES if s in args.stages]))
+    history_path = os.path.join(args.output_dir, HISTORY_FILE)
+    history = _load_json(history_path, [])
+    history.append(run)
+    _save_json(history_path, history)
+    print(f"\n[OK] Benchmark history: {history_path} ({len(history)} runs)")
+
+    baseline_path = os.path.join(args.output_dir, BASELINE_FILE)
+    if args.save_baseline:
+        _save_json(baseline_path, run)
+        print(f"[OK] Baseline saved: {baseline_path}")
+        return
+
+    baseline = _load_json(baseline_path, None)
+    if baseline is None:
+        print("[NOTE] No baseline yet; run with --save-baseline to store one")
+        return
+
+    regressions = find_regressions(run['results'], baseline, args.tolerance)
+    if not regressions:
+        print(f"[OK] No regressions against baseline {baseline['timestamp']} "
+              f"(tolerance {args.tolerance:.0%})")
+        return
+
+    print(f"\n[ERROR] {len(regressions)} regression(s) against baseline {baseline['timestamp']}:")
+    for r in regressions:
+        print(f"  {r['stage']:<21} {r['size']:<3} {r['baseline_seconds']:.3f}s -> {r['seconds']:.3f}s, "
+              f"{r['baseline_peak_rss_mb']:.1f} -> {r['peak_rss_mb']:.1f} MiB")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
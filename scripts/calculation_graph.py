@@ -0,0 +1,382 @@
+"""
+CSRD Calculation Graph
+======================
+The emission calculations as a dependency graph:
+
+    activity data + factors -> line items (e.g. Scope3_Cat4_Upstream_Transport)
+    -> scope totals -> Total_Emissions_tCO2e -> intensity / quality score
+
+Every node is a vectorized formula over its inputs. A full run evaluates
+all nodes over all rows; a recalculation marks only the nodes downstream of
+the changed inputs dirty and re-evaluates them on the changed rows, so a
+single factor or month correction does not recompute the whole history.
+Restatement deltas are reported per row on the rounded published values.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Calculation inputs: activity columns and the per-row parameters from
+# generate_mock_data.emission_parameters()
+ACTIVITY_INPUTS = ['Production_Tonnes', 'Blast_Furnace_Variation',
+                   'Auxiliary_Variation', 'Heating_Variation']
+PARAMETER_INPUTS = ['scope1_factor', 'size_scale', 'kwh_per_tonne', 'grid_factor',
+                    'market_factor', 'heating_factor', 'ore_per_tonne', 'ore_factor',
+                    'coal_per_tonne', 'coal_factor', 'limestone_per_tonne',
+                    'limestone_factor', 'freight_factor', 'distribution_factor',
+                    'end_of_life_factor', 'capital_goods_factor', 'energy_upstream_factor',
+                    'waste_factor', 'business_travel_factor', 'commuting_factor',
+                    'processing_factor']
+
+# Default Scope 3 quality tier shares (supplier data covers few purchases)
+SCOPE3_TIER_SHARES = {'Measured': 0.15, 'Calculated': 0.25, 'Estimated': 0.60}
+
+
+def _not_applicable(production):
+    """Scope 3 category with no activity in the model (reported as zero)"""
+    return np.zeros(np.shape(production))
+
+
+def _per_tonne(total, production):
+    """Emissions per tonne of steel; NaN where nothing was produced"""
+    total = np.asarray(total, dtype=np.float64)
+    return np.divide(total, production, out=np.full(np.shape(total), np.nan),
+                     where=np.asarray(production) != 0)
+
+
+# node: (inputs, formula); listed in dependency order
+CALCULATION_GRAPH = {
+    # =====================================
+    # SCOPE 1: Direct emissions (tCO2e)
+    # =====================================
+    # Blast furnace operations: ~0.5 tCO2/tonne steel (Swedish benchmark)
+    'Scope1_Blast_Furnace': (('Production_Tonnes', 'scope1_factor', 'Blast_Furnace_Variation'),
+                             lambda production, factor, variation: production * factor * (0.98 + variation)),
+    'Scope1_Auxiliary': (('Auxiliary_Variation', 'size_scale'),  # Auxiliary combustion
+                         lambda variation, scale: (800 + variation) * scale),
+    'Scope1_Total_tCO2e': (('Scope1_Blast_Furnace', 'Scope1_Auxiliary'),
+                           lambda blast_furnace, auxiliary: blast_furnace + auxiliary),
+
+    # =====================================
+    # SCOPE 2: Indirect emissions (tCO2e)
+    # =====================================
+    # Swedish electricity grid: ~13 g CO2/kWh (highly renewable)
+    'Scope2_Electricity_kWh': (('Production_Tonnes', 'kwh_per_tonne'),
+                               lambda production, kwh: production * kwh),
+    'Scope2_Location_Based': (('Scope2_Electricity_kWh', 'grid_factor'),  # Grid average
+                              lambda kwh, factor: kwh * factor),
+    'Scope2_Market_Based': (('Scope2_Electricity_kWh', 'market_factor'),  # Renewable contracts
+                            lambda kwh, factor: kwh * factor),
+
+    # District heating (Swedish low-carbon heat)
+    'heating_mwh': (('Heating_Variation', 'size_scale'),
+                    lambda variation, scale: (2500 + variation) * scale),
+    'Scope2_Heating': (('heating_mwh', 'heating_factor'),
+                       lambda mwh, factor: mwh * factor),
+    'Scope2_Total_tCO2e': (('Scope2_Location_Based', 'Scope2_Heating'),
+                           lambda location, heating: location + heating),
+
+    # =====================================
+    # SCOPE 3: Value chain emissions (tCO2e)
+    # =====================================
+    # Category 1: Purchased goods (iron ore, coal, limestone)
+    'iron_ore_tonnes': (('Production_Tonnes', 'ore_per_tonne'),
+                        lambda production, intensity: production * intensity),
+    'scope3_cat1_ore': (('iron_ore_tonnes', 'ore_factor'),
+                        lambda tonnes, factor: tonnes * factor),
+    'coal_tonnes': (('Production_Tonnes', 'coal_per_tonne'),
+                    lambda production, intensity: production * intensity),
+    'scope3_cat1_coal': (('coal_tonnes', 'coal_factor'),
+                         lambda tonnes, factor: tonnes * factor),
+    'limestone_tonnes': (('Production_Tonnes', 'limestone_per_tonne'),
+                         lambda production, intensity: production * intensity),
+    'scope3_cat1_limestone': (('limestone_tonnes', 'limestone_factor'),
+                              lambda tonnes, factor: tonnes * factor),
+    'Scope3_Cat1_Purchased_Goods': (('scope3_cat1_ore', 'scope3_cat1_coal', 'scope3_cat1_limestone'),
+                                    lambda ore, coal, limestone: ore + coal + limestone),
+
+    # Category 2: Capital goods (plant and equipment, spend-based per tonne)
+    'Scope3_Cat2_Capital_Goods': (('Production_Tonnes', 'capital_goods_factor'),
+                                  lambda production, factor: production * factor),
+
+    # Category 3: Fuel- and energy-related (upstream and T&D losses of electricity)
+    'Scope3_Cat3_Fuel_Energy': (('Scope2_Electricity_kWh', 'energy_upstream_factor'),
+                                lambda kwh, factor: kwh * factor),
+
+    # Category 4: Upstream transportation (ore and coal, 500 km average haul)
+    'transport_tkm': (('iron_ore_tonnes', 'coal_tonnes'),
+                      lambda ore, coal: (ore + coal) * 500),
+    'Scope3_Cat4_Upstream_Transport': (('transport_tkm', 'freight_factor'),
+                                       lambda tkm, factor: tkm * factor),
+
+    # Categories 5-7: Operational waste, business travel, employee commuting
+    'Scope3_Cat5_Waste': (('Production_Tonnes', 'waste_factor'),
+                          lambda production, factor: production * factor),
+    'Scope3_Cat6_Business_Travel': (('Production_Tonnes', 'business_travel_factor'),
+                                    lambda production, factor: production * factor),
+    'Scope3_Cat7_Employee_Commuting': (('Production_Tonnes', 'commuting_factor'),
+                                       lambda production, factor: production * factor),
+
+    # Category 8: Upstream leased assets (none; all sites are owned)
+    'Scope3_Cat8_Upstream_Leased_Assets': (('Production_Tonnes',), _not_applicable),
+
+    # Category 9: Downstream transportation (distribution to customers)
+    'Scope3_Cat9_Downstream_Transport': (('Production_Tonnes', 'distribution_factor'),
+                                         lambda production, factor: production * factor),
+
+    # Category 10: Processing of sold products (cutting and forming by customers)
+    'Scope3_Cat10_Processing': (('Production_Tonnes', 'processing_factor'),
+                                lambda production, factor: production * factor),
+
+    # Category 11: Use of sold products (steel is an intermediate product
+    # with no direct use-phase emissions)
+    'Scope3_Cat11_Use_of_Products': (('Production_Tonnes',), _not_applicable),
+
+    # Category 12: End-of-life treatment (steel recycling/disposal)
+    'Scope3_Cat12_End_of_Life': (('Production_Tonnes', 'end_of_life_factor'),
+                                 lambda production, factor: production * factor),
+
+    # Categories 13-15: Downstream leased assets, franchises, investments (none)
+    'Scope3_Cat13_Downstream_Leased_Assets': (('Production_Tonnes',), _not_applicable),
+    'Scope3_Cat14_Franchises': (('Production_Tonnes',), _not_applicable),
+    'Scope3_Cat15_Investments': (('Production_Tonnes',), _not_applicable),
+
+    'Scope3_Total_tCO2e': (('Scope3_Cat1_Purchased_Goods', 'Scope3_Cat2_Capital_Goods',
+                            'Scope3_Cat3_Fuel_Energy', 'Scope3_Cat4_Upstream_Transport',
+                            'Scope3_Cat5_Waste', 'Scope3_Cat6_Business_Travel',
+                            'Scope3_Cat7_Employee_Commuting', 'Scope3_Cat8_Upstream_Leased_Assets',
+                            'Scope3_Cat9_Downstream_Transport', 'Scope3_Cat10_Processing',
+                            'Scope3_Cat11_Use_of_Products', 'Scope3_Cat12_End_of_Life',
+                            'Scope3_Cat13_Downstream_Leased_Assets', 'Scope3_Cat14_Franchises',
+                            'Scope3_Cat15_Investments'),
+                           lambda *categories: sum(categories)),
+
+    # =====================================
+    # Data Quality Assessment (ESRS E1)
+    # =====================================
+    # Scope 1: 70% measured, 25% calculated, 5% estimated
+    'Scope1_Measured': (('Scope1_Total_tCO2e',), lambda total: total * 0.70),
+    'Scope1_Calculated': (('Scope1_Total_tCO2e',), lambda total: total * 0.25),
+    'Scope1_Estimated': (('Scope1_Total_tCO2e',), lambda total: total * 0.05),
+
+    # Scope 2: 90% measured, 10% calculated
+    'Scope2_Measured': (('Scope2_Total_tCO2e',), lambda total: total * 0.90),
+    'Scope2_Calculated': (('Scope2_Total_tCO2e',), lambda total: total * 0.10),
+    'Scope2_Estimated': (('Scope2_Total_tCO2e',),
+                         lambda total: np.zeros(len(total), dtype=np.int64)),
+
+    # Scope 3: 15% measured, 25% calculated, 60% estimated (SCOPE3_TIER_SHARES)
+    'Scope3_Measured': (('Scope3_Total_tCO2e',),
+                        lambda total: total * SCOPE3_TIER_SHARES['Measured']),
+    'Scope3_Calculated': (('Scope3_Total_tCO2e',),
+                          lambda total: total * SCOPE3_TIER_SHARES['Calculated']),
+    'Scope3_Estimated': (('Scope3_Total_tCO2e',),
+                         lambda total: total * SCOPE3_TIER_SHARES['Estimated']),
+
+    # Totals & Intensity
+    'Total_Emissions_tCO2e': (('Scope1_Total_tCO2e', 'Scope2_Total_tCO2e', 'Scope3_Total_tCO2e'),
+                              lambda scope1, scope2, scope3: scope1 + scope2 + scope3),
+    'Emissions_Intensity_tCO2e_per_tonne': (('Total_Emissions_tCO2e', 'Production_Tonnes'),
+                                            _per_tonne),
+    'Data_Quality_Score': (('Scope1_Measured', 'Scope2_Measured', 'Scope3_Measured',
+                            'Total_Emissions_tCO2e'),
+                           lambda scope1, scope2, scope3, total: (scope1 + scope2 + scope3) / total * 100),
+}
+
+# Published Emissions_Data columns in sheet order, with their rounding
+# (None = published as computed)
+OUTPUT_COLUMNS = {
+    # Production
+    'Production_Tonnes': 2,
+
+    # Scope 1
+    'Scope1_Total_tCO2e': 2,
+    'Scope1_Blast_Furnace': 2,
+    'Scope1_Auxiliary': 2,
+    'Scope1_Measured': 2,
+    'Scope1_Calculated': 2,
+    'Scope1_Estimated': 2,
+
+    # Scope 2
+    'Scope2_Total_tCO2e': 2,
+    'Scope2_Electricity_kWh': 0,
+    'Scope2_Location_Based': 2,
+    'Scope2_Market_Based': 2,
+    'Scope2_Heating': 2,
+    'Scope2_Measured': 2,
+    'Scope2_Calculated': 2,
+    'Scope2_Estimated': None,
+
+    # Scope 3
+    'Scope3_Total_tCO2e': 2,
+    'Scope3_Cat1_Purchased_Goods': 2,
+    'Scope3_Cat2_Capital_Goods': 2,
+    'Scope3_Cat3_Fuel_Energy': 2,
+    'Scope3_Cat4_Upstream_Transport': 2,
+    'Scope3_Cat5_Waste': 2,
+    'Scope3_Cat6_Business_Travel': 2,
+    'Scope3_Cat7_Employee_Commuting': 2,
+    'Scope3_Cat8_Upstream_Leased_Assets': 2,
+    'Scope3_Cat9_Downstream_Transport': 2,
+    'Scope3_Cat10_Processing': 2,
+    'Scope3_Cat11_Use_of_Products': 2,
+    'Scope3_Cat12_End_of_Life': 2,
+    'Scope3_Cat13_Downstream_Leased_Assets': 2,
+    'Scope3_Cat14_Franchises': 2,
+    'Scope3_Cat15_Investments': 2,
+    'Scope3_Measured': 2,
+    'Scope3_Calculated': 2,
+    'Scope3_Estimated': 2,
+
+    # Totals & Intensity
+    'Total_Emissions_tCO2e': 2,
+    'Emissions_Intensity_tCO2e_per_tonne': 3,
+
+    # Metadata
+    'Data_Quality_Score': 1,
+}
+
+
+# Published ratios: re-derived from summed inputs when rows are aggregated
+RATIO_COLUMNS = ['Emissions_Intensity_tCO2e_per_tonne', 'Data_Quality_Score']
+
+
+def calculation_inputs(activity, params):
+    """Graph inputs as full-length float arrays (scalar parameters are broadcast)"""
+    n = len(activity)
+    inputs = {name: activity[name].to_numpy(dtype=np.float64) for name in ACTIVITY_INPUTS}
+    for name in PARAMETER_INPUTS:
+        inputs[name] = np.broadcast_to(np.asarray(params[name], dtype=np.float64), (n,))
+    return inputs
+
+
+def _source(inputs, values, name, rows=None):
+    array = values[name] if name in values else inputs[name]
+    return array if rows is None else array[rows]
+
+
+def evaluate_graph(inputs, nodes=None, overrides=None):
+    """
+    Evaluate every node (or only `nodes`) over all rows; returns {node: array}
+
+    overrides maps nodes to observed values (e.g. metered kWh) replacing the
+    formula wherever they are not NaN; downstream nodes use them.
+    """
+    values = {}
+    for node, (sources, formula) in CALCULATION_GRAPH.items():
+        if nodes is None or node in nodes:
+            values[node] = formula(*[_source(inputs, values, name) for name in sources])
+            if overrides is not None and node in overrides:
+                values[node] = np.where(np.isnan(overrides[node]), values[node], overrides[node])
+    return values
+
+
+def upstream_nodes(targets):
+    """Nodes the target nodes depend on (targets included), in evaluation order"""
+    needed = set(targets)
+    for node in reversed(list(CALCULATION_GRAPH)):
+        if node in needed:
+            needed.update(CALCULATION_GRAPH[node][0])
+    return [node for node in CALCULATION_GRAPH if node in needed]
+
+
+def dirty_nodes(changed):
+    """Nodes downstream of the changed inputs/nodes, in evaluation order"""
+    dirty = set(changed)
+    order = []
+    for node, (sources, _) in CALCULATION_GRAPH.items():
+        if dirty.intersection(sources):
+            dirty.add(node)
+            order.append(node)
+    return order
+
+
+def output_values(inputs, values, rows=None, rounded=True):
+    """
+    Published columns ({column: array}), optionally for some rows only
+
+    Values are rounded to their published decimals unless rounded=False,
+    as for daily/hourly rows, whose monthly sums are rounded instead.
+    """
+    output = {}
+    for column, decimals in OUTPUT_COLUMNS.items():
+        array = _source(inputs, values, column, rows)
+        output[column] = array if decimals is None or not rounded else np.round(array, decimals)
+    return output
+
+
+def recalculate(state, changes, rows=None):
+    """
+    Apply input changes and recompute only the dirty nodes on dirty rows
+
+    state is {'inputs': ..., 'values': ...} from a previous evaluation.
+    changes maps input names to new values: full-length arrays or scalars,
+    or, when `rows` (row positions) is given, values aligned with rows.
+    Rows whose inputs do not actually change stay clean.
+
+    Returns (restated state, dirty) where dirty holds the recomputed 'rows',
+    'nodes' and changed 'inputs'. The original state is not modified.
+    """
+    inputs = dict(state['inputs'])
+    n = len(inputs['Production_Tonnes'])
+    rows = np.arange(n) if rows is None else np.asarray(rows)
+
+    changed_rows = np.zeros(n, dtype=bool)
+    changed_inputs = []
+    for name, new in changes.items():
+        if name not in inputs:
+            raise KeyError(f"Unknown calculation input: {name}")
+        new = np.broadcast_to(np.asarray(new, dtype=np.float64), rows.shape)
+        differs = inputs[name][rows] != new
+        if differs.any():
+            updated = inputs[name].copy()
+            updated[rows] = new
+            inputs[name] = updated
+            changed_rows[rows[differs]] = True
+            changed_inputs.append(name)
+
+    dirty_rows = np.flatnonzero(changed_rows)
+    nodes = dirty_nodes(changed_inputs)
+
+    # Copy-on-write per dirty node; clean nodes share the original arrays
+    values = dict(state['values'])
+    for node in nodes:
+        sources, formula = CALCULATION_GRAPH[node]
+        updated = values[node].copy()
+        updated[dirty_rows] = formula(*[_source(inputs, values, name, dirty_rows)
+                                        for name in sources])
+        values[node] = updated
+
+    restated = dict(state, inputs=inputs, values=values)
+    return restated, {'rows': dirty_rows, 'nodes': nodes, 'inputs': changed_inputs}
+
+
+def restatement_deltas(state, restated, dirty):
+    """
+    Per-row restatement of published columns: Row, Column, Reported,
+    Restated and Delta for every value that changes after rounding
+    """
+    rows = dirty['rows']
+    changed = set(dirty['nodes']) | set(dirty['inputs'])
+    reported = output_values(state['inputs'], state['values'], rows)
+    restated_values = output_values(restated['inputs'], restated['values'], rows)
+
+    frames = []
+    for column, decimals in OUTPUT_COLUMNS.items():
+        if column not in changed:
+            continue
+        delta = restated_values[column] - reported[column]
+        if decimals is not None:
+            delta = np.round(delta, decimals)
+        moved = delta != 0
+        frames.append(pd.DataFrame({
+            'Row': rows[moved],
+            'Column': column,
+            'Reported': reported[column][moved],
+            'Restated': restated_values[column][moved],
+            'Delta': delta[moved],
+        }))
+
+    if not frames:
+        return pd.DataFrame(columns=['Row', 'Column', 'Reported', 'Restated', 'Delta'])
+    return pd.concat(frames, ignore_index=True).sort_values('Row', kind='stable', ignore_index=True)
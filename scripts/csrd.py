@@ -0,0 +1,63 @@
+"""
+CSRD Command Line
+=================
+One entry point for the pipeline scripts:
+
+    python scripts/csrd.py generate [options]   # Excel workbook
+    python scripts/csrd.py export [options]     # Parquet / Arrow / star schema
+    python scripts/csrd.py render [options]     # charts
+    python scripts/csrd.py validate WORKBOOK    # consistency checks
+
+`python scripts/csrd.py <command> --help` lists a command's options (the
+same as the script it runs). A command's module is imported only when that
+command runs, so the CLI itself starts without pandas or matplotlib.
+`render --help` stays light too; generate, export, validate and ingest
+import pandas and numpy with their module, --help included (about 0.8 s,
+timed by the benchmark's startup stages).
+"""
+
+import argparse
+import importlib
+import sys
+
+# Subcommands: module whose main() runs, arguments put before the user's
+# (later arguments win) and a one-line summary
+COMMANDS = {
+    'generate': ('generate_mock_data', [], 'Generate emissions data into the Excel workbook'),
+    'export': ('generate_mock_data', ['--format', 'parquet'],
+               'Stream emissions data to Parquet (default), Arrow or a Power BI star schema'),
+    'render': ('generate_visuals', [], 'Render the charts (reuses unchanged ones)'),
+    'validate': ('validation', [], 'Check a workbook against the consistency rules'),
+    'ingest': ('ingestion', [], 'Build the workbook from recorded activity data'),
+    'serve': ('report_service', [], 'Serve reports on demand over HTTP'),
+    'benchmark': ('benchmark', [], 'Time pipeline stages and CLI startup'),
+}
+
+
+def run_command(command, args):
+    """Run a subcommand's main() with its arguments (exit code of main or 0)"""
+    module, defaults, _ = COMMANDS[command]
+    sys.argv = [f'csrd {command}'] + defaults + list(args)
+    return importlib.import_module(module).main()
+
+
+def main(argv=None):
+    """Main execution function"""
+    parser = argparse.ArgumentParser(
+        prog='csrd', usage='csrd [-h] command [options]',
+        description='CSRD climate data pipeline',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='commands:\n' + '\n'.join(f'  {name:<10} {summary}'
+                                         for name, (_, _, summary) in COMMANDS.items()))
+    parser.add_argument('command', choices=list(COMMANDS), metavar='command',
+                        help='one of: ' + ', '.join(COMMANDS))
+
+    # Everything after the command, --help included, belongs to the command
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] in COMMANDS:
+        return run_command(argv[0], argv[1:])
+    parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
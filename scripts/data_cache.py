@@ -0,0 +1,151 @@
+"""
+CSRD Workbook Cache
+===================
+Columnar on-disk cache for the generated Excel workbook.
+
+The first load of a workbook sheet parses it with pd.read_excel and writes
+an uncompressed Arrow IPC (Feather v2) copy. Later loads memory-map that
+copy and read only the requested columns, so chart runs no longer pay the
+Excel parsing cost.
+
+Cache entries are keyed by file mtime/size (fast path) and SHA-256 content
+hash (so a touched-but-unchanged workbook is still a hit).
+
+Requires pyarrow (pip install pyarrow); without it loads fall back to
+pd.read_excel. pandas and pyarrow are imported on the first load, so
+importing this module is cheap.
+"""
+
+import hashlib
+import json
+import os
+import uuid
+from pathlib import Path
+
+INDEX_FILE = 'cache_index.json'
+
+# Hit/miss counters for the current process
+CACHE_STATS = {'hits': 0, 'misses': 0, 'uncached': 0}
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """SHA-256 of a file's contents, read in 1 MiB chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _load_index(cache_dir):
+    index_path = cache_dir / INDEX_FILE
+    if index_path.exists():
+        with open(index_path, encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def _tmp_path(path):
+    """Temporary file next to path, unique to this writer (parallel loads race)"""
+    return path.with_name(f'{path.name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp')
+
+
+def _save_index(cache_dir, index):
+    tmp_path = _tmp_path(cache_dir / INDEX_FILE)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_path, cache_dir / INDEX_FILE)
+
+
+def _cache_file(cache_dir, file_path, sheet_name, content_hash):
+    return cache_dir / f'{Path(file_path).stem}.{sheet_name}.{content_hash[:16]}.arrow'
+
+
+def _cached_sheet_path(file_path, sheet_name, cache_dir=None):
+    """
+    Arrow IPC copy of one workbook sheet, written on a cache miss; None
+    when pyarrow is not installed
+    """
+    import pandas as pd
+    try:
+        import pyarrow as pa
+        import pyarrow.feather as feather
+    except ImportError:
+        CACHE_STATS['uncached'] += 1
+        return None
+
+    file_path = Path(file_path)
+    stat = file_path.stat()
+    cache_dir = Path(cache_dir) if cache_dir else file_path.parent / '.cache'
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    index = _load_index(cache_dir)
+    key = f'{file_path.resolve()}::{sheet_name}'
+    entry = index.get(key)
+
+    # Fast path: unchanged mtime and size; otherwise confirm by content hash
+    if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+        content_hash = entry['sha256']
+    else:
+        content_hash = file_sha256(file_path)
+
+    cache_path = _cache_file(cache_dir, file_path, sheet_name, content_hash)
+    if cache_path.exists():
+        CACHE_STATS['hits'] += 1
+    else:
+        CACHE_STATS['misses'] += 1
+        df = pd.read_excel(file_path, sheet_name=sheet_name)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        tmp_path = _tmp_path(cache_path)
+        feather.write_feather(table, tmp_path, compression='uncompressed')
+        os.replace(tmp_path, cache_path)
+
+        # Drop the superseded cache file for this workbook/sheet
+        if entry and entry['cache_file'] != cache_path.name:
+            (cache_dir / entry['cache_file']).unlink(missing_ok=True)
+
+    if entry is None or entry['sha256'] != content_hash or entry['mtime_ns'] != stat.st_mtime_ns:
+        index[key] = {
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'sha256': content_hash,
+            'cache_file': cache_path.name,
+        }
+        _save_index(cache_dir, index)
+    return cache_path
+
+
+def load_cached_sheet(file_path, sheet_name, columns=None, cache_dir=None):
+    """
+    Load one workbook sheet through the columnar cache
+
+    Only `columns` are read from the cache (all columns when None). Raises
+    FileNotFoundError if the workbook does not exist.
+    """
+    cache_path = _cached_sheet_path(file_path, sheet_name, cache_dir)
+    if cache_path is None:
+        import pandas as pd
+        return pd.read_excel(file_path, sheet_name=sheet_name, usecols=columns)
+
+    # Memory-mapped, uncompressed IPC: numeric columns convert without copying
+    import pyarrow.feather as feather
+    table = feather.read_table(cache_path, columns=columns, memory_map=True)
+    return table.to_pandas(split_blocks=True)
+
+
+def cached_sheet_columns(file_path, sheet_name, cache_dir=None):
+    """Column names of one workbook sheet, read from the cached copy's schema"""
+    cache_path = _cached_sheet_path(file_path, sheet_name, cache_dir)
+    if cache_path is None:
+        import pandas as pd
+        return list(pd.read_excel(file_path, sheet_name=sheet_name, nrows=0).columns)
+
+    import pyarrow as pa
+    with pa.memory_map(str(cache_path)) as source:
+        return pa.ipc.open_file(source).schema.names
+
+
+def cache_report():
+    """One-line summary of cache hits and misses"""
+    return (f"{CACHE_STATS['hits']} hit(s), {CACHE_STATS['misses']} miss(es)"
+            + (f", {CACHE_STATS['uncached']} uncached load(s)" if CACHE_STATS['uncached'] else ''))
@@ -12,15 +12,311 @@ Date: 2024
 
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+import argparse
 import os
-
-# Set random seed for reproducibility
-np.random.seed(42)
-
-
-def generate_emissions_data():
-    """Generate 24 months of realistic emissions data for Swedish steel company"""
+import zlib
+
+from calculation_graph import (calculation_inputs, evaluate_graph, output_values,
+                               recalculate, restatement_deltas)
+from emission_factors import factor_registry, lookup_factors, registry_vintages
+from report_writers import (EXCEL_MAX_ROWS, write_arrow_ipc, write_parquet_dataset,
+                            write_star_schema)
+from scope2_matching import load_certificates, market_based_factors, matching_start
+from rollup_store import (annual_summary_table, build_rollup, data_quality_table,
+                          load_rollup, save_rollup, update_rollup)
+from time_series import (FREQUENCIES, compact_dtypes, expand_months, month_starts,
+                         unify_categories, widen_dtypes)
+from scenarios import (CACHE_STATS as SCENARIO_CACHE_STATS, pathway_summary, run_scenarios,
+                       save_cube)
+from uncertainty import DEFAULT_MEMORY_MB, uncertainty_table
+import tracing
+from tracing import path_size, span, traced_batches
+
+# Seed for reproducibility
+SEED = 42
+
+# Per-month random terms, one uniform draw per component and month, each
+# addressed by (facility, month, component) (see period_uniforms)
+RANDOM_COMPONENTS = ['production', 'blast_furnace', 'auxiliary', 'heating']
+RANDOM_LOW = np.array([-0.08, -0.05, -100.0, -300.0])
+RANDOM_HIGH = np.array([0.08, 0.05, 100.0, 300.0])
+
+# Process routes: direct emission factor (registry activity), electricity and
+# raw material intensity per tonne of steel (BF-BOF is the original Luleå model)
+PROCESS_ROUTES = {
+    'BF-BOF': {                     # Blast furnace / basic oxygen furnace
+        'scope1_activity': 'steel_bf_bof',
+        'kwh_per_tonne': 650,
+        'ore_per_tonne': 1.6,
+        'coal_per_tonne': 0.4,
+        'limestone_per_tonne': 0.2,
+    },
+    'EAF': {                        # Scrap-based electric arc furnace
+        'scope1_activity': 'steel_eaf',     # Electrodes, charge carbon, natural gas
+        'kwh_per_tonne': 550,
+        'ore_per_tonne': 0.0,
+        'coal_per_tonne': 0.02,
+        'limestone_per_tonne': 0.05,
+    },
+    'H-DR': {                       # Hydrogen direct reduction + EAF (HYBRIT)
+        'scope1_activity': 'steel_h_dr',
+        'kwh_per_tonne': 3500,      # Electrolysis dominates energy demand
+        'ore_per_tonne': 1.5,
+        'coal_per_tonne': 0.0,
+        'limestone_per_tonne': 0.05,
+    },
+}
+
+# Calculation parameters resolved from the emission factor registry
+# (data/emission_factors.csv) per row, by activity, country and date
+FACTOR_ACTIVITIES = {
+    'grid_factor': 'electricity_grid',
+    'market_factor': 'electricity_market',
+    'heating_factor': 'district_heating',
+    'ore_factor': 'iron_ore',
+    'coal_factor': 'coking_coal',
+    'limestone_factor': 'limestone',
+    'freight_factor': 'freight_rail_ship',
+    'distribution_factor': 'downstream_distribution',
+    'end_of_life_factor': 'steel_end_of_life',
+    'capital_goods_factor': 'capital_goods',
+    'energy_upstream_factor': 'electricity_upstream',
+    'waste_factor': 'operational_waste',
+    'business_travel_factor': 'business_travel',
+    'commuting_factor': 'employee_commuting',
+    'processing_factor': 'steel_processing',
+}
+
+# Parameters taken from the registry, i.e. those a restatement can change
+FACTOR_PARAMETERS = ['scope1_factor'] + list(FACTOR_ACTIVITIES)
+
+# Home country of the single-site (Luleå) model
+DEFAULT_COUNTRY = 'SE'
+
+# Reference site the auxiliary combustion and district heating baselines
+# are calibrated to (tonnes steel/year), and its base monthly production
+REFERENCE_CAPACITY = 500000
+BASE_PRODUCTION = 41667
+
+# First reporting month of the single-site model
+REFERENCE_START = '2023-01'
+
+# Random stream key of the single-site model (the Luleå roster entry, so both
+# modes draw the same terms for the site)
+REFERENCE_FACILITY = 'NS-LUL-01'
+
+# Facility roster columns (see data/facility_roster.csv)
+ROSTER_COLUMNS = ['facility_id', 'entity', 'facility_name', 'location', 'country',
+                  'capacity_tonnes', 'process_route', 'start_date', 'end_date']
+
+# Optional roster columns overriding registry factors for a site (blank = registry)
+ROSTER_OVERRIDES = ['grid_factor', 'market_factor']
+
+# Columns identifying a row in restatement reports
+ROW_KEYS = ['Entity', 'Facility_ID', 'Timestamp', 'Date']
+
+# Per-row site attributes kept with a calculation state to re-resolve factors
+SITE_COLUMNS = ['process_route', 'country', 'capacity_tonnes'] + ROSTER_OVERRIDES
+
+# Facilities per worker task (monthly); fixed so output never depends on
+# worker count. Finer resolutions use FREQUENCIES[freq]['shard_size'].
+SHARD_SIZE = FREQUENCIES['monthly']['shard_size']
+
+# Streaming output stages (Excel is written in one piece by create_excel_report)
+OUTPUT_WRITERS = {
+    'parquet': write_parquet_dataset,
+    'arrow': write_arrow_ipc,
+    'star': write_star_schema,
+}
+
+
+def facility_key(facility_id, seed=SEED):
+    """Philox key of a facility's random streams"""
+    key = zlib.crc32(str(facility_id).encode('utf-8'))
+    return np.random.SeedSequence(seed, spawn_key=(key,)).generate_state(2, np.uint64)
+
+
+def period_uniforms(key, periods, n_components):
+    """
+    (len(periods), n_components) uniforms in [0, 1) for an array of month
+    ordinals
+
+    Under a facility's Philox key, counter (month, c // 4) holds components
+    c..c+3, so a draw does not depend on which other months, sites or
+    components are generated, or in what order: any month or site can be
+    regenerated directly, and chunked or parallel runs match serial ones.
+    """
+    periods = np.asarray(periods, dtype=np.int64)
+    if not len(periods):
+        return np.empty((0, n_components))
+    first = int(periods.min())
+    span = int(periods.max()) - first + 1
+    blocks = []
+    for block in range((n_components + 3) // 4):
+        bit_generator = np.random.Philox(key=key, counter=[first, block, 0, 0])
+        blocks.append(np.random.Generator(bit_generator).random(4 * span).reshape(span, 4))
+    return np.hstack(blocks)[periods - first, :n_components]
+
+
+def emission_parameters(dates, process_route='BF-BOF', country=DEFAULT_COUNTRY,
+                        capacity_tonnes=REFERENCE_CAPACITY, registry=None):
+    """
+    Per-row calculation parameters, keyed as calculate_emissions expects
+
+    process_route, country and capacity_tonnes are scalars or arrays aligned
+    with dates. Emission factors come from the registry (default:
+    data/emission_factors.csv), valid for each row's country and date.
+    """
+    if registry is None:
+        registry = factor_registry()
+
+    n = len(dates)
+    routes = np.broadcast_to(np.asarray(process_route, dtype=object), (n,))
+    route_codes, route_names = pd.factorize(routes)
+    route_table = pd.DataFrame(PROCESS_ROUTES).T.loc[route_names]
+
+    params = {name: route_table[name].to_numpy()[route_codes] for name in route_table.columns}
+    params['scope1_factor'] = lookup_factors(registry, params.pop('scope1_activity'), country, dates)
+    for name, activity in FACTOR_ACTIVITIES.items():
+        params[name] = lookup_factors(registry, activity, country, dates)
+    for name in ['kwh_per_tonne', 'ore_per_tonne', 'coal_per_tonne', 'limestone_per_tonne']:
+        params[name] = params[name].astype(np.float64)
+    params['size_scale'] = np.asarray(capacity_tonnes) / REFERENCE_CAPACITY
+    return params
+
+
+def resolve_parameters(dates, sites, registry=None):
+    """
+    emission_parameters() for per-row site attributes (SITE_COLUMNS), with
+    the roster's grid/market overrides applied where given
+    """
+    params = emission_parameters(
+        dates, sites['process_route'].to_numpy(), sites['country'].to_numpy(),
+        sites['capacity_tonnes'].to_numpy(), registry=registry)
+    for col in ROSTER_OVERRIDES:
+        override = sites[col].to_numpy(dtype=np.float64)
+        params[col] = np.where(np.isnan(override), params[col], override)
+    return params
+
+
+def reference_sites(n):
+    """SITE_COLUMNS for n rows of the single-site Luleå model"""
+    return pd.DataFrame({'process_route': 'BF-BOF', 'country': DEFAULT_COUNTRY,
+                         'capacity_tonnes': REFERENCE_CAPACITY,
+                         **{col: np.nan for col in ROSTER_OVERRIDES}}, index=range(n))
+
+
+def draw_activity(periods, base_production, facility_id, seed=SEED):
+    """
+    Draw production and the random calculation terms of a facility for an
+    array of month ordinals (from 1970-01); returns (production, draws)
+    """
+    uniforms = period_uniforms(facility_key(facility_id, seed), periods, len(RANDOM_COMPONENTS))
+    draws = RANDOM_LOW + (RANDOM_HIGH - RANDOM_LOW) * uniforms
+    # Month ordinals count from 1970-01, so (ordinal % 12) + 1 is the calendar month
+    month = np.asarray(periods) % 12 + 1
+    return monthly_production(month, base_production, draws[:, 0]), draws
+
+
+def monthly_production(month, base_production, variation):
+    """Production (tonnes steel/month) for calendar months and production draws"""
+    # Seasonal factors (winter = higher energy use)
+    seasonal_factor = 1.0 + 0.15 * np.cos(2 * np.pi * (month - 1) / 12)
+
+    # Production volume (tonnes steel/month, with realistic variation)
+    return base_production * (0.95 + variation) * seasonal_factor
+
+
+def activity_frame(dates, production, draws):
+    """Assemble the activity columns consumed by calculate_emissions"""
+    return pd.DataFrame({
+        'Date': dates,
+        'Production_Tonnes': production,
+        'Blast_Furnace_Variation': draws[:, 1],
+        'Auxiliary_Variation': draws[:, 2],
+        'Heating_Variation': draws[:, 3],
+    })
+
+
+def generate_activity_data(dates, base_production=BASE_PRODUCTION,
+                           facility_id=REFERENCE_FACILITY, seed=SEED):
+    """
+    Draw monthly activity data as columnar arrays
+
+    Returns a DataFrame with one row per date (month start) holding the
+    production volume and the random terms that drive the emission
+    calculations.
+    """
+    dates = pd.DatetimeIndex(dates)
+    periods = dates.year.to_numpy() * 12 + dates.month.to_numpy() - 1 - 1970 * 12
+    production, draws = draw_activity(periods, base_production, facility_id, seed)
+    return activity_frame(dates, production, draws)
+
+
+def calculate_emissions(activity, params=None, return_state=False, rounded=True):
+    """
+    Compute Scope 1/2/3 emissions, quality splits and intensity for every
+    row of an activity frame by evaluating the calculation graph over whole
+    columns
+
+    params holds the per-row factors from emission_parameters(); by default
+    the registry factors for the Luleå BF-BOF reference site. Rows below
+    monthly resolution are left unrounded (rounded=False). With
+    return_state=True the unrounded graph state is returned as well, for
+    later restatement with recalculate().
+    """
+    if params is None:
+        params = emission_parameters(activity['Date'])
+
+    inputs = calculation_inputs(activity, params)
+    values = evaluate_graph(inputs)
+    df = emissions_frame(activity['Date'], output_values(inputs, values, rounded=rounded))
+    if return_state:
+        return df, {'inputs': inputs, 'values': values}
+    return df
+
+
+def emissions_frame(dates, columns):
+    """Emissions_Data frame: date labels followed by the published columns"""
+    dates = pd.DatetimeIndex(dates)
+
+    # Format date labels once per distinct month rather than once per row
+    month_index = dates.year.to_numpy() * 12 + dates.month.to_numpy() - 1
+    unique_months, inverse = np.unique(month_index, return_inverse=True)
+    unique_dates = pd.to_datetime({'year': unique_months // 12,
+                                   'month': unique_months % 12 + 1, 'day': 1})
+    date_labels = unique_dates.dt.strftime('%Y-%m').to_numpy()[inverse]
+    month_names = unique_dates.dt.month_name().to_numpy()[inverse]
+
+    return pd.DataFrame({
+        'Date': date_labels,
+        'Year': dates.year.astype(np.int64),
+        'Month': dates.month.astype(np.int64),
+        'Month_Name': month_names,
+        **columns,
+        'Reporting_Standard': 'GHG Protocol + ESRS E1',
+    })
+
+
+def spread_months(first, last, production, draws, freq):
+    """
+    Spread monthly activity for month ordinals first..last over daily or
+    hourly periods; returns (timestamps, production, draws, share of month)
+    """
+    timestamps, position, share = expand_months(first, last, freq)
+    return timestamps, production[position] * share, draws[position], share
+
+
+def generate_emissions_data(n_months=24, seed=SEED, registry=None, return_state=False,
+                            freq='monthly'):
+    """
+    Generate emissions data for Swedish steel company (24 months by default)
+
+    Rows are calendar months, or days/hours with freq='daily'/'hourly'
+    (compact dtypes, plus a Timestamp column). With return_state=True also
+    returns the calculation state for restate_emissions().
+    """
 
     # Company profile
     company_info = {
@@ -31,238 +327,574 @@ def generate_emissions_data():
         'production_capacity': '500,000 tonnes steel/year'
     }
 
-    # Generate monthly dates
-    start_date = datetime(2023, 1, 1)
-    dates = [start_date + timedelta(days=30*i) for i in range(24)]
-
-    # Initialize data lists
-    data = []
-
-    for i, date in enumerate(dates):
-        month = date.month
-
-        # Seasonal factors (winter = higher energy use)
-        seasonal_factor = 1.0 + 0.15 * np.cos(2 * np.pi * (month - 1) / 12)
-
-        # Production volume (tonnes steel/month, with realistic variation)
-        base_production = 41667  # ~500k tonnes/year
-        production = base_production * (0.95 + np.random.uniform(-0.08, 0.08)) * seasonal_factor
-
-        # =====================================
-        # SCOPE 1: Direct emissions (tCO2e)
-        # =====================================
-        # Blast furnace operations: ~0.5 tCO2/tonne steel (Swedish benchmark)
-        scope1_base = 20000  # tCO2e/month baseline
-        scope1_blast_furnace = production * 0.48 * (0.98 + np.random.uniform(-0.05, 0.05))
-        scope1_auxiliary = 800 + np.random.uniform(-100, 100)  # Auxiliary combustion
-        scope1_total = scope1_blast_furnace + scope1_auxiliary
-
-        # =====================================
-        # SCOPE 2: Indirect emissions (tCO2e)
-        # =====================================
-        # Swedish electricity grid: ~13 g CO2/kWh (highly renewable)
-        electricity_kwh = production * 650  # kWh per tonne steel
-        scope2_location = electricity_kwh * 0.000013  # Location-based (grid average)
-        scope2_market = electricity_kwh * 0.000008    # Market-based (renewable contracts)
-
-        # District heating (Swedish low-carbon heat)
-        heating_mwh = 2500 + np.random.uniform(-300, 300)
-        scope2_heating = heating_mwh * 0.015  # tCO2e (biofuel-based district heating)
-
-        scope2_total = scope2_location + scope2_heating
-
-        # =====================================
-        # SCOPE 3: Value chain emissions (tCO2e)
-        # =====================================
-        # Category 1: Purchased goods (iron ore, coal, limestone)
-        iron_ore_tonnes = production * 1.6
-        scope3_cat1_ore = iron_ore_tonnes * 0.05  # 0.05 tCO2e per tonne ore
-
-        coal_tonnes = production * 0.4
-        scope3_cat1_coal = coal_tonnes * 0.15  # 0.15 tCO2e per tonne coal
-
-        limestone_tonnes = production * 0.2
-        scope3_cat1_limestone = limestone_tonnes * 0.02
-
-        scope3_cat1 = scope3_cat1_ore + scope3_cat1_coal + scope3_cat1_limestone
-
-        # Category 4: Upstream transportation
-        transport_tkm = (iron_ore_tonnes + coal_tonnes) * 500  # tonne-kilometers
-        scope3_cat4 = transport_tkm * 0.00012  # 0.12 kg CO2e per tkm (rail/ship)
-
-        # Category 9: Downstream transportation
-        scope3_cat9 = production * 0.05  # Distribution to customers
-
-        # Category 12: End-of-life treatment
-        scope3_cat12 = production * 0.02  # Steel recycling/disposal
-
-        scope3_total = scope3_cat1 + scope3_cat4 + scope3_cat9 + scope3_cat12
-
-        # =====================================
-        # Data Quality Assessment (ESRS E1)
-        # =====================================
-        # Scope 1: 70% measured, 25% calculated, 5% estimated
-        scope1_measured = scope1_total * 0.70
-        scope1_calculated = scope1_total * 0.25
-        scope1_estimated = scope1_total * 0.05
-
-        # Scope 2: 90% measured, 10% calculated
-        scope2_measured = scope2_total * 0.90
-        scope2_calculated = scope2_total * 0.10
-        scope2_estimated = 0
-
-        # Scope 3: 15% measured, 25% calculated, 60% estimated
-        scope3_measured = scope3_total * 0.15
-        scope3_calculated = scope3_total * 0.25
-        scope3_estimated = scope3_total * 0.60
-
-        # Total emissions
-        total_emissions = scope1_total + scope2_total + scope3_total
-
-        # Emissions intensity
-        intensity = total_emissions / production  # tCO2e per tonne steel
-
-        # Append row
-        data.append({
-            'Date': date.strftime('%Y-%m'),
-            'Year': date.year,
-            'Month': date.month,
-            'Month_Name': date.strftime('%B'),
-
-            # Production
-            'Production_Tonnes': round(production, 2),
-
-            # Scope 1
-            'Scope1_Total_tCO2e': round(scope1_total, 2),
-            'Scope1_Blast_Furnace': round(scope1_blast_furnace, 2),
-            'Scope1_Auxiliary': round(scope1_auxiliary, 2),
-            'Scope1_Measured': round(scope1_measured, 2),
-            'Scope1_Calculated': round(scope1_calculated, 2),
-            'Scope1_Estimated': round(scope1_estimated, 2),
-
-            # Scope 2
-            'Scope2_Total_tCO2e': round(scope2_total, 2),
-            'Scope2_Electricity_kWh': round(electricity_kwh, 0),
-            'Scope2_Location_Based': round(scope2_location, 2),
-            'Scope2_Market_Based': round(scope2_market, 2),
-            'Scope2_Heating': round(scope2_heating, 2),
-            'Scope2_Measured': round(scope2_measured, 2),
-            'Scope2_Calculated': round(scope2_calculated, 2),
-            'Scope2_Estimated': round(scope2_estimated, 2),
-
-            # Scope 3
-            'Scope3_Total_tCO2e': round(scope3_total, 2),
-            'Scope3_Cat1_Purchased_Goods': round(scope3_cat1, 2),
-            'Scope3_Cat4_Upstream_Transport': round(scope3_cat4, 2),
-            'Scope3_Cat9_Downstream_Transport': round(scope3_cat9, 2),
-            'Scope3_Cat12_End_of_Life': round(scope3_cat12, 2),
-            'Scope3_Measured': round(scope3_measured, 2),
-            'Scope3_Calculated': round(scope3_calculated, 2),
-            'Scope3_Estimated': round(scope3_estimated, 2),
-
-            # Totals & Intensity
-            'Total_Emissions_tCO2e': round(total_emissions, 2),
-            'Emissions_Intensity_tCO2e_per_tonne': round(intensity, 3),
-
-            # Metadata
-            'Data_Quality_Score': round(
-                (scope1_measured + scope2_measured + scope3_measured) / total_emissions * 100, 1
-            ),
-            'Reporting_Standard': 'GHG Protocol + ESRS E1',
-        })
-
-    return pd.DataFrame(data), company_info
-
-
-def create_excel_report(df, company_info, output_path):
-    """Create formatted Excel workbook with multiple sheets"""
+    # Calendar month starts from January 2023
+    first = pd.Period(REFERENCE_START, freq='M').ordinal
+    last = first + n_months - 1
+    activity = generate_activity_data(month_starts(first, last), seed=seed)
+    share = 1.0
+    if freq != 'monthly':
+        draws = activity[['Blast_Furnace_Variation', 'Auxiliary_Variation', 'Heating_Variation']]
+        draws = np.column_stack([np.zeros(n_months), draws.to_numpy()])
+        timestamps, production, draws, share = spread_months(
+            first, last, activity['Production_Tonnes'].to_numpy(), draws, freq)
+        activity = activity_frame(timestamps, production, draws)
+
+    sites = reference_sites(len(activity))
+    params = resolve_parameters(activity['Date'], sites, registry)
+    params['size_scale'] = params['size_scale'] * share
+    df, state = calculate_emissions(activity, params, return_state=True,
+                                    rounded=freq == 'monthly')
+    state['context'] = sites.assign(Date=activity['Date'])
+
+    if freq != 'monthly':
+        df.insert(0, 'Timestamp', activity['Date'])
+        compact_dtypes(df)
+    if return_state:
+        return df, company_info, state
+    return df, company_info
+
+
+def load_facility_roster(path):
+    """Load a facility roster CSV (one row per site, see ROSTER_COLUMNS)"""
+    roster = pd.read_csv(path, dtype={'facility_id': str, 'entity': str})
+    missing = [col for col in ROSTER_COLUMNS if col not in roster.columns]
+    if missing:
+        raise ValueError(f"Facility roster is missing columns: {missing}")
+
+    unknown = set(roster['process_route']) - set(PROCESS_ROUTES)
+    if unknown:
+        raise ValueError(f"Unknown process route(s): {sorted(unknown)}")
+
+    for col in ROSTER_OVERRIDES:
+        roster[col] = roster[col].astype(np.float64) if col in roster.columns else np.nan
+    return roster
+
+
+def _generate_shard(facilities, start_date, end_date, factor_source=(None, None),
+                    return_state=False, freq='monthly', certificates=None):
+    """
+    Generate emissions for a list of facility records (worker task)
+
+    factor_source is the (path, vintage) of the emission factor registry,
+    loaded once per worker process. With energy certificates given, the
+    market-based factor comes from hourly certificate matching, replayed
+    from the start of the GOs valid at the window start (earlier months are
+    regenerated for it and dropped). With return_state=True returns (df,
+    calculation state).
+    """
+    window_start = pd.Timestamp(start_date).to_period('M').ordinal
+    window_end = pd.Timestamp(end_date).to_period('M').ordinal
+
+    periods, productions, draws, shares, facility_rows, in_window = [], [], [], [], [], []
+    for facility in facilities:
+        # Operating months within the reporting window
+        opened = pd.Timestamp(facility['start_date']).to_period('M').ordinal
+        first = max(window_start, opened)
+        last = window_end
+        if pd.notna(facility['end_date']):
+            last = min(last, pd.Timestamp(facility['end_date']).to_period('M').ordinal)
+        if last < first:
+            continue
+
+        # GO volume is used chronologically: earlier months decide what is left
+        lead = first
+        if certificates is not None:
+            replay = matching_start(certificates, facility['facility_id'],
+                                    pd.Period(ordinal=first, freq='M').to_timestamp())
+            lead = max(replay.to_period('M').ordinal, opened)
+
+        period = np.arange(lead, last + 1)
+        production, facility_draws = draw_activity(
+            period, facility['capacity_tonnes'] / 12, facility['facility_id'])
+        months = period
+        if freq != 'monthly':
+            period, production, facility_draws, share = spread_months(
+                lead, last, production, facility_draws, freq)
+            months = pd.DatetimeIndex(period).to_period('M').asi8
+            shares.append(share)
+
+        in_window.append(months >= first)
+        periods.append(period)
+        productions.append(production)
+        draws.append(facility_draws)
+        facility_rows.append(facility)
+
+    if not facility_rows:
+        return None
+
+    # Broadcast per-facility attributes to per-row arrays
+    counts = [len(p) for p in periods]
+    sites = (pd.DataFrame(facility_rows).loc[np.repeat(np.arange(len(counts)), counts)]
+             .reset_index(drop=True))
+    if freq == 'monthly':
+        dates = pd.PeriodIndex.from_ordinals(np.concatenate(periods), freq='M').to_timestamp()
+    else:
+        dates = pd.DatetimeIndex(np.concatenate(periods))
+    activity = activity_frame(dates, np.concatenate(productions), np.concatenate(draws))
+
+    registry = factor_registry(*factor_source)
+    params = resolve_parameters(dates, sites, registry)
+    if certificates is not None:
+        # Hourly PPA/GO matching with residual mix replaces the flat market
+        # factor; kept as a site override so restatements leave it in place
+        kwh = activity['Production_Tonnes'].to_numpy() * params['kwh_per_tonne']
+        params['market_factor'] = market_based_factors(
+            sites['facility_id'].to_numpy(), sites['country'].to_numpy(), dates, kwh, freq,
+            certificates, registry)
+        sites['market_factor'] = params['market_factor']
+    if shares:
+        # Fixed monthly baselines (auxiliary combustion, heating) follow the load profile
+        params['size_scale'] = params['size_scale'] * np.concatenate(shares)
+    keep = np.concatenate(in_window)
+    if not keep.all():
+        # Drop the months replayed for GO matching
+        dates = dates[keep]
+        sites = sites[keep].reset_index(drop=True)
+        activity = activity[keep].reset_index(drop=True)
+        params = {name: value[keep] if np.ndim(value) else value for name, value in params.items()}
+    df, state = calculate_emissions(activity, params, return_state=True,
+                                    rounded=freq == 'monthly')
+    if freq != 'monthly':
+        df.insert(0, 'Timestamp', dates)
+    df.insert(0, 'Facility_ID', sites['facility_id'].to_numpy())
+    df.insert(0, 'Entity', sites['entity'].to_numpy())
+    if freq != 'monthly':
+        compact_dtypes(df)
+    if return_state:
+        state['context'] = sites[SITE_COLUMNS].assign(Date=dates)
+        return df, state
+    return df
+
+
+def iter_portfolio_batches(roster, start_date='2023-01-01', end_date='2024-12-01',
+                           max_workers=None, factor_source=(None, None), return_state=False,
+                           freq='monthly', certificates=None):
+    """
+    Yield emissions row-batches (one per facility shard) in roster order
+
+    Facilities are sharded across a process pool; each facility, month and
+    random term draws from its own seeded stream, so the output is identical
+    whatever the worker count or reporting window. At most two shards per
+    worker are in flight, keeping memory bounded when batches are streamed
+    straight to disk. With return_state=True each batch is a (df,
+    calculation state) pair.
+    """
+    facilities = roster.to_dict('records')
+    shard_size = FREQUENCIES[freq]['shard_size']
+    shards = [facilities[i:i + shard_size] for i in range(0, len(facilities), shard_size)]
+    task_args = (start_date, end_date, factor_source, return_state, freq, certificates)
+
+    if max_workers == 1 or len(shards) <= 1:
+        for shard in shards:
+            batch = _generate_shard(shard, *task_args)
+            if batch is not None:
+                yield batch
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        window = 2 * (max_workers or os.cpu_count() or 1)
+        pending = [executor.submit(_generate_shard, shard, *task_args)
+                   for shard in shards[:window]]
+        for next_shard in shards[window:] + [None] * window:
+            if not pending:
+                break
+            batch = pending.pop(0).result()
+            if next_shard is not None:
+                pending.append(executor.submit(_generate_shard, next_shard, *task_args))
+            if batch is not None:
+                yield batch
+
+
+def operating_facilities(roster, start_date, end_date):
+    """Mask of roster rows operating in at least one month of the window"""
+    opened = pd.to_datetime(roster['start_date']).dt.to_period('M')
+    closed = pd.to_datetime(roster['end_date']).dt.to_period('M')
+    return ((opened <= pd.Timestamp(end_date).to_period('M'))
+            & ~(closed < pd.Timestamp(start_date).to_period('M'))).to_numpy()
+
+
+def portfolio_company_info(roster, start_date, end_date):
+    """Company_Info sheet contents for a multi-facility roster"""
+    return {
+        'company_name': ', '.join(roster['entity'].unique()),
+        'industry': 'Steel Manufacturing (NACE C24.10)',
+        'location': f"{roster['facility_id'].nunique()} facilities",
+        'reporting_period': f"{pd.Timestamp(start_date):%Y-%m} to {pd.Timestamp(end_date):%Y-%m}",
+        'production_capacity': f"{roster['capacity_tonnes'].sum():,.0f} tonnes steel/year",
+    }
+
+
+def generate_portfolio_data(roster, start_date='2023-01-01', end_date='2024-12-01',
+                            max_workers=None, factor_source=(None, None), return_state=False,
+                            freq='monthly', certificates=None):
+    """
+    Generate emissions for every facility in a roster as one frame
+
+    With return_state=True also returns the calculation state for
+    restate_emissions(). Raises ValueError when no facility operates in
+    the window.
+    """
+    company_info = portfolio_company_info(roster, start_date, end_date)
+    batches = list(iter_portfolio_batches(roster, start_date, end_date, max_workers,
+                                          factor_source, return_state, freq, certificates))
+    if not batches:
+        raise ValueError(f"No roster facility operates in {company_info['reporting_period']}")
+    if not return_state:
+        return _concat_batches(batches), company_info
+
+    states = [state for _, state in batches]
+    state = {
+        part: {name: np.concatenate([s[part][name] for s in states]) for name in states[0][part]}
+        for part in ['inputs', 'values']
+    }
+    state['context'] = pd.concat([s['context'] for s in states], ignore_index=True)
+    return _concat_batches([df for df, _ in batches]), company_info, state
+
+
+def _concat_batches(batches):
+    """Concatenate row-batches, keeping categorical columns categorical"""
+    return pd.concat(unify_categories(batches), ignore_index=True)
+
+
+def restate_emissions(df, state, registry):
+    """
+    Restate a run under another emission factor registry (e.g. a new vintage)
+
+    Only the rows whose factors change, and only the calculation nodes
+    downstream of those factors, are recomputed. Returns the restated frame
+    and the per-row restatement deltas keyed by ROW_KEYS.
+    """
+    context = state['context']
+    params = resolve_parameters(context['Date'], context, registry)
+    restated, dirty = recalculate(state, {name: params[name] for name in FACTOR_PARAMETERS})
+
+    rows = dirty['rows']
+    changed = set(dirty['nodes']) | set(dirty['inputs'])
+    df = df.copy()
+    restated_values = output_values(restated['inputs'], restated['values'], rows,
+                                    rounded='Timestamp' not in df.columns)
+    for column, values in restated_values.items():
+        if column in changed:
+            df.iloc[rows, df.columns.get_loc(column)] = values.astype(df[column].dtype)
+
+    deltas = restatement_deltas(state, restated, dirty)
+    keys = [col for col in ROW_KEYS if col in df.columns]
+    deltas = pd.concat([df[keys].iloc[deltas['Row'].to_numpy()].reset_index(drop=True),
+                        deltas.drop(columns='Row')], axis=1)
+    return df, deltas
+
+
+def scenario_baseline(roster=None, first_year=2025, last_year=2050, registry=None):
+    """
+    Expected monthly calculation inputs for scenario projections
+
+    Every site of the roster (default: the Luleå reference site) is
+    evaluated under each process route, with random terms at the midpoint
+    of their ranges and the registry factors valid in each month. Returns
+    {'dates', 'routes' (per site), 'inputs': {route: {input: (sites, months)}}};
+    months outside a site's operating dates have zero production.
+    """
+    if roster is None:
+        sites = reference_sites(1).assign(start_date=f'{REFERENCE_START}-01', end_date=np.nan,
+                                          base_production=BASE_PRODUCTION)
+    else:
+        sites = roster.assign(base_production=roster['capacity_tonnes'] / 12)
+
+    first = pd.Period(f'{first_year}-01', freq='M').ordinal
+    dates = month_starts(first, pd.Period(f'{last_year}-12', freq='M').ordinal)
+    n_sites, n_months = len(sites), len(dates)
+    rows = sites.loc[np.repeat(sites.index, n_months)].reset_index(drop=True)
+    row_dates = pd.DatetimeIndex(np.tile(dates, n_sites))
+
+    # Expected activity: production and variation terms at their mean draws
+    draws = np.tile((RANDOM_LOW + RANDOM_HIGH) / 2, (len(rows), 1))
+    production = monthly_production(row_dates.month.to_numpy(),
+                                    rows['base_production'].to_numpy(), draws[:, 0])
+    operating = ((row_dates >= pd.to_datetime(rows['start_date']).dt.to_period('M').dt.to_timestamp())
+                 & ~(row_dates > pd.to_datetime(rows['end_date'])))
+    activity = activity_frame(row_dates, np.where(operating, production, 0.0), draws)
+
+    inputs = {}
+    for route in PROCESS_ROUTES:
+        params = resolve_parameters(row_dates, rows.assign(process_route=route), registry)
+        inputs[route] = {name: array.reshape(n_sites, n_months)
+                         for name, array in calculation_inputs(activity, params).items()}
+    return {'dates': dates, 'routes': sites['process_route'].to_numpy(), 'inputs': inputs}
+
+
+def create_excel_report(df, company_info, output_path, rollup=None, restatement=None,
+                        uncertainty=None, scenarios=None):
+    """
+    Create formatted Excel workbook with multiple sheets
+
+    The Annual_Summary and Data_Quality sheets are read from `rollup` when
+    given (e.g. the persisted store covering the full history), otherwise
+    rolled up from df. Per-row restatement deltas, if given, are written to
+    a Restatement sheet, Monte Carlo percentiles to an Uncertainty sheet and
+    a scenario cube's target pathways to a Scenarios sheet.
+    """
+    if rollup is None:
+        rollup = build_rollup(df, company_info['company_name'])
+
+    if len(df) > EXCEL_MAX_ROWS:
+        raise ValueError(f"{len(df):,} rows exceed Excel's {EXCEL_MAX_ROWS:,}-row sheet limit; "
+                         "use --format parquet or arrow instead")
+    df = widen_dtypes(df)
+
+    def write_sheet(writer, table, sheet_name, **options):
+        with span('write_sheet', sheet=sheet_name, rows=len(table)):
+            table.to_excel(writer, sheet_name=sheet_name, **options)
 
     with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
         # Sheet 1: Main emissions data
-        df.to_excel(writer, sheet_name='Emissions_Data', index=False)
+        write_sheet(writer, df, 'Emissions_Data', index=False)
 
         # Sheet 2: Company information
         company_df = pd.DataFrame([company_info]).T
         company_df.columns = ['Value']
-        company_df.to_excel(writer, sheet_name='Company_Info')
-
-        # Sheet 3: Monthly summary
-        summary = df.groupby('Year').agg({
-            'Production_Tonnes': 'sum',
-            'Scope1_Total_tCO2e': 'sum',
-            'Scope2_Total_tCO2e': 'sum',
-            'Scope3_Total_tCO2e': 'sum',
-            'Total_Emissions_tCO2e': 'sum',
-            'Emissions_Intensity_tCO2e_per_tonne': 'mean'
-        }).round(2)
-        summary.to_excel(writer, sheet_name='Annual_Summary')
-
-        # Sheet 4: Data quality breakdown
-        quality_data = []
-        for scope in [1, 2, 3]:
-            measured = df[f'Scope{scope}_Measured'].sum()
-            calculated = df[f'Scope{scope}_Calculated'].sum()
-            estimated = df[f'Scope{scope}_Estimated'].sum()
-            total = measured + calculated + estimated
-
-            quality_data.append({
-                'Scope': f'Scope {scope}',
-                'Measured_tCO2e': round(measured, 2),
-                'Measured_Percent': round(measured/total*100, 1),
-                'Calculated_tCO2e': round(calculated, 2),
-                'Calculated_Percent': round(calculated/total*100, 1),
-                'Estimated_tCO2e': round(estimated, 2),
-                'Estimated_Percent': round(estimated/total*100, 1),
-                'Total_tCO2e': round(total, 2)
-            })
-
-        quality_df = pd.DataFrame(quality_data)
-        quality_df.to_excel(writer, sheet_name='Data_Quality', index=False)
+        write_sheet(writer, company_df, 'Company_Info')
+
+        # Sheets 3-4: Annual summary and data quality breakdown
+        write_sheet(writer, annual_summary_table(rollup), 'Annual_Summary')
+        write_sheet(writer, data_quality_table(rollup), 'Data_Quality', index=False)
+
+        # Sheet 5: Restatement of previously reported values
+        if restatement is not None:
+            write_sheet(writer, restatement, 'Restatement', index=False)
+
+        # Sheet 6: Monte Carlo uncertainty ranges per scope and period
+        if uncertainty is not None:
+            write_sheet(writer, uncertainty, 'Uncertainty', index=False)
+
+        # Sheet 7: Decarbonisation scenarios against the intensity targets
+        if scenarios is not None:
+            write_sheet(writer, pathway_summary(scenarios), 'Scenarios', index=False)
 
     print(f"\n[OK] Excel report created: {output_path}")
 
 
 def main():
     """Main execution function"""
+    parser = argparse.ArgumentParser(description='Generate synthetic CSRD emissions data')
+    parser.add_argument('--roster', help='Facility roster CSV for multi-site generation')
+    parser.add_argument('--start', default='2023-01-01', help='First reporting month (roster mode)')
+    parser.add_argument('--end', default='2024-12-01', help='Last reporting month (roster mode)')
+    parser.add_argument('--freq', choices=list(FREQUENCIES), default='monthly',
+                        help='Row resolution (daily/hourly use compact float32/categorical dtypes)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes for roster mode (default: all cores)')
+    parser.add_argument('--format', choices=['excel'] + list(OUTPUT_WRITERS), default='excel',
+                        help='Output format (parquet/arrow/star stream in batches, no row limit; '
+                             'star = Power BI star schema)')
+    parser.add_argument('--output', help='Output file (excel) or directory (parquet/arrow/star)')
+    parser.add_argument('--rollup', help='Rollup store directory (default: data/rollup)')
+    parser.add_argument('--append', action='store_true',
+                        help='Append to an existing Parquet dataset and rollup store '
+                             '(e.g. one new month at month-end close)')
+    parser.add_argument('--certificates',
+                        help='Energy certificate CSV (PPAs, GOs) for hourly market-based '
+                             'Scope 2 matching (roster mode)')
+    parser.add_argument('--factors', help='Emission factor registry CSV '
+                                          '(default: data/emission_factors.csv)')
+    parser.add_argument('--vintage', help='Factor vintage to apply (default: newest per factor)')
+    parser.add_argument('--restate-from', metavar='VINTAGE',
+                        help='Restate figures reported with this factor vintage and add a '
+                             'Restatement sheet with the per-row deltas (excel only)')
+    parser.add_argument('--uncertainty', type=int, metavar='SAMPLES',
+                        help='Monte Carlo samples for an Uncertainty sheet with P5/P50/P95 '
+                             'per scope and period (excel only, e.g. 10000)')
+    parser.add_argument('--memory-mb', type=int, default=DEFAULT_MEMORY_MB,
+                        help='Memory budget per process for the Monte Carlo sample arrays')
+    parser.add_argument('--scenarios', type=int, nargs='?', const=2050, metavar='LAST_YEAR',
+                        help='Project the scenario grid from the year after the reporting '
+                             'period to LAST_YEAR (default 2050); saves data/scenario_cube.npz '
+                             'and adds a Scenarios sheet (excel)')
+    parser.add_argument('--trace', metavar='PATH',
+                        help='Record stage spans and write them as a Chrome trace JSON file '
+                             '(chrome://tracing, Perfetto), with a summary table')
+    parser.add_argument('--profile', metavar='STAGE',
+                        help='Run cProfile and tracemalloc around one stage (e.g. generate, '
+                             'write_sheet); writes .prof/.txt files next to the trace')
+    args = parser.parse_args()
+    if args.append and args.format != 'parquet':
+        parser.error('--append requires --format parquet')
+    if args.restate_from and args.format != 'excel':
+        parser.error('--restate-from requires --format excel')
+    if args.uncertainty and args.format != 'excel':
+        parser.error('--uncertainty requires --format excel')
+    if args.uncertainty and args.restate_from:
+        parser.error('--uncertainty cannot be combined with --restate-from')
+    if args.certificates and not args.roster:
+        parser.error('--certificates requires --roster')
+    if args.vintage or args.restate_from:
+        vintages = registry_vintages(args.factors)
+        for option, vintage in [('--vintage', args.vintage), ('--restate-from', args.restate_from)]:
+            if vintage and vintage not in vintages:
+                parser.error(f"{option}: no vintage {vintage} in the factor registry "
+                             f"(published: {', '.join(vintages)})")
+
+    if args.trace or args.profile:
+        tracing.enable(args.profile, os.path.dirname(os.path.abspath(args.trace or 'profile')))
+
     print("=" * 60)
     print("CSRD Climate Data Generator - Norrland Stål AB")
     print("=" * 60)
 
-    # Generate data
-    print("\nGenerating synthetic emissions data...")
-    df, company_info = generate_emissions_data()
-
-    # Display summary statistics
-    print("\n" + "=" * 60)
-    print("SUMMARY STATISTICS (24 months)")
-    print("=" * 60)
-    print(f"\nCompany: {company_info['company_name']}")
-    print(f"Location: {company_info['location']}")
-    print(f"Industry: {company_info['industry']}")
-
-    print(f"\nTotal Production: {df['Production_Tonnes'].sum():,.0f} tonnes")
-    print(f"\nScope 1 Emissions: {df['Scope1_Total_tCO2e'].sum():,.0f} tCO2e")
-    print(f"Scope 2 Emissions: {df['Scope2_Total_tCO2e'].sum():,.0f} tCO2e")
-    print(f"Scope 3 Emissions: {df['Scope3_Total_tCO2e'].sum():,.0f} tCO2e")
-    print(f"Total Emissions: {df['Total_Emissions_tCO2e'].sum():,.0f} tCO2e")
-
-    print(f"\nAverage Emissions Intensity: {df['Emissions_Intensity_tCO2e_per_tonne'].mean():.3f} tCO2e/tonne")
-    print(f"Data Quality Score: {df['Data_Quality_Score'].mean():.1f}%")
-
     # Create output directory if needed
     output_dir = os.path.join(os.path.dirname(__file__), '..', 'data')
     os.makedirs(output_dir, exist_ok=True)
+    rollup_dir = args.rollup or os.path.join(output_dir, 'rollup')
+    with span('load_rollup'):
+        store = load_rollup(rollup_dir) if args.append else None
+    factor_source = (args.factors, args.vintage)
+    with span('load_factors') as stage:
+        registry = factor_registry(*factor_source)
+        stage['rows'] = len(registry['table'])
+    print(f"[OK] Emission factors: {len(registry['table'])} entries"
+          + (f" (vintage {args.vintage})" if args.vintage else ''))
 
-    # Save to Excel
-    output_path = os.path.join(output_dir, 'norrland_stal_emissions.xlsx')
-    create_excel_report(df, company_info, output_path)
+    # Generate data
+    print("\nGenerating synthetic emissions data...")
+    if args.roster:
+        with span('load_roster') as stage:
+            roster = load_facility_roster(args.roster)
+            stage['rows'] = len(roster)
+        print(f"[OK] Loaded roster with {len(roster)} facilities")
+        if not operating_facilities(roster, args.start, args.end).any():
+            print(f"\n[ERROR] No roster facility operates in "
+                  f"{pd.Timestamp(args.start):%Y-%m} to {pd.Timestamp(args.end):%Y-%m}. Exiting.")
+            return
+    with span('load_certificates'):
+        certificates = load_certificates(args.certificates) if args.certificates else None
+    if certificates is not None:
+        print(f"[OK] Loaded {len(certificates)} energy certificates")
+
+    cube = None
+    if args.scenarios:
+        # Scenario grid from the year after the reporting period (cached per scenario)
+        last_reported = pd.Timestamp(args.end) if args.roster else pd.Period(REFERENCE_START, freq='M') + 23
+        with span('scenarios') as stage:
+            baseline = scenario_baseline(roster if args.roster else None, last_reported.year + 1,
+                                         args.scenarios, registry)
+            cube = run_scenarios(baseline)
+            cube_path = save_cube(cube)
+            stage.update(rows=len(cube['scenarios']), bytes=os.path.getsize(cube_path))
+        print(f"[OK] Scenario cube: {len(cube['scenarios'])} scenarios x {len(cube['years'])} years "
+              f"({SCENARIO_CACHE_STATS['hits']} cached) -> {cube_path}")
+
+    if args.format in OUTPUT_WRITERS:
+        # Stream row-batches straight to disk without materialising the full frame
+        if args.roster:
+            batches = iter_portfolio_batches(roster, args.start, args.end, max_workers=args.workers,
+                                             factor_source=factor_source, freq=args.freq,
+                                             certificates=certificates)
+            company_info = portfolio_company_info(roster, args.start, args.end)
+        else:
+            with span('generate') as stage:
+                df, company_info = generate_emissions_data(registry=registry, freq=args.freq)
+                stage['rows'] = len(df)
+            batches = [df]
+
+        output_path = args.output or os.path.join(output_dir, f'emissions_{args.format}')
+        writer_options = {'append': True, 'store': store} if args.append else {}
+        with span(f'write_{args.format}') as stage:
+            # Generation is interleaved with writing; its spans nest inside this one
+            run_rollup = OUTPUT_WRITERS[args.format](traced_batches('generate_batch', batches),
+                                                     company_info, output_path, **writer_options)
+            stage.update(rows=int(run_rollup['periods']['Rows'].sum()),
+                         bytes=path_size(output_path))
+
+        summary = annual_summary_table(run_rollup)
+        print("\n" + "=" * 60)
+        print(f"SUMMARY STATISTICS ({int(run_rollup['periods']['Rows'].sum()):,} monthly rows)")
+        print("=" * 60)
+        print(f"\nTotal Production: {summary['Production_Tonnes'].sum():,.0f} tonnes")
+        print(f"Total Emissions: {summary['Total_Emissions_tCO2e'].sum():,.0f} tCO2e")
+    else:
+        restatement = None
+        with span('generate') as stage:
+            if args.restate_from:
+                # As originally reported, then restated under the selected registry
+                reported_source = (args.factors, args.restate_from)
+                if args.roster:
+                    df, company_info, state = generate_portfolio_data(
+                        roster, args.start, args.end, max_workers=args.workers,
+                        factor_source=reported_source, return_state=True, freq=args.freq,
+                        certificates=certificates)
+                else:
+                    df, company_info, state = generate_emissions_data(
+                        registry=factor_registry(*reported_source), return_state=True,
+                        freq=args.freq)
+                with span('restate', rows=len(df)):
+                    df, restatement = restate_emissions(df, state, registry)
+                restated_rows = restatement.drop_duplicates(
+                    [col for col in ROW_KEYS if col in restatement.columns])
+                print(f"[OK] Restated {len(restated_rows):,} of {len(df):,} rows "
+                      f"(vintage {args.restate_from} -> {args.vintage or 'latest'})")
+            elif args.roster:
+                df, company_info, state = generate_portfolio_data(
+                    roster, args.start, args.end, max_workers=args.workers,
+                    factor_source=factor_source, return_state=True, freq=args.freq,
+                    certificates=certificates)
+            else:
+                df, company_info, state = generate_emissions_data(registry=registry, return_state=True,
+                                                                  freq=args.freq)
+            stage['rows'] = len(df)
+
+        uncertainty = None
+        if args.uncertainty:
+            with span('uncertainty', rows=len(df), samples=args.uncertainty):
+                uncertainty = uncertainty_table(df, state, args.uncertainty,
+                                                memory_mb=args.memory_mb,
+                                                max_workers=args.workers)
+            print(f"[OK] Monte Carlo uncertainty: {args.uncertainty:,} samples per row")
+
+        # Display summary statistics
+        print("\n" + "=" * 60)
+        print(f"SUMMARY STATISTICS ({df['Date'].nunique()} months, {len(df):,} rows)")
+        print("=" * 60)
+        print(f"\nCompany: {company_info['company_name']}")
+        print(f"Location: {company_info['location']}")
+        print(f"Industry: {company_info['industry']}")
+
+        print(f"\nTotal Production: {df['Production_Tonnes'].sum():,.0f} tonnes")
+        print(f"\nScope 1 Emissions: {df['Scope1_Total_tCO2e'].sum():,.0f} tCO2e")
+        print(f"Scope 2 Emissions: {df['Scope2_Total_tCO2e'].sum():,.0f} tCO2e")
+        print(f"Scope 3 Emissions: {df['Scope3_Total_tCO2e'].sum():,.0f} tCO2e")
+        print(f"Total Emissions: {df['Total_Emissions_tCO2e'].sum():,.0f} tCO2e")
+
+        print(f"\nAverage Emissions Intensity: {df['Emissions_Intensity_tCO2e_per_tonne'].mean():.3f} tCO2e/tonne")
+        print(f"Data Quality Score: {df['Data_Quality_Score'].mean():.1f}%")
+
+        # Save to Excel
+        with span('aggregate', rows=len(df)):
+            run_rollup = build_rollup(df, company_info['company_name'])
+        output_path = args.output or os.path.join(output_dir, 'norrland_stal_emissions.xlsx')
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        with span('write_excel', rows=len(df)) as stage:
+            create_excel_report(df, company_info, output_path, rollup=run_rollup,
+                                restatement=restatement, uncertainty=uncertainty,
+                                scenarios=cube)
+            stage['bytes'] = path_size(output_path)
+
+    # Keep the rollup store in step for summary sheets and charts
+    with span('save_rollup') as stage:
+        store = update_rollup(store, run_rollup)
+        save_rollup(store, rollup_dir)
+        stage['bytes'] = path_size(rollup_dir)
+    print(f"[OK] Rollup store updated: {rollup_dir}")
+
+    if tracing.is_enabled():
+        tracing.print_summary()
+        if args.trace:
+            print(f"[OK] Chrome trace: {tracing.write_chrome_trace(args.trace)}")
 
     print("\n" + "=" * 60)
     print("[SUCCESS] Data generation complete!")
     print("=" * 60)
     print(f"\nOutput file: {output_path}")
     print("\nNext steps:")
-    print("1. Review data in Excel")
+    print("1. Review data in Excel (or load the Parquet/Arrow output)")
     print("2. Import to Power BI for visualization")
     print("3. Validate against ESRS E1 requirements")
 
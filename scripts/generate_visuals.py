@@ -8,24 +8,46 @@ Generates:
 1. Stacked bar chart - Monthly emissions by Scope
 2. Line chart - Emissions intensity trend with target
 3. Pie chart - Data quality distribution
+4. Fan chart - Decarbonisation pathways to 2050 (when a scenario cube exists)
+
+Charts can be rendered for the whole portfolio, per entity or per facility;
+jobs are fanned out over a process pool (Agg backend) with per-job DPI and
+format (PNG/SVG/WebP) and a low-DPI draft mode for previews.
+
+matplotlib and seaborn are imported on the first chart actually drawn, and
+the chart style is applied per chart (rc_context); pandas and the data
+modules are imported by the stages that load data. A re-run whose inputs,
+options and code are unchanged (see render_cache.run_fingerprint) returns
+without importing any of them.
 
 Author: Victor Ekblom
 Date: 2024
 """
 
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import argparse
+import functools
 import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
 from pathlib import Path
 
-# Set style
-sns.set_style("whitegrid")
-plt.rcParams['font.family'] = 'sans-serif'
-plt.rcParams['font.sans-serif'] = ['Arial', 'DejaVu Sans']
-plt.rcParams['figure.dpi'] = 300
-plt.rcParams['savefig.dpi'] = 300
-plt.rcParams['savefig.bbox'] = 'tight'
+# Only light modules at import time; pandas-based ones are imported where used
+from data_cache import cache_report, cached_sheet_columns, load_cached_sheet
+from render_cache import (code_version, data_digest, load_manifest, params_digest,
+                          render_key, run_fingerprint, save_manifest, up_to_date)
+import tracing
+from tracing import span
+
+# Chart style, on top of seaborn's whitegrid (applied per chart)
+CHART_RC = {
+    'font.family': 'sans-serif',
+    'font.sans-serif': ['Arial', 'DejaVu Sans'],
+    'figure.dpi': 300,
+    'savefig.dpi': 300,
+    'savefig.bbox': 'tight',
+}
 
 # Professional color palette
 COLORS = {
@@ -38,12 +60,82 @@ COLORS = {
     'estimated': '#EF5350'    # Light red
 }
 
+DEFAULT_SUBJECT = 'Norrland Stål AB'
+
+# Resolution used for --draft previews
+DRAFT_DPI = 72
+
+# Shared figure layout per chart type: size, axis labels and title stem
+CHART_TEMPLATES = {
+    'stacked': {
+        'figsize': (14, 6),
+        'xlabel': 'Month',
+        'ylabel': 'GHG Emissions (tCO₂e)',
+        'title': 'Monthly GHG Emissions by Scope',
+    },
+    'intensity': {
+        'figsize': (14, 6),
+        'xlabel': 'Month',
+        'ylabel': 'Emissions Intensity (tCO₂e per tonne steel)',
+        'title': 'Emissions Intensity Trend',
+    },
+    'quality': {
+        'figsize': (10, 8),
+        'title': 'Data Quality Distribution',
+    },
+    'pathways': {
+        'figsize': (14, 6),
+        'xlabel': 'Year',
+        'ylabel': 'Emissions Intensity (tCO₂e per tonne steel)',
+        'title': 'Decarbonisation Pathways',
+    },
+}
+
+
+def chart_columns(chart):
+    """
+    Emissions_Data columns a chart reads (loaded per chart from the cache);
+    the quality chart's are only needed when no rollup store covers the job
+    """
+    from long_format import source_columns
+    from rollup_store import INTENSITY_COLUMN, SUMMARY_SUM_COLUMNS
+    return {
+        'stacked': ['Date', 'Scope1_Total_tCO2e', 'Scope2_Total_tCO2e',
+                    'Scope3_Total_tCO2e', 'Total_Emissions_tCO2e'],
+        'intensity': ['Date', INTENSITY_COLUMN, 'Production_Tonnes', 'Total_Emissions_tCO2e'],
+        'quality': ['Year', 'Month'] + SUMMARY_SUM_COLUMNS + [INTENSITY_COLUMN] + source_columns(),
+    }[chart]
+
+
+CHART_FILES = {
+    'stacked': 'emissions_by_scope_stacked',
+    'intensity': 'emissions_intensity_trend',
+    'quality': 'data_quality_distribution',
+    'pathways': 'decarbonisation_pathways',
+}
+
+# Charts drawn from the scenario cube (portfolio only, skipped without a cube)
+SCENARIO_CHARTS = ['pathways']
 
-def load_data(file_path):
-    """Load emissions data from Excel file"""
+
+def load_data(file_path, columns=None, validate=True):
+    """
+    Load emissions data (optionally only some columns) via the columnar cache
+
+    With validate, the full sheet is checked against the schema (rejected if
+    it does not match) and the consistency rules (violations are reported).
+    """
+    from validation import check_schema, print_violations, validate_emissions
     try:
-        df = pd.read_excel(file_path, sheet_name='Emissions_Data')
-        print(f"[OK] Loaded {len(df)} rows of emissions data")
+        if validate:
+            df = load_cached_sheet(file_path, 'Emissions_Data')
+            with span('validate', rows=len(df)):
+                check_schema(df)
+                print_violations(validate_emissions(df), len(df))
+            df = df[columns] if columns else df
+        else:
+            df = load_cached_sheet(file_path, 'Emissions_Data', columns=columns)
+        print(f"[OK] Loaded {len(df)} rows x {len(df.columns)} columns of emissions data")
         return df
     except FileNotFoundError:
         print(f"[ERROR] File not found: {file_path}")
@@ -54,12 +146,70 @@ def load_data(file_path):
         return None
 
 
-def create_stacked_bar_chart(df, output_path):
+def pyplot():
+    """matplotlib.pyplot on the Agg backend, imported on first use"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def chart_rc():
+    """Chart style rcParams: seaborn's whitegrid plus CHART_RC (imports both libraries)"""
+    import seaborn as sns
+    pyplot()
+    return {**sns.axes_style('whitegrid'), **CHART_RC}
+
+
+def styled_chart(draw):
+    """Run a chart function inside the chart style, leaving global rcParams untouched"""
+    @functools.wraps(draw)
+    def styled(*args, **kwargs):
+        with pyplot().rc_context(chart_rc()):
+            return draw(*args, **kwargs)
+    return styled
+
+
+def new_chart(template, subject, dates=None):
+    """
+    Create a figure from a CHART_TEMPLATES entry
+
+    Applies the shared size, bold axis labels, title and (for time series)
+    every-other-month date ticks, so chart functions only draw their data.
+    """
+    spec = CHART_TEMPLATES[template]
+    fig, ax = pyplot().subplots(figsize=spec['figsize'])
+
+    if 'xlabel' in spec:
+        ax.set_xlabel(spec['xlabel'], fontsize=12, fontweight='bold')
+        ax.set_ylabel(spec['ylabel'], fontsize=12, fontweight='bold')
+        ax.set_title(f"{spec['title']} - {subject}", fontsize=14, fontweight='bold', pad=20)
+
+    if dates is not None:
+        x = range(len(dates))
+        ax.set_xticks(x[::2])  # Show every other month
+        ax.set_xticklabels(dates.iloc[::2], rotation=45, ha='right')
+
+    return fig, ax
+
+
+def save_chart(fig, output_path, dpi=300, draft=False):
+    """Save and close a figure; format follows the output file extension"""
+    if draft:
+        fig.savefig(output_path, dpi=min(dpi, DRAFT_DPI), bbox_inches=None)
+    else:
+        fig.savefig(output_path, dpi=dpi, bbox_inches='tight')
+    pyplot().close(fig)
+    print(f"[OK] Created: {output_path}")
+
+
+@styled_chart
+def create_stacked_bar_chart(df, output_path, dpi=300, draft=False, subject=DEFAULT_SUBJECT):
     """
     Chart 1: Monthly emissions by Scope (Stacked Bar Chart)
     Shows Scope 1, 2, 3 emissions over time
     """
-    fig, ax = plt.subplots(figsize=(14, 6))
+    fig, ax = new_chart('stacked', subject, df['Date'])
 
     # Prepare data
     x = range(len(df))
@@ -76,16 +226,6 @@ def create_stacked_bar_chart(df, output_path):
     ax.bar(x, scope3, width, bottom=scope1+scope2, label='Scope 3: Value Chain',
            color=COLORS['scope3'], alpha=0.9)
 
-    # Formatting
-    ax.set_xlabel('Month', fontsize=12, fontweight='bold')
-    ax.set_ylabel('GHG Emissions (tCO₂e)', fontsize=12, fontweight='bold')
-    ax.set_title('Monthly GHG Emissions by Scope - Norrland Stål AB',
-                 fontsize=14, fontweight='bold', pad=20)
-
-    # X-axis labels
-    ax.set_xticks(x[::2])  # Show every other month
-    ax.set_xticklabels(df['Date'].iloc[::2], rotation=45, ha='right')
-
     # Legend (reversed order to match visual stacking)
     handles, labels = ax.get_legend_handles_labels()
     ax.legend(handles[::-1], labels[::-1], loc='upper left', framealpha=0.95, fontsize=10)
@@ -95,27 +235,30 @@ def create_stacked_bar_chart(df, output_path):
     ax.set_axisbelow(True)
 
     # Format y-axis
-    ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'{x:,.0f}'))
+    ax.yaxis.set_major_formatter(pyplot().FuncFormatter(lambda x, p: f'{x:,.0f}'))
 
     # Add totals annotation
     total_emissions = df['Total_Emissions_tCO2e'].sum()
-    ax.text(0.98, 0.98, f'Total 24-month emissions: {total_emissions:,.0f} tCO₂e',
+    ax.text(0.98, 0.98, f'Total {len(df)}-month emissions: {total_emissions:,.0f} tCO₂e',
             transform=ax.transAxes, fontsize=9, verticalalignment='top',
             horizontalalignment='right', bbox=dict(boxstyle='round',
             facecolor='wheat', alpha=0.8))
 
-    plt.tight_layout()
-    plt.savefig(output_path, dpi=300, bbox_inches='tight')
-    plt.close()
-    print(f"[OK] Created: {output_path}")
+    fig.tight_layout()
+    save_chart(fig, output_path, dpi, draft)
 
 
-def create_intensity_trend_chart(df, output_path):
+@styled_chart
+def create_intensity_trend_chart(df, output_path, dpi=300, draft=False, subject=DEFAULT_SUBJECT,
+                                 target=None):
     """
     Chart 2: Emissions Intensity Trend (Line Chart)
-    Shows tCO2e per tonne steel with target line
+    Shows tCO2e per tonne steel with target line (default: the 2030 target)
     """
-    fig, ax = plt.subplots(figsize=(14, 6))
+    import numpy as np
+    from scenarios import INTENSITY_TARGETS
+    target = INTENSITY_TARGETS[2030] if target is None else target
+    fig, ax = new_chart('intensity', subject, df['Date'])
 
     # Prepare data
     x = range(len(df))
@@ -127,7 +270,6 @@ def create_intensity_trend_chart(df, output_path):
             alpha=0.9)
 
     # Add target line (0.70 tCO2e/tonne by 2030) - thicker for visibility
-    target = 0.70
     ax.axhline(y=target, color=COLORS['target'], linestyle='--',
                linewidth=3.5, label=f'2030 Target: {target} tCO₂e/tonne',
                alpha=0.9)
@@ -143,17 +285,6 @@ def create_intensity_trend_chart(df, output_path):
     ax.plot(x, p(x), linestyle=':', linewidth=2, color='gray',
             label='Linear Trend', alpha=0.6)
 
-    # Formatting
-    ax.set_xlabel('Month', fontsize=12, fontweight='bold')
-    ax.set_ylabel('Emissions Intensity (tCO₂e per tonne steel)',
-                  fontsize=12, fontweight='bold')
-    ax.set_title('Emissions Intensity Trend - Norrland Stål AB',
-                 fontsize=14, fontweight='bold', pad=20)
-
-    # X-axis labels
-    ax.set_xticks(x[::2])
-    ax.set_xticklabels(df['Date'].iloc[::2], rotation=45, ha='right')
-
     # Legend
     ax.legend(loc='upper right', framealpha=0.95, fontsize=10)
 
@@ -176,29 +307,29 @@ def create_intensity_trend_chart(df, output_path):
 
     # Target zone no longer needed (replaced with gap shading above)
 
-    plt.tight_layout()
-    plt.savefig(output_path, dpi=300, bbox_inches='tight')
-    plt.close()
-    print(f"[OK] Created: {output_path}")
+    fig.tight_layout()
+    save_chart(fig, output_path, dpi, draft)
 
 
-def create_data_quality_chart(df, output_path):
+@styled_chart
+def create_data_quality_chart(df, output_path, rollup=None, entity=None,
+                              dpi=300, draft=False, subject=DEFAULT_SUBJECT):
     """
     Chart 3: Data Quality Distribution (Pie Chart)
     Shows percentage of measured, calculated, and estimated data
+    Totals come from the rollup store when given, otherwise from df
     """
-    fig, ax1 = plt.subplots(figsize=(10, 8))
+    from rollup_store import build_rollup, quality_totals
+    fig, ax1 = new_chart('quality', subject)
 
     # Overall data quality
-    total_measured = (df['Scope1_Measured'].sum() +
-                     df['Scope2_Measured'].sum() +
-                     df['Scope3_Measured'].sum())
-    total_calculated = (df['Scope1_Calculated'].sum() +
-                       df['Scope2_Calculated'].sum() +
-                       df['Scope3_Calculated'].sum())
-    total_estimated = (df['Scope1_Estimated'].sum() +
-                      df['Scope2_Estimated'].sum() +
-                      df['Scope3_Estimated'].sum())
+    if rollup is None:
+        rollup = build_rollup(df)
+        entity = None
+    tiers = quality_totals(rollup, entity).groupby(level='Quality_Tier').sum()
+    total_measured = tiers['Measured']
+    total_calculated = tiers['Calculated']
+    total_estimated = tiers['Estimated']
 
     total_all = total_measured + total_calculated + total_estimated
 
@@ -225,7 +356,7 @@ def create_data_quality_chart(df, output_path):
     for text in texts1:
         text.set_fontsize(14)
 
-    ax1.set_title('Data Quality Distribution - Norrland Stål AB\n(ESRS E1 Requirements)',
+    ax1.set_title(f'Data Quality Distribution - {subject}\n(ESRS E1 Requirements)',
                   fontsize=16, fontweight='bold', pad=30)
 
     # Second pie chart removed for clarity (too many segments)
@@ -242,73 +373,400 @@ def create_data_quality_chart(df, output_path):
     fig.text(0.5, 0.08, summary_text, ha='center', fontsize=11,
              bbox=dict(boxstyle='round', facecolor='lightgray', alpha=0.8))
 
-    plt.tight_layout(rect=[0, 0.18, 1, 0.96])
-    plt.savefig(output_path, dpi=300, bbox_inches='tight')
-    plt.close()
-    print(f"[OK] Created: {output_path}")
+    fig.tight_layout(rect=[0, 0.18, 1, 0.96])
+    save_chart(fig, output_path, dpi, draft)
+
+
+@styled_chart
+def create_pathway_chart(pathways, output_path, dpi=300, draft=False, subject=DEFAULT_SUBJECT,
+                         targets=None):
+    """
+    Chart 4: Decarbonisation Pathways (Fan Chart)
+    Shows the annual intensity of every projected scenario, the P10-P90
+    band and median, and the intensity targets
+    """
+    import numpy as np
+    from scenarios import INTENSITY_TARGETS
+    targets = INTENSITY_TARGETS if targets is None else targets
+    fig, ax = new_chart('pathways', subject)
+
+    # Prepare data (rows = scenarios, columns = years)
+    years = pathways.columns.to_numpy()
+    values = pathways.to_numpy()
+    p10, p50, p90 = np.percentile(values, [10, 50, 90], axis=0)
+    best = values[np.argmin(values[:, -1])]
+
+    # Every scenario as a faint line, with the central band on top
+    ax.plot(years, values.T, color='gray', linewidth=0.5, alpha=0.08)
+    ax.fill_between(years, p10, p90, color=COLORS['scope2'], alpha=0.2,
+                    label='P10-P90 of scenarios')
+    ax.plot(years, p50, color=COLORS['scope2'], linewidth=2.5, label='Median scenario')
+    ax.plot(years, best, color=COLORS['scope3'], linewidth=2.5, linestyle='--',
+            label='Lowest final-year intensity')
+
+    # Targets as markers in their target year
+    for year, target in targets.items():
+        ax.scatter([year], [target], s=120, marker='D', color=COLORS['target'], zorder=5)
+        ax.annotate(f'{year} Target: {target} tCO₂e/t', (year, target),
+                    textcoords='offset points', xytext=(-10, 12), ha='right', fontsize=9)
+
+    ax.legend(loc='upper right', framealpha=0.95, fontsize=10)
+    ax.grid(True, alpha=0.3)
+    ax.set_axisbelow(True)
+    ax.set_ylim(bottom=0)
+
+    # Share of scenarios meeting each target
+    stats_text = f'{len(values)} scenarios'
+    for year, target in targets.items():
+        if year in pathways.columns:
+            meets = (pathways[year] <= target).mean() * 100
+            stats_text += f'\nMeeting {year} target: {meets:.0f}%'
+
+    ax.text(0.02, 0.05, stats_text,
+            transform=ax.transAxes, fontsize=9, verticalalignment='bottom',
+            bbox=dict(boxstyle='round', facecolor='lightblue', alpha=0.8))
+
+    fig.tight_layout()
+    save_chart(fig, output_path, dpi, draft)
+
+
+# =====================================
+# Rendering pipeline
+# =====================================
+
+def _monthly_view(df):
+    """
+    Collapse multi-facility rows to one row per month
+
+    Intensity is recomputed from the summed totals; single-site data (one
+    row per month) is returned unchanged.
+    """
+    from rollup_store import INTENSITY_COLUMN
+    if df['Date'].is_unique:
+        return df.reset_index(drop=True)
+
+    monthly = df.groupby('Date', sort=True).sum(numeric_only=True).reset_index()
+    if INTENSITY_COLUMN in monthly.columns:
+        monthly[INTENSITY_COLUMN] = (monthly['Total_Emissions_tCO2e']
+                                     / monthly['Production_Tonnes']).round(3)
+    return monthly
+
+
+def build_chart_jobs(data_path, output_dir, rollup_dir=None, per='portfolio',
+                     dpi=300, fmt='png', draft=False, force=False, cube_path=None,
+                     trace=None):
+    """
+    One render job per chart and subject (portfolio, entity or facility)
+
+    Jobs are plain dicts so they pickle cheaply to worker processes; each
+    carries the render key recorded for its output in the previous manifest,
+    and `trace` ({'pid', 'profile', 'profile_dir'}) when spans are recorded.
+    The scenario cube defaults to scenarios.DEFAULT_CUBE_PATH. A workbook
+    without Entity/Facility_ID columns (single site) is one subject.
+    """
+    if cube_path is None:
+        from scenarios import DEFAULT_CUBE_PATH
+        cube_path = DEFAULT_CUBE_PATH
+    output_dir = Path(output_dir)
+    manifest = load_manifest(output_dir)
+    subjects = [(None, None, DEFAULT_SUBJECT, '')]
+
+    if per in ('entity', 'facility'):
+        key = 'Entity' if per == 'entity' else 'Facility_ID'
+        if key in cached_sheet_columns(data_path, 'Emissions_Data'):
+            values = sorted(load_cached_sheet(data_path, 'Emissions_Data', columns=[key])[key].unique())
+            subjects = [(key, value) for value in values]
+        else:
+            # Single-site workbook: the whole sheet is one entity and facility
+            from rollup_store import DEFAULT_ENTITY
+            subjects = [(None, DEFAULT_ENTITY)]
+        subjects = [(key, value, value, '_' + re.sub(r'[^\w-]+', '_', value))
+                    for key, value in subjects]
+
+    # Scenario charts cover the whole portfolio, and need a saved cube
+    charts = [chart for chart in CHART_FILES
+              if chart not in SCENARIO_CHARTS or (per == 'portfolio' and os.path.exists(cube_path))]
+
+    jobs = []
+    for key, value, subject, suffix in subjects:
+        for chart in charts:
+            jobs.append({
+                'chart': chart,
+                'data_path': str(data_path),
+                'rollup_dir': str(rollup_dir) if rollup_dir else None,
+                'cube_path': str(cube_path),
+                'filter': (key, value) if key else None,
+                'subject': subject,
+                'output_path': str(output_dir / f'{CHART_FILES[chart]}{suffix}.{fmt}'),
+                'dpi': dpi,
+                'draft': draft,
+                'force': force,
+                'previous_key': manifest.get(f'{CHART_FILES[chart]}{suffix}.{fmt}', {}).get('key'),
+                'trace': trace,
+            })
+    return jobs
+
+
+def _prepare_chart_data(job):
+    """
+    Load exactly what a chart job plots
+
+    Returns (data, rows, draw): the plotted frame (or quality totals for
+    rollup-backed charts), the raw row count and a callable that renders it.
+    """
+    from rollup_store import load_rollup, quality_totals
+    from scenarios import cube_metric, load_cube
+    chart = job['chart']
+    key, value = job['filter'] or (None, None)
+    options = {'dpi': job['dpi'], 'draft': job['draft'], 'subject': job['subject']}
+    output_path = job['output_path']
+
+    # Portfolio and entity quality charts read the rollup store (keyed by entity)
+    rollup = None
+    if chart == 'quality' and key in (None, 'Entity') and job['rollup_dir']:
+        rollup = load_rollup(job['rollup_dir'])
+
+    if chart == 'pathways':
+        pathways = cube_metric(load_cube(job['cube_path']))
+        return pathways, len(pathways), lambda: create_pathway_chart(
+            pathways, output_path, **options)
+
+    if rollup is not None:
+        totals = quality_totals(rollup, value)
+        return totals, 0, lambda: create_data_quality_chart(
+            None, output_path, rollup=rollup, entity=value, **options)
+
+    columns = chart_columns(chart) + ([key] if key else [])
+    df = load_cached_sheet(job['data_path'], 'Emissions_Data', columns=columns)
+    if key:
+        df = df[df[key] == value].drop(columns=key)
+    rows = len(df)
+
+    if chart == 'stacked':
+        df = _monthly_view(df)
+        return df, rows, lambda: create_stacked_bar_chart(df, output_path, **options)
+    if chart == 'intensity':
+        df = _monthly_view(df)
+        return df, rows, lambda: create_intensity_trend_chart(df, output_path, **options)
+    return df, rows, lambda: create_data_quality_chart(df, output_path, **options)
+
+
+def chart_parameters(job):
+    """Everything besides data and code that changes a chart's pixels"""
+    from scenarios import INTENSITY_TARGETS
+    chart = job['chart']
+    targets = {'intensity': INTENSITY_TARGETS[2030], 'pathways': INTENSITY_TARGETS}
+    return {
+        'chart': chart,
+        'colors': COLORS,
+        'template': CHART_TEMPLATES[chart],
+        'target': targets.get(chart),
+        'subject': job['subject'],
+        'dpi': job['dpi'],
+        'draft': job['draft'],
+        'format': Path(job['output_path']).suffix,
+    }
+
+
+def _chart_code_version(chart):
+    """Source digest of the functions that draw a chart"""
+    draw = {
+        'stacked': create_stacked_bar_chart,
+        'intensity': create_intensity_trend_chart,
+        'quality': create_data_quality_chart,
+        'pathways': create_pathway_chart,
+    }[chart]
+    return code_version(draw, new_chart, save_chart, _monthly_view, _prepare_chart_data)
+
+
+def render_chart_job(job):
+    """
+    Render one chart job (worker task); returns its timing record
+
+    The chart is skipped when its content-addressed key matches the one
+    recorded in the previous manifest and the file still exists. Spans
+    recorded in a worker process travel back in the record's 'events'.
+    """
+    trace = job.get('trace')
+    in_worker = trace is not None and trace['pid'] != os.getpid()
+    if in_worker and not tracing.is_enabled():
+        tracing.enable(trace['profile'], trace['profile_dir'])
+
+    started = time.perf_counter()
+    chart = {'chart': job['chart'], 'output': Path(job['output_path']).name}
+    with span('load_chart_data', **chart) as stage:
+        data, rows, draw = _prepare_chart_data(job)
+        stage['rows'] = rows
+    key = render_key(data_digest(data), params_digest(chart_parameters(job)),
+                     _chart_code_version(job['chart']))
+
+    reusable = (not job.get('force') and job.get('previous_key') == key
+                and os.path.exists(job['output_path']))
+    if reusable:
+        status, updated = 'reused', None
+    else:
+        with span('render_chart', rows=rows, **chart) as stage:
+            draw()
+            stage['bytes'] = os.path.getsize(job['output_path'])
+        status, updated = 'rendered', datetime.now().isoformat(timespec='seconds')
+
+    return {
+        'chart': job['chart'],
+        'output': Path(job['output_path']).name,
+        'rows': rows,
+        'seconds': time.perf_counter() - started,
+        'bytes': os.path.getsize(job['output_path']),
+        'key': key,
+        'status': status,
+        'updated': updated,
+        'events': tracing.drain_events() if in_worker else [],
+    }
+
+
+def render_charts(jobs, max_workers=None):
+    """Render jobs over a process pool (inline when max_workers == 1)"""
+    if max_workers == 1 or len(jobs) <= 1:
+        return [render_chart_job(job) for job in jobs]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(render_chart_job, jobs))
+
+
+def print_timing_report(timings, wall_seconds):
+    """Per-chart timing table for a rendering run"""
+    print("\n" + "=" * 60)
+    print("RENDER TIMING REPORT")
+    print("=" * 60)
+    print(f"{'Chart':<48} {'Status':<9} {'Rows':>7} {'Seconds':>8} {'KB':>7}")
+    for t in sorted(timings, key=lambda t: -t['seconds']):
+        print(f"{t['output']:<48} {t['status']:<9} {t['rows']:>7} {t['seconds']:>8.2f} "
+              f"{t['bytes'] / 1024:>7.0f}")
+    busy = sum(t['seconds'] for t in timings)
+    reused = sum(t['status'] == 'reused' for t in timings)
+    print(f"\n{len(timings)} chart(s), {reused} reused: {busy:.2f}s render time, "
+          f"{wall_seconds:.2f}s wall clock")
 
 
 def main():
     """Main execution function"""
+    parser = argparse.ArgumentParser(description='Render CSRD emissions charts')
+    parser.add_argument('--input',
+                        help='Emissions workbook (default: data/norrland_stal_emissions.xlsx)')
+    parser.add_argument('--rollup',
+                        help='Rollup store directory (default: rollup/ next to the workbook)')
+    parser.add_argument('--output-dir', help='Chart directory (default: powerbi/screenshots)')
+    parser.add_argument('--per', choices=['portfolio', 'entity', 'facility'], default='portfolio',
+                        help='Render one chart set for the portfolio, or one per entity/facility '
+                             '(a single-site workbook is one entity and facility)')
+    parser.add_argument('--format', choices=['png', 'svg', 'webp'], default='png')
+    parser.add_argument('--dpi', type=int, default=300)
+    parser.add_argument('--draft', action='store_true',
+                        help=f'Fast low-resolution previews ({DRAFT_DPI} DPI, no tight bbox)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Render processes (default: all cores)')
+    parser.add_argument('--force', action='store_true',
+                        help='Re-render every chart, ignoring the render cache')
+    parser.add_argument('--trace', metavar='PATH',
+                        help='Record stage spans (including worker processes) and write them '
+                             'as a Chrome trace JSON file, with a summary table')
+    parser.add_argument('--profile', metavar='STAGE',
+                        help='Run cProfile and tracemalloc around one stage (e.g. render_chart, '
+                             'load_chart_data); writes .prof/.txt files next to the trace')
+    args = parser.parse_args()
+
+    trace = None
+    if args.trace or args.profile:
+        profile_dir = os.path.dirname(os.path.abspath(args.trace or 'profile'))
+        tracing.enable(args.profile, profile_dir)
+        trace = {'pid': os.getpid(), 'profile': args.profile, 'profile_dir': profile_dir}
+
     print("=" * 60)
     print("CSRD Climate Visualization Generator")
     print("=" * 60)
 
     # Setup paths
     script_dir = Path(__file__).parent
-    data_path = script_dir.parent / 'data' / 'norrland_stal_emissions.xlsx'
-    output_dir = script_dir.parent / 'powerbi' / 'screenshots'
+    data_path = Path(args.input or script_dir.parent / 'data' / 'norrland_stal_emissions.xlsx')
+    rollup_dir = Path(args.rollup or data_path.parent / 'rollup')
+    output_dir = Path(args.output_dir or script_dir.parent / 'powerbi' / 'screenshots')
+    cube_path = script_dir.parent / 'data' / 'scenario_cube.npz'
 
     # Create output directory
     output_dir.mkdir(parents=True, exist_ok=True)
     print(f"\n[OK] Output directory: {output_dir}")
 
-    # Load data
+    # Nothing changed since the last run: done before loading any data
+    fingerprint = run_fingerprint(
+        [data_path, rollup_dir, cube_path],
+        {'per': args.per, 'format': args.format, 'dpi': args.dpi, 'draft': args.draft},
+        script_dir)
+    previous = None if args.force or tracing.is_enabled() else up_to_date(output_dir, fingerprint)
+    if previous is not None:
+        charts = len(previous['reused']) + len(previous['regenerated'])
+        print(f"\n[OK] {charts} chart(s) up to date: data, options and code unchanged since "
+              f"{previous['generated']} (--force re-renders)")
+        return
+
+    # Load data (converts the workbook into the columnar cache on first use)
     print(f"\nLoading data from: {data_path}")
-    df = load_data(data_path)
+    with span('load') as stage:
+        df = load_data(data_path)
+        stage['rows'] = 0 if df is None else len(df)
 
     if df is None:
         print("\n[ERROR] Cannot proceed without data. Exiting.")
         return
 
+    # A store from another run (e.g. --input elsewhere) would chart other totals
+    from rollup_store import load_rollup, rollup_matches
+    rollup = load_rollup(rollup_dir)
+    if rollup is not None and rollup_matches(rollup, df):
+        print("[OK] Using rollup store for data quality totals")
+    else:
+        if rollup is not None:
+            print(f"[NOTE] Rollup store {rollup_dir} does not match {data_path.name}; "
+                  "data quality totals come from the workbook")
+        rollup_dir = None
+
     # Generate visualizations
     print("\n" + "=" * 60)
     print("Generating visualizations...")
     print("=" * 60)
 
-    # Import numpy here for trend calculation
-    import numpy as np
-    globals()['np'] = np
+    jobs = build_chart_jobs(data_path, output_dir, rollup_dir, per=args.per,
+                            dpi=args.dpi, fmt=args.format, draft=args.draft, force=args.force,
+                            cube_path=cube_path, trace=trace)
+    print(f"\n[OK] {len(jobs)} chart job(s) queued ({args.per}, {args.format.upper()}, "
+          f"{DRAFT_DPI if args.draft else args.dpi} DPI)\n")
+
+    started = time.perf_counter()
+    with span('render', rows=len(jobs)):
+        timings = render_charts(jobs, max_workers=args.workers)
+    for t in timings:
+        tracing.add_events(t.pop('events'))
+    print_timing_report(timings, time.perf_counter() - started)
 
-    # Chart 1: Stacked bar chart
-    print("\n[1/3] Creating stacked bar chart...")
-    chart1_path = output_dir / 'emissions_by_scope_stacked.png'
-    create_stacked_bar_chart(df, chart1_path)
+    manifest_path = save_manifest(output_dir, timings, load_manifest(output_dir), fingerprint)
+    print(f"\n[OK] Render manifest: {manifest_path}")
 
-    # Chart 2: Intensity trend
-    print("\n[2/3] Creating emissions intensity trend...")
-    chart2_path = output_dir / 'emissions_intensity_trend.png'
-    create_intensity_trend_chart(df, chart2_path)
+    print(f"\n[OK] Data cache (main process): {cache_report()}")
 
-    # Chart 3: Data quality
-    print("\n[3/3] Creating data quality distribution...")
-    chart3_path = output_dir / 'data_quality_distribution.png'
-    create_data_quality_chart(df, chart3_path)
+    if tracing.is_enabled():
+        tracing.print_summary()
+        if args.trace:
+            print(f"[OK] Chrome trace: {tracing.write_chrome_trace(args.trace)}")
 
     # Summary
     print("\n" + "=" * 60)
     print("[SUCCESS] All visualizations created!")
     print("=" * 60)
-    print(f"\nOutput files:")
-    print(f"1. {chart1_path.name}")
-    print(f"2. {chart2_path.name}")
-    print(f"3. {chart3_path.name}")
     print(f"\nLocation: {output_dir}")
-    print("\n[NOTE] Images are 300 DPI and ready for:")
-    print("  - Power BI import")
-    print("  - Portfolio presentations")
-    print("  - LinkedIn/GitHub showcase")
-    print("  - ESG reporting documents")
+    if not args.draft:
+        print(f"\n[NOTE] Images are {args.dpi} DPI and ready for:")
+        print("  - Power BI import")
+        print("  - Portfolio presentations")
+        print("  - LinkedIn/GitHub showcase")
+        print("  - ESG reporting documents")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,471 @@
+"""
+CSRD Activity Data Ingestion
+============================
+Builds Emissions_Data from recorded activity data instead of the synthetic
+model: ERP fuel and production logs, meter exports, supplier Scope 3
+files and purchase-order lines (CSV layouts in FEEDS, activities in
+ACTIVITIES; PO lines are priced by scope3_purchases).
+
+Feeds are read in byte blocks of whole lines, so memory stays flat for
+files of any size. Each record is keyed by (facility, period, source,
+activity); records already ingested are skipped via a 64-bit hash index.
+Monthly sums per facility and activity, the index and the byte offset of
+every feed are checkpointed together, so an interrupted load resumes from
+its last checkpoint, and a rerun after rows were appended to a feed reads
+only the new rows.
+
+The monthly sums enter the calculation graph as observed values (metered
+kWh, purchased ore, ...) with registry emission factors; quantities a site
+does not report fall back to its process route model. Priced PO lines
+replace the Scope 3 categories they cover and set the Scope 3 quality tiers.
+
+Usage:
+    python scripts/ingestion.py --roster data/facility_roster.csv \\
+        --fuel erp_fuel.csv --meters meter_export.csv --suppliers suppliers.csv \\
+        --purchases po_lines.csv
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from calculation_graph import calculation_inputs, evaluate_graph, output_values
+from emission_factors import factor_registry, lookup_factors
+from generate_mock_data import (OUTPUT_WRITERS, create_excel_report, emissions_frame,
+                                load_facility_roster, monthly_production, portfolio_company_info,
+                                resolve_parameters)
+from rollup_store import build_rollup, save_rollup
+from scope3_purchases import (METHODS, load_purchase_factors, priced_records, purchase_tiers,
+                              scope3_overrides)
+from tracing import span
+from validation import print_violations, validate_emissions
+
+DEFAULT_CHECKPOINT_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', '.cache', 'ingest')
+CHECKPOINT_FILE = 'checkpoint.json'
+
+# Bytes parsed per block, and input bytes between checkpoints
+BLOCK_BYTES = 64 * 2 ** 20
+CHECKPOINT_BYTES = 1024 * 2 ** 20
+
+# Feed CSV layouts: record field -> column in the export
+FEEDS = {
+    'fuel': {'facility_id': 'facility_id', 'period': 'posting_date', 'source': 'document_no',
+             'activity': 'material', 'quantity': 'quantity'},
+    'meters': {'facility_id': 'facility_id', 'period': 'timestamp', 'source': 'meter_id',
+               'activity': 'medium', 'quantity': 'reading'},
+    'suppliers': {'facility_id': 'facility_id', 'period': 'delivery_date', 'source': 'supplier_id',
+                  'activity': 'material', 'quantity': 'quantity'},
+    # ERP purchase-order lines: EUR line value, physical quantity where known
+    'purchases': {'facility_id': 'facility_id', 'period': 'posting_date', 'source': 'po_line',
+                  'activity': 'commodity', 'quantity': 'amount_eur', 'supplier_id': 'supplier_id',
+                  'units': 'quantity', 'unit': 'unit'},
+}
+
+# Activity: (calculation graph value it observes, unit of the quantity)
+ACTIVITIES = {
+    'steel_production': ('Production_Tonnes', 'tonnes'),
+    'diesel': ('Scope1_Auxiliary', 'litres'),
+    'natural_gas': ('Scope1_Auxiliary', 'kWh'),
+    'electricity': ('Scope2_Electricity_kWh', 'kWh'),
+    'district_heating': ('heating_mwh', 'MWh'),
+    'iron_ore': ('iron_ore_tonnes', 'tonnes'),
+    'coking_coal': ('coal_tonnes', 'tonnes'),
+    'limestone': ('limestone_tonnes', 'tonnes'),
+    'freight': ('transport_tkm', 'tkm'),
+}
+
+# Auxiliary combustion fuels: quantity x registry factor of the same name
+FUEL_ACTIVITIES = ['diesel', 'natural_gas']
+
+# Random terms of the synthetic model at their neutral values: blast furnace
+# emissions are production x route factor, unreported auxiliary fuel and
+# heat are modelled at their base level
+NEUTRAL_ACTIVITY = {'Blast_Furnace_Variation': 0.02, 'Auxiliary_Variation': 0.0,
+                    'Heating_Variation': 0.0}
+
+RECORD_KEYS = ['facility_id', 'period', 'source', 'activity']
+SUM_KEYS = ['facility_id', 'month', 'activity']
+
+
+# =====================================
+# Reading feeds
+# =====================================
+
+def read_blocks(path, offset=0, block_bytes=BLOCK_BYTES, columns=None):
+    """
+    Yield (DataFrame, end offset) for the whole lines of a CSV file from a
+    byte offset on (0 = after the header)
+
+    Records must not contain quoted line breaks.
+    """
+    with open(path, 'rb') as f:
+        header = f.readline()
+        names = next(csv.reader([header.decode('utf-8-sig')]))
+        offset = max(offset, len(header))
+        f.seek(offset)
+
+        def parse(data):
+            return pd.read_csv(io.BytesIO(data), names=names, header=None, usecols=columns,
+                               dtype={col: str for col in names}, keep_default_na=False)
+
+        tail = b''
+        while True:
+            block = f.read(block_bytes)
+            if not block:
+                break
+            block = tail + block
+            cut = block.rfind(b'\n') + 1
+            data, tail = block[:cut], block[cut:]
+            if data:
+                offset += len(data)
+                yield parse(data), offset
+
+        # Last line without a trailing newline
+        if tail.strip():
+            yield parse(tail), offset + len(tail)
+
+
+def _parse_periods(values):
+    """Datetimes for period strings, parsing each distinct value once"""
+    codes, uniques = pd.factorize(values)
+    parsed = pd.to_datetime(pd.Series(uniques, dtype=object), format='ISO8601', errors='coerce')
+    return pd.DatetimeIndex(parsed.to_numpy()[codes]).where(codes >= 0)
+
+
+def normalize_records(raw, feed, facilities, activities=ACTIVITIES):
+    """
+    Map a block of a feed onto its FEEDS fields; returns (records, rejected
+    row count) dropping unknown facilities or activities and unparseable
+    periods or quantities (purchase 'units' may be blank)
+    """
+    layout = FEEDS[feed]
+    # Column selection keeps the parsed string columns (no object copies)
+    records = raw[list(layout.values())].set_axis(list(layout), axis=1)
+    records['period'] = _parse_periods(records['period'])
+    records['quantity'] = pd.to_numeric(records['quantity'], errors='coerce')
+    if 'units' in records:
+        records['units'] = pd.to_numeric(records['units'], errors='coerce')
+
+    valid = (records['facility_id'].isin(facilities) & records['activity'].isin(list(activities))
+             & records['period'].notna() & records['quantity'].notna())
+    return records[valid.to_numpy()], int((~valid).sum())
+
+
+# =====================================
+# Deduplication hash index
+# =====================================
+
+def record_hashes(records):
+    """64-bit hash of each record's (facility, period, source, activity)"""
+    return pd.util.hash_pandas_object(records[RECORD_KEYS], index=False).to_numpy()
+
+
+def index_contains(index, hashes):
+    """Which hashes are in the index (a list of sorted uint64 segments)"""
+    found = np.zeros(len(hashes), dtype=bool)
+    for segment in index:
+        if len(segment):
+            position = np.minimum(np.searchsorted(segment, hashes), len(segment) - 1)
+            found |= segment[position] == hashes
+    return found
+
+
+def index_add(index, hashes):
+    """
+    Add new unique hashes as a sorted segment, merging segments of similar
+    size so lookups stay at O(log n) segments
+    """
+    if not len(hashes):
+        return
+    index.append(np.sort(hashes))
+    while len(index) > 1 and len(index[-2]) <= 2 * len(index[-1]):
+        index[-2:] = [np.sort(np.concatenate(index[-2:]))]
+
+
+def new_records(index, records):
+    """Mask of records not seen before (first occurrence within the block wins)"""
+    hashes = record_hashes(records)
+    _, first = np.unique(hashes, return_index=True)
+    keep = np.zeros(len(records), dtype=bool)
+    keep[first] = True
+    keep &= ~index_contains(index, hashes)
+    index_add(index, hashes[keep])
+    return keep
+
+
+# =====================================
+# Checkpoints
+# =====================================
+
+def _empty_sums():
+    return pd.Series(dtype=np.float64, index=pd.MultiIndex.from_arrays([[], [], []], names=SUM_KEYS),
+                     name='quantity')
+
+
+def add_sums(sums, records):
+    """Add records' quantities to the (facility, month, activity) sums"""
+    period = pd.DatetimeIndex(records['period'])
+    month = (period.year.to_numpy(dtype=np.int64) - 1970) * 12 + period.month.to_numpy() - 1
+    block = records.assign(month=month)
+    block = block.groupby(SUM_KEYS)['quantity'].sum()
+    if sums.empty:
+        return block
+    return pd.concat([sums, block]).groupby(level=SUM_KEYS).sum()
+
+
+def load_checkpoint(checkpoint_dir):
+    """Ingestion state from the last checkpoint; None if there is none"""
+    path = os.path.join(checkpoint_dir, CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    sums = pd.read_csv(os.path.join(checkpoint_dir, checkpoint['sums']),
+                       dtype={'facility_id': str, 'activity': str})
+    index = [np.load(os.path.join(checkpoint_dir, name)) for name in checkpoint['index']]
+    return {
+        'generation': checkpoint['generation'],
+        'feeds': checkpoint['feeds'],
+        'index': list(index),
+        'index_files': list(checkpoint['index']),
+        'saved': index,
+        'sums': sums.set_index(SUM_KEYS)['quantity'] if len(sums) else _empty_sums(),
+    }
+
+
+def save_checkpoint(state, checkpoint_dir):
+    """
+    Write sums, new index segments and feed offsets as the next generation;
+    the checkpoint file is replaced last, so a crash keeps the previous one
+    """
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    generation = state['generation'] + 1
+
+    # Segments are immutable once written; merged segments get a new file
+    known = {id(segment): name for segment, name in zip(state.get('saved', []), state['index_files'])}
+    index_files = []
+    for i, segment in enumerate(state['index']):
+        name = known.get(id(segment))
+        if name is None:
+            name = f'index.{generation}.{i}.npy'
+            np.save(os.path.join(checkpoint_dir, name), segment)
+        index_files.append(name)
+    sums_file = f'sums.{generation}.csv'
+    state['sums'].reset_index().to_csv(os.path.join(checkpoint_dir, sums_file), index=False)
+
+    path = os.path.join(checkpoint_dir, CHECKPOINT_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'generation': generation, 'feeds': state['feeds'], 'index': index_files,
+                   'sums': sums_file}, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+    # Drop files the new checkpoint no longer references
+    for name in os.listdir(checkpoint_dir):
+        if name.startswith(('index.', 'sums.')) and name not in index_files and name != sums_file:
+            os.remove(os.path.join(checkpoint_dir, name))
+    state.update(generation=generation, index_files=index_files, saved=list(state['index']))
+
+
+# =====================================
+# Ingestion
+# =====================================
+
+def ingest_feeds(feeds, facilities, checkpoint_dir=DEFAULT_CHECKPOINT_DIR, restart=False,
+                 block_bytes=BLOCK_BYTES, checkpoint_bytes=CHECKPOINT_BYTES,
+                 purchase_factors=None, countries=None):
+    """
+    Stream feeds ({feed: CSV path}) into monthly activity sums, resuming
+    from the checkpoint unless restart; returns the ingestion state
+    ('sums' and per-feed 'records', 'duplicates' and 'rejected' counts)
+
+    Purchase lines are priced with purchase_factors (load_purchase_factors)
+    and countries ({facility_id: country}) as they are read; their tCO2e per
+    method is kept in the purchases feed's 'methods'.
+    """
+    state = None if restart else load_checkpoint(checkpoint_dir)
+    if state is None:
+        state = {'generation': 0, 'feeds': {}, 'index': [], 'index_files': [],
+                 'sums': _empty_sums()}
+
+    for feed, path in feeds.items():
+        path = os.path.abspath(path)
+        progress = state['feeds'].setdefault(
+            feed, {'path': path, 'offset': 0, 'records': 0, 'duplicates': 0, 'rejected': 0})
+        if progress['path'] != path or os.path.getsize(path) < progress['offset']:
+            raise ValueError(f"Checkpoint in {checkpoint_dir} is for another {feed} file "
+                             f"({progress['path']}); rerun with --restart")
+
+        activities = ACTIVITIES
+        if feed == 'purchases':
+            if purchase_factors is None:
+                raise ValueError("Purchase lines need purchase_factors to be priced")
+            # Priced sums are only valid for the factor tables they were priced with
+            progress.setdefault('factors', purchase_factors['digest'])
+            progress.setdefault('methods', dict.fromkeys(METHODS, 0.0))
+            if progress['factors'] != purchase_factors['digest']:
+                raise ValueError(f"Spend or supplier factors changed since the checkpoint in "
+                                 f"{checkpoint_dir}; rerun with --restart")
+            activities = purchase_factors['commodities']
+
+        unsaved = 0
+        columns = list(FEEDS[feed].values())
+        for raw, offset in read_blocks(path, progress['offset'], block_bytes, columns):
+            with span('ingest_block', feed=feed, rows=len(raw), bytes=offset - progress['offset']):
+                records, rejected = normalize_records(raw, feed, facilities, activities)
+                keep = new_records(state['index'], records)
+                records = records[keep]
+                if feed == 'purchases':
+                    records, by_method = priced_records(records, purchase_factors, countries)
+                    for method, tco2e in by_method.items():
+                        progress['methods'][method] += tco2e
+                state['sums'] = add_sums(state['sums'], records)
+
+            unsaved += offset - progress['offset']
+            progress.update(offset=offset, records=progress['records'] + int(keep.sum()),
+                            duplicates=progress['duplicates'] + int((~keep).sum()),
+                            rejected=progress['rejected'] + rejected)
+            if unsaved >= checkpoint_bytes:
+                save_checkpoint(state, checkpoint_dir)
+                unsaved = 0
+        save_checkpoint(state, checkpoint_dir)
+    return state
+
+
+def emissions_from_activity(sums, roster, registry=None):
+    """
+    Emissions_Data rows (Entity, Facility_ID first) for every facility and
+    month with ingested activity, in roster order
+
+    Priced purchases replace the model value of each Scope 3 category they
+    cover; the Scope 3 tiers then add purchase tiers to the default shares
+    of the modelled categories.
+    """
+    if registry is None:
+        registry = factor_registry()
+    table = sums.unstack('activity')
+    order = pd.Index(roster['facility_id']).get_indexer(table.index.get_level_values('facility_id'))
+    table = table.iloc[np.lexsort((table.index.get_level_values('month'), order))]
+
+    n = len(table)
+    sites = roster.set_index('facility_id').loc[table.index.get_level_values('facility_id')].reset_index()
+    dates = pd.PeriodIndex.from_ordinals(table.index.get_level_values('month'), freq='M').to_timestamp()
+    observed = {name: table[name].to_numpy(dtype=np.float64) if name in table else np.full(n, np.nan)
+                for name in ACTIVITIES}
+
+    # Unreported production falls back to the route model's expected output
+    model_production = monthly_production(dates.month.to_numpy(),
+                                          sites['capacity_tonnes'].to_numpy() / 12, 0.0)
+    production = np.where(np.isnan(observed['steel_production']), model_production,
+                          observed['steel_production'])
+    activity = pd.DataFrame({'Date': dates, 'Production_Tonnes': production,
+                             **{name: np.full(n, value) for name, value in NEUTRAL_ACTIVITY.items()}})
+    params = resolve_parameters(dates, sites, registry)
+
+    # Reported quantities replace the route model; NaN keeps the model value
+    overrides = {ACTIVITIES[name][0]: observed[name] for name in ACTIVITIES
+                 if name != 'steel_production' and name not in FUEL_ACTIVITIES}
+    fuels = np.array([observed[fuel] * lookup_factors(registry, fuel, sites['country'].to_numpy(), dates)
+                      for fuel in FUEL_ACTIVITIES])
+    overrides['Scope1_Auxiliary'] = np.where(np.isnan(fuels).all(axis=0), np.nan,
+                                             np.nansum(fuels, axis=0))
+
+    purchases = purchase_tiers(table)
+    overrides.update({column: tiers.sum(axis=1) for column, tiers in purchases.items()})
+
+    inputs = calculation_inputs(activity, params)
+    values = evaluate_graph(inputs, overrides=overrides)
+    if purchases:
+        overrides.update(scope3_overrides(values, purchases))
+        values = evaluate_graph(inputs, overrides=overrides)
+    df = emissions_frame(dates, output_values(inputs, values))
+    df.insert(0, 'Facility_ID', sites['facility_id'].to_numpy())
+    df.insert(0, 'Entity', sites['entity'].to_numpy())
+    return df
+
+
+def main():
+    """Ingest activity feeds and write the emissions workbook or dataset"""
+    output_dir = os.path.join(os.path.dirname(__file__), '..', 'data')
+    parser = argparse.ArgumentParser(description='Ingest activity data into Emissions_Data')
+    parser.add_argument('--roster', required=True, help='Facility roster CSV')
+    for feed, layout in FEEDS.items():
+        parser.add_argument(f'--{feed}', help=f"{feed} CSV ({', '.join(layout.values())})")
+    parser.add_argument('--factors', help='Emission factor registry CSV')
+    parser.add_argument('--vintage', help='Factor vintage to apply (default: newest per factor)')
+    parser.add_argument('--spend-factors',
+                        help='Commodity EEIO factor CSV (default: data/spend_factors.csv)')
+    parser.add_argument('--supplier-factors',
+                        help='Supplier-specific factor CSV (default: data/supplier_factors.csv)')
+    parser.add_argument('--format', choices=['excel'] + list(OUTPUT_WRITERS), default='excel')
+    parser.add_argument('--output', help='Output file (excel) or directory (parquet/arrow)')
+    parser.add_argument('--rollup', help='Rollup store directory (default: data/rollup)')
+    parser.add_argument('--checkpoint-dir', default=DEFAULT_CHECKPOINT_DIR,
+                        help='Checkpoint directory (offsets, monthly sums, hash index)')
+    parser.add_argument('--restart', action='store_true',
+                        help='Ignore the checkpoint and ingest the feeds from the start')
+    parser.add_argument('--block-mb', type=int, default=BLOCK_BYTES // 2 ** 20,
+                        help='Megabytes parsed per block')
+    parser.add_argument('--checkpoint-mb', type=int, default=CHECKPOINT_BYTES // 2 ** 20,
+                        help='Input megabytes between checkpoints')
+    args = parser.parse_args()
+    feeds = {feed: getattr(args, feed) for feed in FEEDS if getattr(args, feed)}
+    if not feeds:
+        parser.error(f"give at least one feed: {', '.join('--' + feed for feed in FEEDS)}")
+
+    print("=" * 60)
+    print("CSRD Activity Data Ingestion")
+    print("=" * 60)
+
+    roster = load_facility_roster(args.roster)
+    registry = factor_registry(args.factors, args.vintage)
+    print(f"[OK] Loaded roster with {len(roster)} facilities")
+    purchase_factors = None
+    if 'purchases' in feeds:
+        purchase_factors = load_purchase_factors(args.spend_factors, args.supplier_factors, registry)
+        print(f"[OK] Loaded {len(purchase_factors['commodities'])} commodity spend factors and "
+              f"{len(purchase_factors['supplier_value'])} supplier-specific factors")
+
+    state = ingest_feeds(feeds, set(roster['facility_id']), args.checkpoint_dir, args.restart,
+                         args.block_mb * 2 ** 20, args.checkpoint_mb * 2 ** 20,
+                         purchase_factors, dict(zip(roster['facility_id'], roster['country'])))
+    for feed, progress in state['feeds'].items():
+        print(f"[OK] {feed}: {progress['records']:,} records, {progress['duplicates']:,} duplicates "
+              f"skipped, {progress['rejected']:,} rejected ({progress['offset'] / 2 ** 20:,.1f} MB)")
+        if 'methods' in progress:
+            total = sum(progress['methods'].values()) or 1.0
+            print("     " + ", ".join(f"{method} {tco2e:,.0f} tCO2e ({tco2e / total:.0%})"
+                                      for method, tco2e in progress['methods'].items()))
+    if state['sums'].empty:
+        print("\n[ERROR] No activity records ingested. Exiting.")
+        return
+
+    df = emissions_from_activity(state['sums'], roster, registry)
+    print_violations(validate_emissions(df), len(df))
+
+    months = pd.to_datetime(df['Date'], format='%Y-%m')
+    company_info = portfolio_company_info(roster, months.min(), months.max())
+    if args.format in OUTPUT_WRITERS:
+        output_path = args.output or os.path.join(output_dir, f'emissions_{args.format}')
+        run_rollup = OUTPUT_WRITERS[args.format]([df], company_info, output_path)
+    else:
+        output_path = args.output or os.path.join(output_dir, 'norrland_stal_emissions.xlsx')
+        run_rollup = build_rollup(df, company_info['company_name'])
+        create_excel_report(df, company_info, output_path, rollup=run_rollup)
+
+    rollup_dir = args.rollup or os.path.join(output_dir, 'rollup')
+    save_rollup(run_rollup, rollup_dir)
+    print(f"[OK] Rollup store updated: {rollup_dir}")
+
+    print("\n" + "=" * 60)
+    print(f"[SUCCESS] {len(df):,} facility-months of emissions from activity data")
+    print("=" * 60)
+    print(f"\nOutput file: {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+CSRD Long-Format Emissions
+==========================
+Canonical tidy representation of emissions: one tCO2e value per
+(period, scope, category, quality tier), with categorical dtypes.
+
+Emissions_Data stays wide (one column per source and per quality tier) for
+the Excel sheet; everything that aggregates over scopes, categories or
+tiers (rollup store, Data_Quality sheet, quality chart, star schema) reads
+the long form, so a new category is a new graph column, not new code.
+
+Categories are the source columns of Emissions_Data. Scope 3 columns are
+picked up from OUTPUT_COLUMNS by their GHG Protocol category number
+(Scope3_Cat<n>_...), so all 15 categories are supported as they are
+modelled.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from calculation_graph import OUTPUT_COLUMNS
+
+QUALITY_TIERS = ['Measured', 'Calculated', 'Estimated']
+SCOPES = [1, 2, 3]
+
+# GHG Protocol Scope 3 categories
+SCOPE3_CATEGORIES = {
+    1: 'Purchased goods and services',
+    2: 'Capital goods',
+    3: 'Fuel- and energy-related activities',
+    4: 'Upstream transportation',
+    5: 'Waste generated in operations',
+    6: 'Business travel',
+    7: 'Employee commuting',
+    8: 'Upstream leased assets',
+    9: 'Downstream transportation',
+    10: 'Processing of sold products',
+    11: 'Use of sold products',
+    12: 'End-of-life treatment',
+    13: 'Downstream leased assets',
+    14: 'Franchises',
+    15: 'Investments',
+}
+
+SCOPE3_COLUMN = re.compile(r'Scope3_Cat(\d+)_')
+
+
+def _scope3_categories():
+    """Modelled Scope 3 columns of OUTPUT_COLUMNS, in category order"""
+    found = {int(match.group(1)): column for column in OUTPUT_COLUMNS
+             if (match := SCOPE3_COLUMN.match(column))}
+    return [(found[n], 3, SCOPE3_CATEGORIES[n], n, True) for n in sorted(found)]
+
+
+# Emission categories: column, scope, label, GHG Protocol Scope 3 category
+# and whether it counts towards Total_Emissions_tCO2e (market-based Scope 2
+# is reported alongside location-based, not added)
+EMISSION_CATEGORIES = [
+    ('Scope1_Blast_Furnace', 1, 'Blast furnace', None, True),
+    ('Scope1_Auxiliary', 1, 'Auxiliary combustion', None, True),
+    ('Scope2_Location_Based', 2, 'Electricity (location-based)', None, True),
+    ('Scope2_Heating', 2, 'District heating', None, True),
+    ('Scope2_Market_Based', 2, 'Electricity (market-based)', None, False),
+] + _scope3_categories()
+
+# Categorical dtypes of the long form (categories listed even when unmodelled)
+SCOPE_DTYPE = pd.CategoricalDtype(SCOPES, ordered=True)
+CATEGORY_DTYPE = pd.CategoricalDtype(
+    [label for _, scope, label, *_ in EMISSION_CATEGORIES if scope != 3]
+    + [f'Cat{n} {label}' for n, label in SCOPE3_CATEGORIES.items()], ordered=True)
+TIER_DTYPE = pd.CategoricalDtype(QUALITY_TIERS, ordered=True)
+
+LONG_KEYS = ['Scope', 'Category', 'Quality_Tier']
+
+
+def category_label(category):
+    """Category label as stored in the long form (Scope 3 prefixed Cat<n>)"""
+    _, scope, label, number, _ = category
+    return f'Cat{number} {label}' if scope == 3 else label
+
+
+def tier_columns(scopes=SCOPES):
+    """Wide Scope{n}_{tier} columns"""
+    return [f'Scope{scope}_{tier}' for scope in scopes for tier in QUALITY_TIERS]
+
+
+def source_columns(categories=EMISSION_CATEGORIES):
+    """Wide columns the long form is built from"""
+    return [column for column, *_ in categories] + tier_columns()
+
+
+def allocate_tiers(df, categories=EMISSION_CATEGORIES):
+    """
+    tCO2e per (row, category, quality tier) as a (rows, categories, tiers)
+    array: each category is split over its scope's tiers in proportion to
+    its share of the scope's counted categories, so the counted categories
+    add up to the Scope{n}_{tier} columns exactly
+    """
+    values = np.zeros((len(df), len(categories), len(QUALITY_TIERS)))
+    for scope in SCOPES:
+        members = [i for i, (_, s, *_) in enumerate(categories) if s == scope]
+        if not members:
+            continue
+        tiers = np.column_stack([df[column].to_numpy(dtype=np.float64)
+                                 for column in tier_columns([scope])])
+        sources = np.column_stack([df[categories[i][0]].to_numpy(dtype=np.float64)
+                                   for i in members])
+        counted = sources[:, [categories[i][4] for i in members]].sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weights = np.nan_to_num(tiers / counted[:, None])
+        values[:, members] = sources[:, :, None] * weights[:, None, :]
+    return values
+
+
+def to_long(df, keys, categories=EMISSION_CATEGORIES):
+    """
+    Long rows (keys..., Scope, Category, Quality_Tier, tCO2e) from wide
+    Emissions_Data rows; zero values (e.g. Scope 2 Estimated) are dropped
+    """
+    values = allocate_tiers(df, categories)
+    n_categories, n_tiers = len(categories), len(QUALITY_TIERS)
+    category = np.tile(np.repeat(np.arange(n_categories), n_tiers), len(df))
+    labels = pd.Categorical([category_label(c) for c in categories], dtype=CATEGORY_DTYPE)
+
+    long = pd.DataFrame({key: np.repeat(df[key].to_numpy(), n_categories * n_tiers)
+                         for key in keys})
+    long['Scope'] = pd.Categorical.from_codes(
+        np.array([SCOPES.index(scope) for _, scope, *_ in categories])[category], dtype=SCOPE_DTYPE)
+    long['Category'] = labels[category]
+    long['Quality_Tier'] = pd.Categorical.from_codes(
+        np.tile(np.arange(n_tiers), len(df) * n_categories), dtype=TIER_DTYPE)
+    long['tCO2e'] = values.ravel()
+    return long[long['tCO2e'].to_numpy() != 0].reset_index(drop=True)
+
+
+def counted_categories(categories=EMISSION_CATEGORIES):
+    """Long-form labels of the categories that count towards the totals"""
+    return [category_label(c) for c in categories if c[4]]
+
+
+def with_long_dtypes(long):
+    """Restore the categorical dtypes (e.g. after reading a CSV)"""
+    return long.astype({'Scope': SCOPE_DTYPE, 'Category': CATEGORY_DTYPE,
+                        'Quality_Tier': TIER_DTYPE})
+
@@ -0,0 +1,149 @@
+"""
+CSRD Chart Render Cache
+=======================
+Content-addressed cache for rendered charts.
+
+Each chart output is keyed by a SHA-256 over:
+- the exact data it plots (values and column names)
+- its chart parameters (target, colors, template, DPI, format, subject)
+- the code version (source of the functions that draw it, plus the
+  matplotlib version)
+
+A manifest next to the images records every chart's key and whether the
+last run reused or regenerated it. Unchanged charts are skipped on re-runs.
+
+The manifest also records a fingerprint of the whole run: input file stats
+(mtime and size, like the data cache's fast path), run options and the
+source of every script. A re-run with the same fingerprint has nothing to
+do and returns before any data (or pandas/matplotlib) is loaded.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+from datetime import datetime
+from importlib import metadata
+from pathlib import Path
+
+MANIFEST_FILE = 'render_manifest.json'
+
+
+def _digest(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def data_digest(data):
+    """Digest of a DataFrame or Series: column names plus row hashes"""
+    import pandas as pd
+    if isinstance(data, pd.Series):
+        data = data.to_frame()
+    row_hashes = pd.util.hash_pandas_object(data, index=False).to_numpy()
+    return _digest(list(data.columns), row_hashes.tobytes())
+
+
+def params_digest(params):
+    """Digest of JSON-serialisable chart parameters"""
+    return _digest(json.dumps(params, sort_keys=True, default=str))
+
+
+def code_version(*funcs):
+    """
+    Digest of the source of the functions that draw a chart
+
+    The matplotlib version comes from package metadata, so checking a
+    cached chart does not import matplotlib.
+    """
+    sources = [inspect.getsource(func) for func in funcs]
+    return _digest(metadata.version('matplotlib'), *sources)
+
+
+def render_key(data_hash, params_hash, code_hash):
+    """Cache key for one chart output"""
+    return _digest(data_hash, params_hash, code_hash)
+
+
+def _file_stats(path):
+    """(name, mtime_ns, size) of a file, or of every file under a directory"""
+    path = Path(path)
+    if path.is_file():
+        files = [path]
+    elif path.is_dir():
+        files = sorted(p for p in path.rglob('*') if p.is_file())
+    else:
+        return [(str(path), None, None)]
+    return [(str(p), p.stat().st_mtime_ns, p.stat().st_size) for p in files]
+
+
+def run_fingerprint(inputs, options, code_dir):
+    """
+    Digest of a whole render run: stats of the input files/directories, the
+    run options and the source of every script in code_dir (plus the
+    matplotlib version)
+    """
+    sources = [p.read_bytes() for p in sorted(Path(code_dir).glob('*.py'))]
+    stats = [_file_stats(path) for path in inputs]
+    return _digest(json.dumps(stats), params_digest(options),
+                   metadata.version('matplotlib'), *sources)
+
+
+def up_to_date(output_dir, fingerprint):
+    """
+    Previous run's manifest if it has this fingerprint and all its charts
+    still exist, else None
+    """
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    outputs = manifest['reused'] + manifest['regenerated']
+    if manifest.get('fingerprint') != fingerprint or not outputs:
+        return None
+    if not all(os.path.exists(os.path.join(output_dir, name)) for name in outputs):
+        return None
+    return manifest
+
+
+def load_manifest(output_dir):
+    """Previous run's manifest ({output file: entry}), empty if none"""
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f).get('charts', {})
+
+
+def save_manifest(output_dir, timings, previous=None, fingerprint=None):
+    """
+    Write the manifest for this run
+
+    Entries for charts not part of this run (e.g. other facilities) are
+    carried over from `previous`. The run fingerprint, if given, lets the
+    next identical run return early (see up_to_date).
+    """
+    charts = dict(previous or {})
+    for t in timings:
+        charts[t['output']] = {
+            'key': t['key'],
+            'status': t['status'],
+            'chart': t['chart'],
+            'updated': t.get('updated') or charts.get(t['output'], {}).get('updated'),
+        }
+
+    manifest = {
+        'generated': datetime.now().isoformat(timespec='seconds'),
+        'reused': sorted(t['output'] for t in timings if t['status'] == 'reused'),
+        'regenerated': sorted(t['output'] for t in timings if t['status'] == 'rendered'),
+        'fingerprint': fingerprint,
+        'charts': charts,
+    }
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+    return path
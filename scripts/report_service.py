@@ -0,0 +1,539 @@
+"""
+CSRD Report Service
+===================
+Local asyncio HTTP service that builds entity/period reports on demand:
+the emissions workbook plus its charts, for any slice of the facility
+roster and reporting window.
+
+    python scripts/report_service.py --port 8765
+    curl "http://localhost:8765/report?entity=Norrland%20Stål%20AB&start=2024-01&end=2024-12"
+
+Requests are queued and built by a few job coroutines; generation,
+aggregation and the workbook run as one process-pool task and every chart
+as another, so CPU-bound work never blocks the event loop. Identical
+requests that arrive while a report is building wait for the same job
+instead of starting another.
+
+Finished reports are cached on disk, keyed by a SHA-256 over the request
+and the contents of the roster and factor registry, with LRU eviction
+beyond a size and entry budget; a repeated request returns the cached
+files without any work. The cache index is written off the event loop, at
+most once per INDEX_FLUSH_SECONDS.
+
+Endpoints (GET):
+- /report?entity=&facility=&start=&end=&freq=&vintage=&format=&dpi=&draft=&wait=
+- /jobs/<key>           status of a queued, running or finished report
+- /files/<key>/<name>   download a workbook or chart
+- /stats                cache and queue counters
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import pandas as pd
+
+from data_cache import file_sha256, load_cached_sheet
+from emission_factors import DEFAULT_REGISTRY_PATH, registry_vintages
+from generate_mock_data import (create_excel_report, generate_portfolio_data, load_facility_roster,
+                                operating_facilities)
+from generate_visuals import build_chart_jobs, render_chart_job
+from render_cache import save_manifest
+from rollup_store import build_rollup, save_rollup
+from time_series import FREQUENCIES
+from tracing import path_size
+
+DATA_DIR = Path(__file__).parent.parent / 'data'
+DEFAULT_ROSTER_PATH = DATA_DIR / 'facility_roster.csv'
+DEFAULT_CACHE_DIR = DATA_DIR / '.cache' / 'reports'
+
+INDEX_FILE = 'report_index.json'
+WORKBOOK_FILE = 'emissions_report.xlsx'
+CHART_DIR = 'charts'
+
+DEFAULT_CACHE_MB = 500
+DEFAULT_CACHE_ENTRIES = 64
+
+# Cache hits and stores mark the index dirty; it is written at most this often
+INDEX_FLUSH_SECONDS = 1.0
+
+# Request parameters and their defaults (all reports cover the roster window)
+REQUEST_DEFAULTS = {
+    'entity': None,
+    'facility': None,
+    'start': '2023-01',
+    'end': '2024-12',
+    'freq': 'monthly',
+    'vintage': None,
+    'format': 'png',
+    'dpi': 150,
+    'draft': False,
+}
+
+CHART_FORMATS = ['png', 'svg', 'webp']
+
+CONTENT_TYPES = {
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    '.png': 'image/png',
+    '.svg': 'image/svg+xml',
+    '.webp': 'image/webp',
+    '.json': 'application/json',
+}
+
+HTTP_STATUS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found',
+               405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+# =====================================
+# Requests
+# =====================================
+
+def normalize_request(params, vintages=None):
+    """
+    Validated report request from query parameters (single values); raises
+    ValueError on unknown parameters or invalid values. A vintage must be
+    one of `vintages` (the registry's published vintages) when given.
+    """
+    unknown = set(params) - set(REQUEST_DEFAULTS) - {'wait'}
+    if unknown:
+        raise ValueError(f"Unknown parameters: {sorted(unknown)}")
+
+    request = {name: params.get(name, default) or default
+               for name, default in REQUEST_DEFAULTS.items()}
+    try:
+        start, end = pd.Period(request['start'], freq='M'), pd.Period(request['end'], freq='M')
+    except ValueError:
+        raise ValueError(f"start/end must be YYYY-MM months, got "
+                         f"{request['start']!r}/{request['end']!r}") from None
+    if end < start:
+        raise ValueError(f"end {end} is before start {start}")
+    request['start'], request['end'] = str(start), str(end)
+
+    if request['freq'] not in FREQUENCIES:
+        raise ValueError(f"freq must be one of {list(FREQUENCIES)}")
+    if request['vintage'] and vintages is not None and request['vintage'] not in vintages:
+        raise ValueError(f"no vintage {request['vintage']} in the factor registry "
+                         f"(published: {', '.join(vintages)})")
+    if request['format'] not in CHART_FORMATS:
+        raise ValueError(f"format must be one of {CHART_FORMATS}")
+    try:
+        request['dpi'] = int(request['dpi'])
+    except ValueError:
+        raise ValueError(f"dpi must be an integer, got {request['dpi']!r}") from None
+    if not 36 <= request['dpi'] <= 600:
+        raise ValueError("dpi must be between 36 and 600")
+    request['draft'] = str(request['draft']).lower() in ('1', 'true', 'yes')
+    return request
+
+
+def report_key(request, input_digests):
+    """Cache key: the request plus the contents of the roster and registry"""
+    payload = json.dumps({'request': request, 'inputs': input_digests}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:24]
+
+
+# =====================================
+# Report build (worker tasks)
+# =====================================
+
+def build_workbook(request, roster_path, factors_path, report_dir):
+    """
+    Generate, aggregate and write one report's workbook and rollup store
+    (process-pool task); returns the row count. Raises ValueError when no
+    facility of the request operates in its window.
+    """
+    roster = load_facility_roster(roster_path)
+    if request['entity']:
+        roster = roster[roster['entity'] == request['entity']]
+    if request['facility']:
+        roster = roster[roster['facility_id'] == request['facility']]
+    start = pd.Period(request['start'], freq='M').to_timestamp()
+    end = pd.Period(request['end'], freq='M').to_timestamp()
+    operating = operating_facilities(roster, start, end)
+    if not operating.any():
+        raise ValueError(f"No facility matches entity={request['entity']!r}, "
+                         f"facility={request['facility']!r} in {request['start']} to {request['end']}")
+
+    # Shards run inline: the service's pool already spreads whole reports
+    df, company_info = generate_portfolio_data(
+        roster[operating], start, end, max_workers=1,
+        factor_source=(factors_path, request['vintage']), freq=request['freq'])
+    rollup = build_rollup(df, company_info['company_name'])
+    save_rollup(rollup, os.path.join(report_dir, 'rollup'))
+    workbook_path = os.path.join(report_dir, WORKBOOK_FILE)
+    create_excel_report(df, company_info, workbook_path, rollup=rollup)
+    # Fill the columnar cache once here, so the chart tasks all hit it
+    load_cached_sheet(workbook_path, 'Emissions_Data', columns=['Date'])
+    return len(df)
+
+
+async def build_report(service, request, report_dir):
+    """Build a report into report_dir: the workbook task, then one task per chart"""
+    loop = asyncio.get_running_loop()
+    pool = service['pool']
+    rows = await loop.run_in_executor(pool, build_workbook, request, service['roster_path'],
+                                      service['factors_path'], str(report_dir))
+
+    # No scenario cube in a report directory, so the pathway chart is left out
+    chart_dir = report_dir / CHART_DIR
+    chart_dir.mkdir()
+    jobs = build_chart_jobs(report_dir / WORKBOOK_FILE, chart_dir, report_dir / 'rollup',
+                            dpi=request['dpi'], fmt=request['format'], draft=request['draft'],
+                            cube_path=report_dir / 'scenario_cube.npz')
+    timings = await asyncio.gather(*[loop.run_in_executor(pool, render_chart_job, job)
+                                     for job in jobs])
+    for t in timings:
+        t.pop('events')
+    save_manifest(chart_dir, timings, {})
+    return rows
+
+
+# =====================================
+# Report cache
+# =====================================
+
+def load_cache_index(cache_dir):
+    """
+    Cached reports, least recently used first; entries without files are
+    dropped, and report directories missing from the index (built just
+    before a shutdown) are deleted
+    """
+    index_path = cache_dir / INDEX_FILE
+    entries = []
+    if index_path.exists():
+        with open(index_path, encoding='utf-8') as f:
+            entries = json.load(f)
+    cache = OrderedDict((entry['key'], entry) for entry in entries
+                        if (cache_dir / entry['key']).is_dir())
+    for path in cache_dir.iterdir():
+        if path.is_dir() and re.fullmatch(r'[0-9a-f]{24}', path.name) and path.name not in cache:
+            shutil.rmtree(path, ignore_errors=True)
+    return cache
+
+
+def save_cache_index(cache_dir, entries):
+    """Write the cache index (a list of entries, least recently used first)"""
+    tmp_path = cache_dir / (INDEX_FILE + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(entries, f, indent=2)
+    os.replace(tmp_path, cache_dir / INDEX_FILE)
+
+
+async def index_writer(service):
+    """Write the cache index in a thread whenever it changed, batching updates"""
+    while True:
+        await asyncio.sleep(INDEX_FLUSH_SECONDS)
+        if service['index_dirty']:
+            service['index_dirty'] = False
+            entries = [dict(entry) for entry in service['cache'].values()]
+            await asyncio.to_thread(save_cache_index, service['cache_dir'], entries)
+
+
+def cache_lookup(service, key):
+    """Cached report entry (marked most recently used), or None"""
+    entry = service['cache'].get(key)
+    if entry is None:
+        return None
+    service['cache'].move_to_end(key)
+    entry['last_used'] = datetime.now().isoformat(timespec='seconds')
+    service['index_dirty'] = True
+    return entry
+
+
+def cache_store(service, entry):
+    """Add a finished report and evict least recently used ones over budget"""
+    cache = service['cache']
+    cache[entry['key']] = entry
+    while len(cache) > 1 and (len(cache) > service['max_entries']
+                              or sum(e['bytes'] for e in cache.values()) > service['max_bytes']):
+        key, _ = cache.popitem(last=False)
+        shutil.rmtree(service['cache_dir'] / key, ignore_errors=True)
+        service['stats']['evictions'] += 1
+    service['index_dirty'] = True
+
+
+def report_files(service, key):
+    """Download paths of a cached report's workbook and charts"""
+    report_dir = service['cache_dir'] / key
+    charts = sorted(path.name for path in (report_dir / CHART_DIR).iterdir()
+                    if path.suffix in CONTENT_TYPES and path.suffix != '.json')
+    return {
+        'workbook': f'/files/{key}/{WORKBOOK_FILE}',
+        'charts': [f'/files/{key}/{name}' for name in charts],
+    }
+
+
+# =====================================
+# Job queue
+# =====================================
+
+def new_service(roster_path=None, factors_path=None, cache_dir=None, max_workers=None,
+                max_jobs=2, cache_mb=DEFAULT_CACHE_MB, cache_entries=DEFAULT_CACHE_ENTRIES):
+    """Service state: input files, report cache, job table and worker pool"""
+    roster_path = Path(roster_path or DEFAULT_ROSTER_PATH)
+    factors_path = Path(factors_path or DEFAULT_REGISTRY_PATH)
+    cache_dir = Path(cache_dir or DEFAULT_CACHE_DIR)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    # Half-built reports of an interrupted run
+    for path in cache_dir.glob('*.tmp'):
+        shutil.rmtree(path, ignore_errors=True)
+
+    return {
+        'roster_path': str(roster_path),
+        'factors_path': str(factors_path),
+        'cache_dir': cache_dir,
+        'cache': load_cache_index(cache_dir),
+        'index_dirty': False,
+        'max_bytes': cache_mb * 1024 * 1024,
+        'max_entries': cache_entries,
+        'max_jobs': max_jobs,
+        'pool': ProcessPoolExecutor(max_workers=max_workers),
+        'queue': None,
+        'inflight': {},
+        'jobs': {},
+        'stats': {'requests': 0, 'hits': 0, 'misses': 0, 'deduplicated': 0,
+                  'built': 0, 'failed': 0, 'evictions': 0},
+    }
+
+
+def input_digests(service):
+    """Content digests of the files every report is built from"""
+    return {'roster': file_sha256(service['roster_path']),
+            'factors': file_sha256(service['factors_path'])}
+
+
+async def submit_report(service, request, wait=True):
+    """
+    Cached report for a request, or queue it; identical requests share one
+    job. Returns (key, entry, cached) with entry None while the job is
+    pending and wait is False. Build errors are raised to every waiting
+    request.
+    """
+    service['stats']['requests'] += 1
+    key = report_key(request, input_digests(service))
+    entry = cache_lookup(service, key)
+    if entry is not None:
+        service['stats']['hits'] += 1
+        return key, entry, True
+
+    future = service['inflight'].get(key)
+    if future is not None:
+        service['stats']['deduplicated'] += 1
+    else:
+        service['stats']['misses'] += 1
+        future = asyncio.get_running_loop().create_future()
+        service['inflight'][key] = future
+        service['jobs'][key] = {'status': 'queued', 'request': request}
+        await service['queue'].put((key, request))
+
+    if not wait:
+        return key, None, False
+    # Shielded, so a client that disconnects does not cancel the shared job
+    return key, await asyncio.shield(future), False
+
+
+async def job_worker(service):
+    """Take report jobs off the queue and build them one at a time"""
+    while True:
+        key, request = await service['queue'].get()
+        job = service['jobs'][key]
+        job.update(status='running', started=time.perf_counter())
+        report_dir = service['cache_dir'] / f'{key}.tmp'
+        shutil.rmtree(report_dir, ignore_errors=True)
+        report_dir.mkdir()
+        future = service['inflight'][key]
+        try:
+            rows = await build_report(service, request, report_dir)
+            os.replace(report_dir, service['cache_dir'] / key)
+            seconds = time.perf_counter() - job['started']
+            entry = {
+                'key': key,
+                'request': request,
+                'rows': rows,
+                'bytes': path_size(service['cache_dir'] / key),
+                'seconds': round(seconds, 2),
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'last_used': datetime.now().isoformat(timespec='seconds'),
+            }
+            cache_store(service, entry)
+            service['stats']['built'] += 1
+            # Finished reports are served from the cache; only failures stay listed
+            del service['jobs'][key]
+            print(f"[OK] Report {key}: {rows:,} rows in {seconds:.1f}s")
+            future.set_result(entry)
+        except Exception as error:
+            shutil.rmtree(report_dir, ignore_errors=True)
+            service['stats']['failed'] += 1
+            job.update(status='failed', error=str(error))
+            print(f"[ERROR] Report {key}: {error}")
+            future.set_exception(error)
+            # Retrieved here, so nobody waiting (wait=0) is not an unhandled error
+            future.exception()
+        finally:
+            service['inflight'].pop(key, None)
+            service['queue'].task_done()
+
+
+# =====================================
+# HTTP
+# =====================================
+
+def _json_body(payload):
+    return json.dumps(payload, indent=2, ensure_ascii=False).encode('utf-8'), 'application/json'
+
+
+def report_response(service, key, entry, cached):
+    """JSON body describing a finished report"""
+    return {
+        'key': key,
+        'status': 'done',
+        'cached': cached,
+        'rows': entry['rows'],
+        'seconds': entry['seconds'],
+        'request': entry['request'],
+        'files': report_files(service, key),
+    }
+
+
+async def handle_get(service, path, params):
+    """(status, body, content type) for one GET request"""
+    parts = [unquote(part) for part in path.strip('/').split('/')]
+
+    if parts == ['report']:
+        try:
+            request = normalize_request(params, registry_vintages(service['factors_path']))
+        except ValueError as error:
+            return (400, *_json_body({'error': str(error)}))
+        wait = params.get('wait', '1').lower() not in ('0', 'false', 'no')
+        try:
+            key, entry, cached = await submit_report(service, request, wait)
+        except ValueError as error:
+            return (400, *_json_body({'error': str(error)}))
+        except Exception as error:
+            return (500, *_json_body({'error': str(error)}))
+        if entry is None:
+            return (202, *_json_body({'key': key, 'status': service['jobs'][key]['status'],
+                                      'poll': f'/jobs/{key}'}))
+        return (200, *_json_body(report_response(service, key, entry, cached)))
+
+    if len(parts) == 2 and parts[0] == 'jobs':
+        key = parts[1]
+        if key in service['cache']:
+            return (200, *_json_body(report_response(service, key, service['cache'][key], True)))
+        job = service['jobs'].get(key)
+        if job is None:
+            return (404, *_json_body({'error': f'Unknown report {key}'}))
+        return (200, *_json_body({'key': key, 'status': job['status'],
+                                  'error': job.get('error')}))
+
+    if len(parts) == 3 and parts[0] == 'files':
+        key, name = parts[1], parts[2]
+        report_dir = service['cache_dir'] / key
+        path = report_dir / (name if name == WORKBOOK_FILE else Path(CHART_DIR, name))
+        if key not in service['cache'] or '/' in name or not path.is_file():
+            return (404, *_json_body({'error': f'No file {name} in report {key}'}))
+        cache_lookup(service, key)
+        return 200, path.read_bytes(), CONTENT_TYPES.get(path.suffix, 'application/octet-stream')
+
+    if parts == ['stats']:
+        return (200, *_json_body({
+            **service['stats'],
+            'queued': service['queue'].qsize(),
+            'running': sum(job['status'] == 'running' for job in service['jobs'].values()),
+            'cached_reports': len(service['cache']),
+            'cache_mb': round(sum(e['bytes'] for e in service['cache'].values()) / 2**20, 1),
+        }))
+
+    return (404, *_json_body({'error': f'Unknown path {path}'}))
+
+
+async def handle_connection(service, reader, writer):
+    """Serve one HTTP/1.1 request (Connection: close)"""
+    try:
+        request_line = (await reader.readline()).decode('latin-1').split()
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass  # headers are not used
+        if len(request_line) != 3:
+            return
+        method, target, _ = request_line
+        url = urlsplit(target)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        if method != 'GET':
+            status, body, content_type = (405, *_json_body({'error': 'Only GET is supported'}))
+        else:
+            status, body, content_type = await handle_get(service, url.path, params)
+
+        writer.write((f'HTTP/1.1 {status} {HTTP_STATUS[status]}\r\n'
+                      f'Content-Type: {content_type}\r\n'
+                      f'Content-Length: {len(body)}\r\n'
+                      'Connection: close\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(service, host='127.0.0.1', port=8765):
+    """Run the HTTP server and job workers until cancelled"""
+    service['queue'] = asyncio.Queue()
+    workers = [asyncio.create_task(job_worker(service)) for _ in range(service['max_jobs'])]
+    workers.append(asyncio.create_task(index_writer(service)))
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_connection(service, reader, writer), host, port)
+    print(f"[OK] Report service on http://{host}:{port} "
+          f"({service['max_jobs']} concurrent jobs, {len(service['cache'])} cached reports)")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        for worker in workers:
+            worker.cancel()
+        service['pool'].shutdown(cancel_futures=True)
+        if service['index_dirty']:
+            save_cache_index(service['cache_dir'], list(service['cache'].values()))
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(description='Serve CSRD reports on demand over HTTP')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--roster', help='Facility roster CSV (default: data/facility_roster.csv)')
+    parser.add_argument('--factors', help='Emission factor registry CSV '
+                                          '(default: data/emission_factors.csv)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes for generation and rendering (default: all cores)')
+    parser.add_argument('--jobs', type=int, default=2,
+                        help='Reports built concurrently (default: 2)')
+    parser.add_argument('--cache-dir', help='Report cache directory (default: data/.cache/reports)')
+    parser.add_argument('--cache-mb', type=int, default=DEFAULT_CACHE_MB,
+                        help='Evict least recently used reports beyond this size')
+    parser.add_argument('--cache-entries', type=int, default=DEFAULT_CACHE_ENTRIES,
+                        help='Evict least recently used reports beyond this count')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("CSRD Report Service")
+    print("=" * 60)
+    service = new_service(args.roster, args.factors, args.cache_dir, args.workers, args.jobs,
+                          args.cache_mb, args.cache_entries)
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        print("\n[OK] Report service stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+CSRD Report Writers
+===================
+Output stages for generated emissions data:
+- Streaming, partitioned Parquet datasets (by year/facility)
+- Arrow IPC files
+- Power BI star schema: narrow integer-keyed fact tables plus dimensions
+- Annual_Summary and Data_Quality side tables, rolled up batch by batch
+
+Writers consume an iterable of DataFrame row-batches, so memory stays
+bounded by the batch size rather than the full history. Power BI and the
+warehouse read the Parquet output directly.
+
+Requires pyarrow (pip install pyarrow).
+"""
+
+import itertools
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from long_format import (EMISSION_CATEGORIES, QUALITY_TIERS, SCOPES, allocate_tiers,
+                         category_label)
+from rollup_store import (annual_summary_table, build_rollup, data_quality_table, merge_rollups,
+                          update_rollup)
+
+# Excel worksheets stop at 1,048,576 rows (one is the header)
+EXCEL_MAX_ROWS = 1048575
+
+# Activity fact columns (per date and facility)
+STAR_ACTIVITY_COLUMNS = {'Production_Tonnes': 'production_tonnes',
+                         'Scope2_Electricity_kWh': 'electricity_kwh'}
+
+
+def _require_pyarrow():
+    """Import pyarrow on demand with an actionable error message"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Parquet/Arrow output requires pyarrow: pip install pyarrow") from e
+    return pa, pq
+
+
+# =====================================
+# Streaming writers
+# =====================================
+
+def _nonempty(batches):
+    """
+    Row-batches as an iterator; raises ValueError before anything is
+    written (or an existing dataset cleared) when there are none
+    """
+    batches = iter(batches)
+    first = next(batches, None)
+    if first is None:
+        raise ValueError("No emissions rows to write (no facility operates in the window)")
+    return itertools.chain([first], batches)
+
+
+def _write_side_tables(rollup, company_info, output_dir, write_table):
+    """Write Annual_Summary, Data_Quality and Company_Info next to the data"""
+    write_table(annual_summary_table(rollup).reset_index(), 'annual_summary')
+    write_table(data_quality_table(rollup), 'data_quality')
+    with open(os.path.join(output_dir, 'company_info.json'), 'w', encoding='utf-8') as f:
+        json.dump(company_info, f, ensure_ascii=False, indent=2)
+
+
+def write_parquet_dataset(batches, company_info, output_dir,
+                          partition_cols=('Year', 'Facility_ID'), compression='zstd',
+                          append=False, store=None):
+    """
+    Stream row-batches into a Hive-partitioned Parquet dataset
+
+    Each batch is written as its own part file inside the
+    Year=YYYY/Facility_ID=... directories it touches, so only one batch is
+    held in memory at a time. With append=True the existing dataset is kept
+    and the side tables are built from `store` (the persisted rollup) updated
+    with this run. Returns the rollup of the rows written by this run;
+    raises ValueError when there are no batches.
+    """
+    pa, pq = _require_pyarrow()
+    batches = _nonempty(batches)
+    data_dir = os.path.join(output_dir, 'emissions_data')
+
+    # Part files are numbered per run, so clear parts left by a previous run
+    if os.path.isdir(data_dir) and not append:
+        shutil.rmtree(data_dir)
+    os.makedirs(data_dir, exist_ok=True)
+
+    rollup = None
+    rows = 0
+    for i, batch in enumerate(batches):
+        cols = [c for c in partition_cols if c in batch.columns]
+        table = pa.Table.from_pandas(batch, preserve_index=False)
+
+        # Part names carry the batch's month range, so re-running an append
+        # for the same months overwrites its files instead of duplicating rows
+        months = f"{batch['Date'].min()}_{batch['Date'].max()}"
+        pq.write_to_dataset(table, data_dir, partition_cols=cols or None,
+                            basename_template=f'part-{months}-{i:05d}-{{i}}.parquet',
+                            existing_data_behavior='overwrite_or_ignore',
+                            compression=compression)
+        rollup = merge_rollups(rollup, build_rollup(batch, company_info['company_name']))
+        rows += len(batch)
+
+    def write_table(df, name):
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False),
+                       os.path.join(output_dir, f'{name}.parquet'), compression=compression)
+
+    side_rollup = update_rollup(store, rollup) if append else rollup
+    _write_side_tables(side_rollup, company_info, output_dir, write_table)
+    print(f"\n[OK] Parquet dataset {'appended' if append else 'created'}: {data_dir} ({rows:,} rows)")
+    return rollup
+
+
+def _date_keys(batch):
+    """
+    Integer date keys: YYYYMMDD for monthly rows, YYYYMMDDHH for rows with
+    a Timestamp (daily/hourly); returns (keys, period starts)
+    """
+    if 'Timestamp' in batch.columns:
+        dates = pd.DatetimeIndex(batch['Timestamp'])
+        keys = ((dates.year * 100 + dates.month) * 100 + dates.day) * 100 + dates.hour
+    else:
+        dates = pd.DatetimeIndex(pd.to_datetime(batch['Date'], format='%Y-%m'))
+        keys = (dates.year * 100 + dates.month) * 100 + dates.day
+    return keys.to_numpy(dtype=np.int32), dates
+
+
+def star_facts(batch, date_keys, facility_keys):
+    """
+    Long fact rows for one batch: tCO2e per (date, facility, category,
+    quality tier), allocated as in the long form (long_format.allocate_tiers)
+
+    Returns (emissions facts, activity facts) as DataFrames; zero facts
+    (e.g. Scope 2 Estimated) are dropped. Measures keep the batch's float
+    dtype (float32 for daily/hourly rows).
+    """
+    n = len(batch)
+    dtype = np.result_type(*[batch[column].dtype for column, *_ in EMISSION_CATEGORIES])
+
+    # (rows, categories, tiers) allocation, flattened row-major
+    values = allocate_tiers(batch)
+    n_categories, n_tiers = len(EMISSION_CATEGORIES), len(QUALITY_TIERS)
+    category_scope = np.array([scope for _, scope, *_ in EMISSION_CATEGORIES], dtype=np.int8)
+    category = np.tile(np.repeat(np.arange(1, n_categories + 1, dtype=np.int8), n_tiers), n)
+    facts = pd.DataFrame({
+        'date_key': np.repeat(date_keys, n_categories * n_tiers),
+        'facility_key': np.repeat(facility_keys, n_categories * n_tiers),
+        'scope_key': category_scope[category - 1],
+        'category_key': category,
+        'quality_key': np.tile(np.arange(1, n_tiers + 1, dtype=np.int8), n * n_categories),
+        'tCO2e': values.ravel().astype(dtype),
+    })
+    activity = pd.DataFrame({'date_key': date_keys, 'facility_key': facility_keys,
+                             **{name: batch[column].to_numpy()
+                                for column, name in STAR_ACTIVITY_COLUMNS.items()}})
+    return facts[facts['tCO2e'].to_numpy() != 0], activity
+
+
+def star_dimensions(dates, facilities):
+    """
+    Dimension tables for the star schema: dates ({date_key: period start}),
+    facilities ({(Entity, Facility_ID): facility_key}), scopes, categories
+    and quality tiers
+    """
+    keys = np.array(sorted(dates), dtype=np.int32)
+    starts = pd.DatetimeIndex([dates[key] for key in keys])
+    dim_date = pd.DataFrame({
+        'date_key': keys,
+        'Date': starts,
+        'Year': starts.year.astype(np.int16),
+        'Quarter': starts.quarter.astype(np.int8),
+        'Month': starts.month.astype(np.int8),
+        'Month_Name': starts.month_name(),
+        'Period': starts.strftime('%Y-%m'),
+    })
+    dim_facility = pd.DataFrame(
+        [(key, entity, facility) for (entity, facility), key in facilities.items()],
+        columns=['facility_key', 'Entity', 'Facility_ID'])
+    dim_scope = pd.DataFrame({'scope_key': np.array(SCOPES, dtype=np.int8),
+                              'Scope': [f'Scope {scope}' for scope in SCOPES]})
+    dim_category = pd.DataFrame({
+        'category_key': np.arange(1, len(EMISSION_CATEGORIES) + 1, dtype=np.int8),
+        'Category': [category_label(category) for category in EMISSION_CATEGORIES],
+        'Column': [column for column, *_ in EMISSION_CATEGORIES],
+        'scope_key': np.array([scope for _, scope, *_ in EMISSION_CATEGORIES], dtype=np.int8),
+        'GHG_Category': pd.array([ghg for *_, ghg, _ in EMISSION_CATEGORIES], dtype='Int8'),
+        'In_Total': [in_total for *_, in_total in EMISSION_CATEGORIES],
+    })
+    dim_quality = pd.DataFrame({'quality_key': np.arange(1, len(QUALITY_TIERS) + 1, dtype=np.int8),
+                                'Quality_Tier': QUALITY_TIERS})
+    return {'dim_date': dim_date, 'dim_facility': dim_facility, 'dim_scope': dim_scope,
+            'dim_category': dim_category, 'dim_quality': dim_quality}
+
+
+def write_star_schema(batches, company_info, output_dir, compression='zstd'):
+    """
+    Stream row-batches into a Power BI star schema of Parquet files
+
+    fact_emissions (date_key, facility_key, scope_key, category_key,
+    quality_key, tCO2e) and fact_activity (date_key, facility_key,
+    production_tonnes, electricity_kwh) are written batch by batch with
+    integer surrogate keys; the dim_* tables follow once all keys are known.
+    Returns the rollup of the rows written; raises ValueError when there
+    are no batches.
+    """
+    pa, pq = _require_pyarrow()
+    batches = _nonempty(batches)
+    os.makedirs(output_dir, exist_ok=True)
+
+    rollup = None
+    rows = 0
+    dates, facilities = {}, {}
+    writers = {}
+    try:
+        for batch in batches:
+            date_keys, starts = _date_keys(batch)
+            unique_keys, first = np.unique(date_keys, return_index=True)
+            dates.update(zip(unique_keys.tolist(), starts[first]))
+
+            # Facility keys in order of first appearance (roster order)
+            entity = (batch['Entity'].astype(str).to_numpy() if 'Entity' in batch.columns
+                      else np.full(len(batch), company_info['company_name'], dtype=object))
+            facility = (batch['Facility_ID'].astype(str).to_numpy() if 'Facility_ID' in batch.columns
+                        else np.full(len(batch), company_info['location'], dtype=object))
+            codes, sites = pd.factorize(pd.MultiIndex.from_arrays([entity, facility]))
+            site_keys = np.array([facilities.setdefault(site, len(facilities) + 1)
+                                  for site in sites], dtype=np.int32)
+
+            for name, table in zip(['fact_emissions', 'fact_activity'],
+                                   star_facts(batch, date_keys, site_keys[codes])):
+                table = pa.Table.from_pandas(table, preserve_index=False)
+                if name not in writers:
+                    writers[name] = pq.ParquetWriter(os.path.join(output_dir, f'{name}.parquet'),
+                                                     table.schema, compression=compression)
+                writers[name].write_table(table)
+            rollup = merge_rollups(rollup, build_rollup(batch, company_info['company_name']))
+            rows += len(batch)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    def write_table(df, name):
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False),
+                       os.path.join(output_dir, f'{name}.parquet'), compression=compression)
+
+    for name, table in star_dimensions(dates, facilities).items():
+        write_table(table, name)
+    _write_side_tables(rollup, company_info, output_dir, write_table)
+    print(f"\n[OK] Star schema created: {output_dir} ({rows:,} rows, "
+          f"{len(dates):,} dates x {len(facilities):,} facilities)")
+    return rollup
+
+
+def write_arrow_ipc(batches, company_info, output_dir, compression='zstd'):
+    """
+    Stream row-batches into a single Arrow IPC (Feather v2) file
+
+    The schema is fixed by the first batch (categoricals decoded); later
+    batches are cast to it.
+    Returns the rollup of the rows written; raises ValueError when there
+    are no batches.
+    """
+    pa, _ = _require_pyarrow()
+    batches = _nonempty(batches)
+    os.makedirs(output_dir, exist_ok=True)
+    data_path = os.path.join(output_dir, 'emissions_data.arrow')
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+
+    rollup = None
+    rows = 0
+    writer = None
+    schema = None
+    try:
+        for batch in batches:
+            table = pa.Table.from_pandas(batch, preserve_index=False)
+            if writer is None:
+                # IPC files allow one dictionary per field, but each categorical
+                # batch carries its own, so store categoricals as plain values
+                schema = pa.schema([field.with_type(field.type.value_type)
+                                    if pa.types.is_dictionary(field.type) else field
+                                    for field in table.schema])
+                writer = pa.ipc.new_file(data_path, schema, options=options)
+            writer.write_table(table.cast(schema))
+            rollup = merge_rollups(rollup, build_rollup(batch, company_info['company_name']))
+            rows += len(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    def write_table(df, name):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with pa.ipc.new_file(os.path.join(output_dir, f'{name}.arrow'), table.schema,
+                             options=options) as side_writer:
+            side_writer.write_table(table)
+
+    _write_side_tables(rollup, company_info, output_dir, write_table)
+    print(f"\n[OK] Arrow IPC file created: {data_path} ({rows:,} rows)")
+    return rollup
@@ -0,0 +1,184 @@
+"""
+CSRD Emissions Rollup Store
+===========================
+Persistent, incrementally updated aggregates behind the Annual_Summary and
+Data_Quality sheets and the data quality chart.
+
+A rollup holds two small tables:
+- periods: production, scope totals, intensity sum and row count per
+  (Entity, Year, Month)
+- quality: tCO2e per (Entity, Year, Month, Scope, Category, Quality_Tier),
+  the long form of long_format.py with categorical keys
+
+Summary tables are computed from the rollup in O(groups), so appending one
+month to a multi-year, multi-site history never rescans the raw rows.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from long_format import (LONG_KEYS, QUALITY_TIERS, SCOPES, counted_categories, to_long,
+                         with_long_dtypes)
+from time_series import resample_monthly
+
+# Columns summed per year on the Annual_Summary sheet
+SUMMARY_SUM_COLUMNS = [
+    'Production_Tonnes',
+    'Scope1_Total_tCO2e',
+    'Scope2_Total_tCO2e',
+    'Scope3_Total_tCO2e',
+    'Total_Emissions_tCO2e',
+]
+INTENSITY_COLUMN = 'Emissions_Intensity_tCO2e_per_tonne'
+
+PERIOD_KEYS = ['Entity', 'Year', 'Month']
+QUALITY_KEYS = PERIOD_KEYS + LONG_KEYS
+
+DEFAULT_ENTITY = 'Norrland Stål AB'
+
+PERIOD_FILE = 'period_rollup.csv'
+QUALITY_FILE = 'quality_rollup.csv'
+
+
+def build_rollup(df, entity=DEFAULT_ENTITY):
+    """
+    Aggregate raw Emissions_Data rows into a rollup
+
+    Rows without an Entity column (single-site output) are attributed to
+    `entity`. Daily/hourly rows (with a Timestamp column) are resampled to
+    monthly rows first, so the mean intensity stays a mean of months.
+    """
+    if 'Timestamp' in df.columns:
+        df = resample_monthly(df)
+    if 'Entity' not in df.columns:
+        df = df.assign(Entity=entity)
+
+    grouped = df.groupby(PERIOD_KEYS, sort=True, observed=True)
+    sums = grouped[SUMMARY_SUM_COLUMNS + [INTENSITY_COLUMN]].sum()
+
+    periods = sums[SUMMARY_SUM_COLUMNS].copy()
+    periods['Intensity_Sum'] = sums[INTENSITY_COLUMN]
+    periods['Rows'] = grouped.size()
+
+    long = to_long(df, PERIOD_KEYS)
+    quality = long.groupby(QUALITY_KEYS, sort=True, observed=True)[['tCO2e']].sum()
+
+    return {'periods': periods, 'quality': quality}
+
+
+def merge_rollups(left, right):
+    """Add two rollups (e.g. batches of the same run covering different sites)"""
+    if left is None:
+        return right
+    return {
+        'periods': left['periods'].add(right['periods'], fill_value=0),
+        'quality': left['quality'].add(right['quality'], fill_value=0),
+    }
+
+
+def update_rollup(store, new):
+    """
+    Fold a run's rollup into a persistent store
+
+    Entity-months present in `new` replace the stored ones, so re-running a
+    month-end close is idempotent; all other history is kept untouched.
+    """
+    if store is None:
+        return new
+
+    replaced = store['periods'].index.isin(new['periods'].index)
+    quality_periods = store['quality'].index.droplevel(LONG_KEYS)
+    replaced_quality = quality_periods.isin(new['periods'].index)
+
+    return {
+        'periods': pd.concat([store['periods'][~replaced], new['periods']]).sort_index(),
+        'quality': pd.concat([store['quality'][~replaced_quality], new['quality']]).sort_index(),
+    }
+
+
+def save_rollup(rollup, rollup_dir):
+    """Persist a rollup as two small CSV tables"""
+    os.makedirs(rollup_dir, exist_ok=True)
+    rollup['periods'].to_csv(os.path.join(rollup_dir, PERIOD_FILE))
+    rollup['quality'].to_csv(os.path.join(rollup_dir, QUALITY_FILE))
+
+
+def load_rollup(rollup_dir):
+    """Load a persisted rollup, or None if the store does not exist yet"""
+    period_path = os.path.join(rollup_dir, PERIOD_FILE)
+    quality_path = os.path.join(rollup_dir, QUALITY_FILE)
+    if not (os.path.exists(period_path) and os.path.exists(quality_path)):
+        return None
+
+    quality = pd.read_csv(quality_path)
+    if 'Category' not in quality.columns:
+        print(f"[NOTE] Rollup store {rollup_dir} predates per-category rows; rebuilding it")
+        return None
+
+    return {
+        'periods': pd.read_csv(period_path, index_col=PERIOD_KEYS),
+        'quality': with_long_dtypes(quality).set_index(QUALITY_KEYS),
+    }
+
+
+def rollup_matches(rollup, df):
+    """
+    Whether a rollup holds exactly the (Entity, Year, Month) periods and
+    total emissions of Emissions_Data rows, i.e. was built from the same run
+    """
+    if 'Timestamp' in df.columns:
+        df = resample_monthly(df)
+    stored = rollup['periods']['Total_Emissions_tCO2e']
+    keys = PERIOD_KEYS if 'Entity' in df.columns else ['Year', 'Month']
+    if 'Entity' not in df.columns:
+        stored = stored.groupby(level=keys).sum()
+    rows = df.groupby([df[key].astype(stored.index.get_level_values(key).dtype) for key in keys],
+                      sort=True, observed=True)['Total_Emissions_tCO2e'].sum()
+    aligned = pd.concat([stored.sort_index(), rows], axis=1, keys=['stored', 'rows'])
+    # Published rows are rounded, so sums agree to rounding, not exactly
+    return bool(aligned.notna().all(axis=None)
+                and np.allclose(aligned['stored'], aligned['rows'], rtol=1e-6, atol=0.01))
+
+
+def _select_entity(table, entity):
+    """Restrict a rollup table to one entity (None keeps all)"""
+    if entity is None:
+        return table
+    return table.xs(entity, level='Entity', drop_level=False)
+
+
+def annual_summary_table(rollup, entity=None):
+    """Annual_Summary sheet: yearly sums and mean monthly intensity"""
+    periods = _select_entity(rollup['periods'], entity)
+    annual = periods.groupby(level='Year').sum()
+
+    summary = annual[SUMMARY_SUM_COLUMNS].copy()
+    summary[INTENSITY_COLUMN] = annual['Intensity_Sum'] / annual['Rows']
+    summary.index = summary.index.astype('int64')
+    return summary.round(2)
+
+
+def quality_totals(rollup, entity=None):
+    """
+    tCO2e per (Scope, Quality_Tier), summed over all periods and the
+    categories counted in the scope totals
+    """
+    quality = _select_entity(rollup['quality'], entity)['tCO2e']
+    counted = quality.index.get_level_values('Category').isin(counted_categories())
+    return quality[counted].groupby(level=['Scope', 'Quality_Tier'], observed=False).sum()
+
+
+def data_quality_table(rollup, entity=None):
+    """Data_Quality sheet: Measured/Calculated/Estimated breakdown per scope"""
+    tiers = quality_totals(rollup, entity).unstack('Quality_Tier')
+    tiers = tiers.reindex(index=SCOPES, columns=QUALITY_TIERS, fill_value=0)
+    total = tiers['Measured'] + tiers['Calculated'] + tiers['Estimated']
+
+    quality_data = pd.DataFrame({'Scope': [f'Scope {scope}' for scope in SCOPES]})
+    for tier in QUALITY_TIERS:
+        quality_data[f'{tier}_tCO2e'] = tiers[tier].round(2).to_numpy()
+        quality_data[f'{tier}_Percent'] = (tiers[tier] / total * 100).round(1).to_numpy()
+    quality_data['Total_tCO2e'] = total.round(2).to_numpy()
+    return quality_data
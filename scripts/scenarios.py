@@ -0,0 +1,256 @@
+"""
+CSRD Decarbonisation Scenarios
+==============================
+Projects the monthly emissions model forward (to 2050 by default) for a
+grid of decarbonisation scenarios at once, and measures each pathway
+against the intensity targets.
+
+Scenario levers (SCENARIO_LEVERS):
+- h_dr_share / eaf_share: share of blast furnace (BF-BOF) capacity moved to
+  hydrogen direct reduction (HYBRIT) or scrap EAF, ramping in linearly from
+  the first projected year until switch_year
+- grid_change: annual change of the grid and market electricity factors
+- supply_chain_change: annual change of the purchased goods and transport
+  factors (supplier decarbonisation)
+- production_growth: annual production growth
+
+Every scenario is a column of (months x scenarios) input arrays evaluated
+through the calculation graph in one pass. Annual results are cached per
+scenario hash (levers + baseline + code version) and assembled into a
+compact float32 cube (scenario x year x metric), saved for the workbook
+and charts to query without rerunning the projection.
+"""
+
+import hashlib
+import inspect
+import itertools
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import calculation_graph
+from calculation_graph import evaluate_graph, upstream_nodes
+
+DEFAULT_CUBE_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'scenario_cube.npz')
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', '.cache', 'scenarios')
+
+# Emissions intensity targets (tCO2e/tonne steel) by year
+INTENSITY_TARGETS = {2030: 0.70, 2050: 0.20}
+
+# Lever values combined into the scenario grid
+SCENARIO_LEVERS = {
+    'h_dr_share': [0.0, 0.25, 0.5, 0.75, 1.0],
+    'eaf_share': [0.0, 0.1, 0.2, 0.3],
+    'switch_year': [2026, 2028, 2030],
+    'grid_change': [-0.05, -0.02, 0.0, 0.02],
+    'supply_chain_change': [0.0, -0.03],
+    'production_growth': [0.0, 0.01],
+}
+
+# Route that converting capacity leaves, and the routes each lever moves it to
+CONVERTED_ROUTE = 'BF-BOF'
+ROUTE_LEVERS = {'H-DR': 'h_dr_share', 'EAF': 'eaf_share'}
+
+# Factors each annual-change lever scales
+FACTOR_LEVERS = {
+    'grid_change': ['grid_factor', 'market_factor'],
+    'supply_chain_change': ['ore_factor', 'coal_factor', 'limestone_factor',
+                            'freight_factor', 'distribution_factor'],
+}
+
+# Cube metrics: annual sums of these graph nodes, plus intensity
+CUBE_METRICS = ['Production_Tonnes', 'Scope1_Total_tCO2e', 'Scope2_Total_tCO2e',
+                'Scope2_Market_Based', 'Scope3_Total_tCO2e', 'Total_Emissions_tCO2e',
+                'Emissions_Intensity_tCO2e_per_tonne']
+INTENSITY_METRIC = 'Emissions_Intensity_tCO2e_per_tonne'
+
+_NODES = upstream_nodes(CUBE_METRICS[1:-1])
+
+# Hit/miss counters for the current process
+CACHE_STATS = {'hits': 0, 'misses': 0}
+
+
+# =====================================
+# Scenario grid
+# =====================================
+
+def scenario_grid(levers=SCENARIO_LEVERS):
+    """All lever combinations as a DataFrame (conversions above 100% dropped)"""
+    grid = pd.DataFrame(list(itertools.product(*levers.values())), columns=list(levers))
+    converted = sum(grid[lever] for lever in ROUTE_LEVERS.values() if lever in grid)
+    return grid[converted <= 1].reset_index(drop=True)
+
+
+def _digest(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def baseline_digest(baseline):
+    """Digest of a scenario_baseline(): dates, site routes and every input array"""
+    parts = [baseline['dates'].asi8.tobytes(), list(baseline['routes'])]
+    for route, inputs in sorted(baseline['inputs'].items()):
+        parts += [route] + [np.ascontiguousarray(inputs[name]).tobytes() for name in sorted(inputs)]
+    return _digest(*parts)
+
+
+def _code_version():
+    """Digest of the projection code and the calculation graph"""
+    return _digest(inspect.getsource(project_scenarios), inspect.getsource(calculation_graph))
+
+
+def scenario_hashes(scenarios, baseline):
+    """Cache key per scenario: its levers, the baseline and the code version"""
+    context = _digest(baseline_digest(baseline), _code_version())
+    return [_digest(context, json.dumps(levers, sort_keys=True))
+            for levers in scenarios.to_dict('records')]
+
+
+# =====================================
+# Projection
+# =====================================
+
+def project_scenarios(baseline, scenarios):
+    """
+    Annual cube values (scenarios, years, CUBE_METRICS) for a baseline
+
+    Lever values broadcast against the baseline months, so every input is a
+    (months, scenarios) array and each site is one graph evaluation.
+    """
+    dates = baseline['dates']
+    elapsed = (dates.year.to_numpy() + (dates.month.to_numpy() - 1) / 12 - dates[0].year)[:, None]
+    lever = {name: scenarios[name].to_numpy(dtype=np.float64)[None, :] for name in scenarios}
+
+    # Conversion progress: 0 in the first projected month, 1 from switch_year on
+    ramp_years = np.maximum(lever['switch_year'] - dates[0].year, 1 / 12)
+    progress = np.clip(elapsed / ramp_years, 0, 1)
+    growth = (1 + lever['production_growth']) ** elapsed
+    factor_change = {name: (1 + lever[name]) ** elapsed for name in FACTOR_LEVERS}
+
+    totals = {node: 0.0 for node in CUBE_METRICS[:-1]}
+    for site, route in enumerate(baseline['routes']):
+        weights = {route: 1.0}
+        if route == CONVERTED_ROUTE:
+            moved = {target: lever[name] * progress for target, name in ROUTE_LEVERS.items()}
+            weights = {route: 1 - sum(moved.values()), **moved}
+
+        # Route parameters enter the graph linearly, so a route mix is a
+        # production-weighted blend of the per-route inputs
+        inputs = {}
+        for name in baseline['inputs'][route]:
+            inputs[name] = sum(weight * baseline['inputs'][r][name][site][:, None]
+                               for r, weight in weights.items())
+        inputs['Production_Tonnes'] = inputs['Production_Tonnes'] * growth
+        inputs['size_scale'] = inputs['size_scale'] * growth
+        for name, factors in FACTOR_LEVERS.items():
+            for factor in factors:
+                inputs[factor] = inputs[factor] * factor_change[name]
+
+        values = evaluate_graph(inputs, _NODES)
+        for node in totals:
+            totals[node] = totals[node] + (values[node] if node in values else inputs[node])
+
+    # Annual sums; intensity re-derived from them
+    n_years = len(dates) // 12
+    annual = [np.broadcast_to(totals[node], (len(dates), len(scenarios)))
+              .reshape(n_years, 12, -1).sum(axis=1) for node in CUBE_METRICS[:-1]]
+    sources, formula = calculation_graph.CALCULATION_GRAPH[INTENSITY_METRIC]
+    annual.append(formula(*[annual[CUBE_METRICS.index(source)] for source in sources]))
+    return np.stack(annual, axis=-1).transpose(1, 0, 2).astype(np.float32)
+
+
+def run_scenarios(baseline, scenarios=None, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Scenario cube for a baseline, projecting only scenarios not yet cached
+
+    Returns {'scenarios': levers + Scenario_Hash, 'years', 'metrics',
+    'values': float32 (scenarios, years, metrics)}.
+    """
+    scenarios = scenario_grid() if scenarios is None else scenarios.reset_index(drop=True)
+    hashes = scenario_hashes(scenarios, baseline)
+    years = np.unique(baseline['dates'].year)
+    values = np.empty((len(scenarios), len(years), len(CUBE_METRICS)), dtype=np.float32)
+
+    cache_dir = Path(cache_dir) if cache_dir else None
+    missing = []
+    for i, scenario_hash in enumerate(hashes):
+        path = cache_dir / f'{scenario_hash[:32]}.npy' if cache_dir else None
+        if path is not None and path.exists():
+            values[i] = np.load(path)
+            CACHE_STATS['hits'] += 1
+        else:
+            missing.append(i)
+            CACHE_STATS['misses'] += 1
+
+    if missing:
+        values[missing] = project_scenarios(baseline, scenarios.iloc[missing])
+        if cache_dir:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            for i in missing:
+                np.save(cache_dir / f'{hashes[i][:32]}.npy', values[i])
+
+    return {
+        'scenarios': scenarios.assign(Scenario_Hash=[h[:12] for h in hashes]),
+        'years': years,
+        'metrics': list(CUBE_METRICS),
+        'values': values,
+    }
+
+
+# =====================================
+# Cube storage and queries
+# =====================================
+
+def save_cube(cube, path=DEFAULT_CUBE_PATH):
+    """Save a scenario cube as one .npz file"""
+    scenarios = cube['scenarios']
+    columns = {}
+    for i, col in enumerate(scenarios):
+        array = scenarios[col].to_numpy()
+        columns[f'scenario_{i}'] = array.astype(str) if array.dtype == object else array
+    np.savez(path, values=cube['values'], years=cube['years'],
+             metrics=np.array(cube['metrics'], dtype=str),
+             scenario_columns=np.array(scenarios.columns, dtype=str), **columns)
+    return path
+
+
+def load_cube(path=DEFAULT_CUBE_PATH):
+    """Load a saved scenario cube; None if there is none"""
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as data:
+        columns = [str(col) for col in data['scenario_columns']]
+        scenarios = pd.DataFrame({col: data[f'scenario_{i}'] for i, col in enumerate(columns)})
+        return {'scenarios': scenarios, 'years': data['years'],
+                'metrics': [str(metric) for metric in data['metrics']], 'values': data['values']}
+
+
+def cube_metric(cube, metric=INTENSITY_METRIC):
+    """One metric as a (scenario x year) frame indexed by Scenario_Hash"""
+    values = cube['values'][:, :, cube['metrics'].index(metric)]
+    return pd.DataFrame(values, index=pd.Index(cube['scenarios']['Scenario_Hash'], name='Scenario'),
+                        columns=cube['years'])
+
+
+def pathway_summary(cube, targets=INTENSITY_TARGETS):
+    """
+    One row per scenario: levers, intensity and total emissions in each
+    target year and whether the target is met, best 2030 intensity first
+    """
+    intensity = cube_metric(cube)
+    total = cube_metric(cube, 'Total_Emissions_tCO2e')
+    summary = cube['scenarios'].set_index('Scenario_Hash')
+    for year, target in targets.items():
+        if year not in intensity.columns:
+            continue
+        summary[f'Intensity_{year}'] = intensity[year].round(3)
+        summary[f'Total_{year}_tCO2e'] = total[year].round(0)
+        summary[f'Meets_{year}_Target'] = intensity[year] <= target
+    sort_by = [col for col in summary.columns if col.startswith('Intensity_')][:1]
+    return summary.sort_values(sort_by, kind='stable').reset_index() if sort_by else summary.reset_index()
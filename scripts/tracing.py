@@ -0,0 +1,207 @@
+"""
+CSRD Pipeline Tracing
+=====================
+Stage-level spans for the generator and chart pipelines.
+
+    with span('write_sheet', sheet='Emissions_Data') as s:
+        df.to_excel(...)
+        s['rows'] = len(df)
+
+Each span records its duration, row count and bytes written (when the code
+sets them) and the change in process RSS. Spans nest; the recorded events
+export as a Chrome trace (chrome://tracing, Perfetto) and a per-stage
+summary table.
+
+Profile mode runs cProfile and tracemalloc around every span of one named
+stage and writes a .prof file plus the top allocation sites.
+
+Tracing is off until enable() is called; disabled spans cost one dict.
+"""
+
+import cProfile
+import functools
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Trace state for this process
+_TRACE = {'enabled': False, 'events': [], 'profile_stage': None, 'profile_dir': '.'}
+
+# Allocation sites listed per profiled span
+TOP_ALLOCATIONS = 15
+
+
+def enable(profile_stage=None, profile_dir='.'):
+    """Start recording spans (optionally profiling spans named profile_stage)"""
+    _TRACE.update(enabled=True, profile_stage=profile_stage, profile_dir=profile_dir)
+
+
+def is_enabled():
+    """Whether spans are being recorded in this process"""
+    return _TRACE['enabled']
+
+
+def _rss_bytes():
+    """Current resident set size (Linux /proc; None elsewhere)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Time a pipeline stage; yields a dict the stage can add 'rows', 'bytes'
+    or other attributes to
+    """
+    info = dict(attrs)
+    if not _TRACE['enabled']:
+        yield info
+        return
+
+    profiler = None
+    if name == _TRACE['profile_stage']:
+        profiler = cProfile.Profile()
+        tracemalloc.start()
+        profiler.enable()
+
+    rss_before = _rss_bytes()
+    start_us = time.time_ns() // 1000
+    started = time.perf_counter()
+    try:
+        yield info
+    finally:
+        seconds = time.perf_counter() - started
+        if profiler is not None:
+            profiler.disable()
+            info.update(_save_profile(name, profiler))
+        rss_after = _rss_bytes()
+        if rss_before is not None and rss_after is not None:
+            info['rss_delta_bytes'] = rss_after - rss_before
+        _TRACE['events'].append({
+            'name': name,
+            'ph': 'X',
+            'ts': start_us,
+            'dur': round(seconds * 1e6),
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': info,
+        })
+
+
+def traced(name=None):
+    """Decorator recording a span around every call (default: function name)"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def traced_batches(name, batches):
+    """Yield from a batch iterator with a span around producing each batch"""
+    iterator = iter(batches)
+    while True:
+        with span(name) as info:
+            batch = next(iterator, None)
+            if batch is not None:
+                info['rows'] = len(batch)
+        if batch is None:
+            return
+        yield batch
+
+
+def _save_profile(name, profiler):
+    """Write cProfile stats and top allocation sites for a profiled span"""
+    snapshot = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    os.makedirs(_TRACE['profile_dir'], exist_ok=True)
+    stem = os.path.join(_TRACE['profile_dir'], f'{name}.{os.getpid()}.{time.time_ns()}')
+    profiler.dump_stats(stem + '.prof')
+    with open(stem + '.txt', 'w', encoding='utf-8') as f:
+        pstats.Stats(profiler, stream=f).sort_stats('cumulative').print_stats(30)
+        f.write(f"\nTop {TOP_ALLOCATIONS} allocation sites (tracemalloc):\n")
+        for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+            f.write(f"{stat}\n")
+    return {'profile': stem + '.prof', 'traced_peak_bytes': peak}
+
+
+def path_size(path):
+    """Bytes on disk for a file or everything under a directory"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
+
+
+# =====================================
+# Worker processes
+# =====================================
+
+def drain_events():
+    """
+    Remove and return this process's recorded events (e.g. to send from a
+    worker); events a forked worker inherited from its parent are dropped
+    """
+    pid = os.getpid()
+    events = [event for event in _TRACE['events'] if event['pid'] == pid]
+    _TRACE['events'] = []
+    return events
+
+
+def add_events(events):
+    """Merge events recorded in another process"""
+    _TRACE['events'].extend(events or [])
+
+
+# =====================================
+# Export
+# =====================================
+
+def write_chrome_trace(path):
+    """Write recorded spans as a Chrome trace JSON file; returns the path"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': sorted(_TRACE['events'], key=lambda e: e['ts']),
+                   'displayTimeUnit': 'ms'}, f, indent=1, default=str)
+    return path
+
+
+def summary_table():
+    """Per-stage totals: calls, seconds, rows, bytes written and RSS delta"""
+    import pandas as pd
+    columns = ['Stage', 'Calls', 'Seconds', 'Rows', 'Bytes', 'RSS_Delta_MB']
+    if not _TRACE['events']:
+        return pd.DataFrame(columns=columns)
+    events = pd.DataFrame({
+        'Stage': [e['name'] for e in _TRACE['events']],
+        'Seconds': [e['dur'] / 1e6 for e in _TRACE['events']],
+        'Rows': [e['args'].get('rows', 0) for e in _TRACE['events']],
+        'Bytes': [e['args'].get('bytes', 0) for e in _TRACE['events']],
+        'RSS_Delta_MB': [e['args'].get('rss_delta_bytes', 0) / 2 ** 20 for e in _TRACE['events']],
+    })
+    summary = events.groupby('Stage', sort=False).agg(
+        Calls=('Seconds', 'size'), Seconds=('Seconds', 'sum'), Rows=('Rows', 'sum'),
+        Bytes=('Bytes', 'sum'), RSS_Delta_MB=('RSS_Delta_MB', 'sum'))
+    return summary.reset_index()[columns]
+
+
+def print_summary():
+    """Print the per-stage summary table"""
+    print("\n" + "=" * 60)
+    print("STAGE TRACE SUMMARY")
+    print("=" * 60)
+    print(f"{'Stage':<28} {'Calls':>5} {'Seconds':>9} {'Rows':>10} {'MB out':>8} {'RSS +MB':>8}")
+    for row in summary_table().itertuples(index=False):
+        print(f"{row.Stage:<28} {row.Calls:>5} {row.Seconds:>9.3f} {int(row.Rows):>10,} "
+              f"{row.Bytes / 2 ** 20:>8.2f} {row.RSS_Delta_MB:>8.1f}")
@@ -0,0 +1,346 @@
+"""
+CSRD Emissions Data Validation
+==============================
+Schema and consistency checks for the Emissions_Data sheet, as documented
+in data/README.md:
+
+    Scope1_Total_tCO2e = Scope1_Blast_Furnace + Scope1_Auxiliary
+    Scope1_Total_tCO2e = Scope1_Measured + Scope1_Calculated + Scope1_Estimated
+    Total_Emissions_tCO2e = Scope1 + Scope2 + Scope3 totals
+    ...
+
+Rules are declarative (VALIDATION_RULES) and every rule is one vectorized
+expression over whole columns, so millions of rows validate in well under
+a second. Tolerances follow the published rounding (OUTPUT_COLUMNS) and the
+column dtype (float32 for daily/hourly output).
+
+Cross-run checks (--cross-run) cover what one workbook cannot show: that
+splitting a run into one-month windows (the month-end close) reproduces
+the full-year figures, certificate matching included, and that daily and
+hourly runs resample to the monthly figures.
+
+Usage:
+    python scripts/validation.py [data/norrland_stal_emissions.xlsx]
+    python scripts/validation.py --cross-run
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from calculation_graph import OUTPUT_COLUMNS
+from long_format import EMISSION_CATEGORIES
+
+# Emissions_Data columns (data/README.md data dictionary) and their kind
+SCHEMA = {
+    'Date': 'text',
+    'Year': 'integer',
+    'Month': 'integer',
+    'Month_Name': 'text',
+    **{column: 'number' for column in OUTPUT_COLUMNS},
+    'Reporting_Standard': 'text',
+}
+
+# Key columns present in roster and daily/hourly output only
+OPTIONAL_SCHEMA = {'Entity': 'text', 'Facility_ID': 'text', 'Timestamp': 'datetime'}
+
+# Rule name -> check. 'sum': column equals the sum of `of`; 'ratio': column
+# equals scale * sum(of) / per (rows with per == 0 skipped); 'range':
+# column within [min, max]; 'date_label': Date is the YYYY-MM of Year/Month
+VALIDATION_RULES = {
+    'scope1_sources': {'check': 'sum', 'column': 'Scope1_Total_tCO2e',
+                       'of': ['Scope1_Blast_Furnace', 'Scope1_Auxiliary']},
+    'scope1_quality': {'check': 'sum', 'column': 'Scope1_Total_tCO2e',
+                       'of': ['Scope1_Measured', 'Scope1_Calculated', 'Scope1_Estimated']},
+    'scope2_sources': {'check': 'sum', 'column': 'Scope2_Total_tCO2e',
+                       'of': ['Scope2_Location_Based', 'Scope2_Heating']},
+    'scope2_quality': {'check': 'sum', 'column': 'Scope2_Total_tCO2e',
+                       'of': ['Scope2_Measured', 'Scope2_Calculated', 'Scope2_Estimated']},
+    'scope3_categories': {'check': 'sum', 'column': 'Scope3_Total_tCO2e',
+                          'of': [column for column, scope, *_ in EMISSION_CATEGORIES if scope == 3]},
+    'scope3_quality': {'check': 'sum', 'column': 'Scope3_Total_tCO2e',
+                       'of': ['Scope3_Measured', 'Scope3_Calculated', 'Scope3_Estimated']},
+    'total_scopes': {'check': 'sum', 'column': 'Total_Emissions_tCO2e',
+                     'of': ['Scope1_Total_tCO2e', 'Scope2_Total_tCO2e', 'Scope3_Total_tCO2e']},
+    'intensity': {'check': 'ratio', 'column': 'Emissions_Intensity_tCO2e_per_tonne',
+                  'of': ['Total_Emissions_tCO2e'], 'per': 'Production_Tonnes', 'scale': 1},
+    'quality_score': {'check': 'ratio', 'column': 'Data_Quality_Score',
+                      'of': ['Scope1_Measured', 'Scope2_Measured', 'Scope3_Measured'],
+                      'per': 'Total_Emissions_tCO2e', 'scale': 100},
+    'non_negative': {'check': 'range', 'min': 0,
+                     'column': [column for column in OUTPUT_COLUMNS if column != 'Data_Quality_Score']},
+    'quality_score_range': {'check': 'range', 'column': 'Data_Quality_Score', 'min': 0, 'max': 100},
+    'month_range': {'check': 'range', 'column': 'Month', 'min': 1, 'max': 12},
+    'date_label': {'check': 'date_label', 'column': 'Date'},
+}
+
+VIOLATION_COLUMNS = ['Rule', 'Column', 'Row', 'Value', 'Expected']
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+
+# =====================================
+# Schema
+# =====================================
+
+_KIND_CHECKS = {
+    'text': lambda s: (pd.api.types.is_string_dtype(s) or pd.api.types.is_object_dtype(s)
+                       or isinstance(s.dtype, pd.CategoricalDtype)),
+    'integer': pd.api.types.is_integer_dtype,
+    'number': lambda s: pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s),
+    'datetime': pd.api.types.is_datetime64_any_dtype,
+}
+
+
+def schema_errors(df, schema=SCHEMA, optional=OPTIONAL_SCHEMA):
+    """Missing columns and columns of the wrong kind, as messages"""
+    errors = [f"missing column {column}" for column in schema if column not in df.columns]
+    for column, kind in {**schema, **optional}.items():
+        if column in df.columns and not _KIND_CHECKS[kind](df[column]):
+            errors.append(f"{column} is {df[column].dtype}, expected {kind}")
+    return errors
+
+
+def check_schema(df):
+    """Raise ValueError if df is not an Emissions_Data sheet"""
+    errors = schema_errors(df)
+    if errors:
+        raise ValueError("Emissions_Data schema: " + "; ".join(errors))
+
+
+# =====================================
+# Rules
+# =====================================
+
+def _values(df, column):
+    return df[column].to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _rounding(column):
+    """Half a unit in the last published decimal (0 if published unrounded)"""
+    decimals = OUTPUT_COLUMNS.get(column)
+    return 0.0 if decimals is None else 0.5 * 10.0 ** -decimals
+
+
+def _precision(df, columns):
+    """Relative error bound of the stored dtype (float32 for compact output)"""
+    eps = max(np.finfo(df[c].dtype).eps if np.issubdtype(df[c].dtype, np.floating)
+              else np.finfo(np.float64).eps for c in columns)
+    return 4 * eps * len(columns)
+
+
+def _check_sum(df, rule):
+    columns = [rule['column']] + rule['of']
+    actual = _values(df, rule['column'])
+    expected = sum(_values(df, column) for column in rule['of'])
+    tolerance = (sum(_rounding(column) for column in columns) + 1e-9
+                 + _precision(df, columns) * np.abs(expected))
+    return actual, expected, ~(np.abs(actual - expected) <= tolerance)
+
+
+def _check_ratio(df, rule):
+    columns = [rule['column'], rule['per']] + rule['of']
+    actual = _values(df, rule['column'])
+    numerator = sum(_values(df, column) for column in rule['of'])
+    denominator = _values(df, rule['per'])
+    valid = denominator != 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expected = rule['scale'] * numerator / denominator
+        # Rounded inputs move the ratio by their relative rounding error
+        input_error = (sum(_rounding(column) for column in rule['of']) / np.abs(numerator)
+                       + _rounding(rule['per']) / np.abs(denominator))
+        tolerance = (_rounding(rule['column']) + 1e-9
+                     + (input_error + _precision(df, columns)) * np.abs(expected))
+    failed = valid & ~(np.abs(actual - expected) <= tolerance)
+    return actual, expected, failed
+
+
+def _check_range(df, column, rule):
+    actual = _values(df, column)
+    low, high = rule.get('min', -np.inf), rule.get('max', np.inf)
+    failed = ~((actual >= low) & (actual <= high))
+    # Nearest allowed value, only where the range is violated
+    expected = actual
+    if failed.any():
+        expected = actual.copy()
+        expected[failed] = np.clip(actual[failed], low, high)
+    return actual, expected, failed
+
+
+def _check_date_label(df, rule):
+    # Parse each distinct label once (Date repeats for every day/hour/site)
+    labels = df[rule['column']].astype('category')
+    parsed = pd.to_datetime(pd.Series(labels.cat.categories.astype(str)), format='%Y-%m',
+                            errors='coerce')
+    label_month = (parsed.dt.year * 100 + parsed.dt.month).to_numpy(dtype=np.float64, na_value=np.nan)
+    codes = labels.cat.codes.to_numpy()
+    actual = np.where(codes >= 0, label_month[codes], np.nan)
+    expected = _values(df, 'Year') * 100 + _values(df, 'Month')
+    return actual, expected, ~(actual == expected)
+
+
+def validate_emissions(df, rules=VALIDATION_RULES):
+    """
+    Evaluate the rules over df; returns one row per violation (Rule,
+    Column, Row, Value, Expected), where Row is df's index label
+    """
+    found = []
+    for name, rule in rules.items():
+        columns = rule['column'] if isinstance(rule['column'], list) else [rule['column']]
+        for column in columns:
+            if rule['check'] == 'sum':
+                actual, expected, failed = _check_sum(df, rule)
+            elif rule['check'] == 'ratio':
+                actual, expected, failed = _check_ratio(df, rule)
+            elif rule['check'] == 'range':
+                actual, expected, failed = _check_range(df, column, rule)
+            elif rule['check'] == 'date_label':
+                actual, expected, failed = _check_date_label(df, rule)
+            else:
+                raise ValueError(f"Unknown check {rule['check']!r} in rule {name}")
+
+            rows = np.flatnonzero(failed)
+            if len(rows):
+                found.append(pd.DataFrame({
+                    'Rule': name,
+                    'Column': column,
+                    'Row': df.index.to_numpy()[rows],
+                    'Value': actual[rows],
+                    'Expected': expected[rows],
+                }))
+
+    if not found:
+        return pd.DataFrame(columns=VIOLATION_COLUMNS)
+    return pd.concat(found, ignore_index=True)
+
+
+def print_violations(violations, n_rows, shown=5):
+    """Print a per-rule summary of violations with the first row indices"""
+    if violations.empty:
+        print(f"[OK] Validated {n_rows:,} rows against {len(VALIDATION_RULES)} rules")
+        return
+    print(f"[ERROR] {len(violations):,} rule violation(s) in {n_rows:,} rows:")
+    for (rule, column), group in violations.groupby(['Rule', 'Column'], sort=False):
+        rows = ', '.join(str(row) for row in group['Row'].head(shown))
+        more = f" (+{len(group) - shown:,} more)" if len(group) > shown else ''
+        print(f"  {rule} [{column}]: {len(group):,} row(s), e.g. rows {rows}{more}")
+
+
+# =====================================
+# Cross-run checks
+# =====================================
+
+def _max_difference(left, right, keys, columns=None):
+    """Largest absolute difference of the published columns, rows matched on keys"""
+    if len(left) != len(right):
+        return np.inf
+    left = left.sort_values(keys).reset_index(drop=True)
+    right = right.sort_values(keys).reset_index(drop=True)
+    if not left[keys].astype(str).equals(right[keys].astype(str)):
+        return np.inf
+    columns = list(OUTPUT_COLUMNS) if columns is None else columns
+    return float(np.nanmax(np.abs(left[columns].to_numpy(dtype=np.float64)
+                                  - right[columns].to_numpy(dtype=np.float64))))
+
+
+def window_split_difference(year=2023):
+    """
+    Full-year roster run with certificate matching against the same year
+    as 12 one-month runs; returns the largest difference (tCO2e, kWh)
+    """
+    from generate_mock_data import generate_portfolio_data, load_facility_roster
+    from scope2_matching import load_certificates
+
+    roster = load_facility_roster(os.path.join(DATA_DIR, 'facility_roster.csv'))
+    certificates = load_certificates(os.path.join(DATA_DIR, 'energy_certificates.csv'))
+    full, _ = generate_portfolio_data(roster, f'{year}-01-01', f'{year}-12-01', max_workers=1,
+                                      certificates=certificates)
+    months = [generate_portfolio_data(roster, f'{year}-{month:02d}-01', f'{year}-{month:02d}-01',
+                                      max_workers=1, certificates=certificates)[0]
+              for month in range(1, 13)]
+    return _max_difference(full, pd.concat(months, ignore_index=True), ['Facility_ID', 'Date'])
+
+
+def resampling_difference(start='2023-01-01', end='2023-06-01'):
+    """
+    Roster run at monthly resolution against the same window at daily and
+    hourly resolution resampled to months; returns the largest difference
+    of the tCO2e columns
+    """
+    from generate_mock_data import generate_portfolio_data, load_facility_roster
+    from scope2_matching import load_certificates
+    from time_series import resample_monthly
+
+    roster = load_facility_roster(os.path.join(DATA_DIR, 'facility_roster.csv'))
+    certificates = load_certificates(os.path.join(DATA_DIR, 'energy_certificates.csv'))
+    monthly, _ = generate_portfolio_data(roster, start, end, max_workers=1,
+                                         certificates=certificates)
+    columns = [column for column in OUTPUT_COLUMNS if column.endswith('_tCO2e')]
+    differences = []
+    for freq in ['daily', 'hourly']:
+        rows, _ = generate_portfolio_data(roster, start, end, max_workers=1,
+                                          certificates=certificates, freq=freq)
+        differences.append(_max_difference(monthly, resample_monthly(rows),
+                                           ['Facility_ID', 'Date'], columns))
+    return max(differences)
+
+
+# Check -> (description, function returning the largest difference, tolerance)
+CROSS_RUN_CHECKS = {
+    'window_split': ('12 one-month runs = full-year run (GO matching)',
+                     window_split_difference, 1e-6),
+    # Both sides round independently, so they may differ by one unit (0.01 t)
+    'resampling': ('daily and hourly runs resampled to months = monthly run (tCO2e)',
+                   resampling_difference, 0.01 + 1e-9),
+}
+
+
+def run_cross_run_checks(checks=CROSS_RUN_CHECKS):
+    """Run the cross-run checks, printing one line each; returns the failed names"""
+    failed = []
+    for name, (description, check, tolerance) in checks.items():
+        difference = check()
+        if difference <= tolerance:
+            print(f"[OK] {name}: {description} (max difference {difference:.2g})")
+        else:
+            print(f"[ERROR] {name}: {description} (max difference {difference:.4g} "
+                  f"> {tolerance:g})")
+            failed.append(name)
+    return failed
+
+
+def main():
+    """Validate a generated workbook's Emissions_Data sheet"""
+    from data_cache import load_cached_sheet
+
+    default_path = os.path.join(DATA_DIR, 'norrland_stal_emissions.xlsx')
+    parser = argparse.ArgumentParser(description='Validate the Emissions_Data sheet')
+    parser.add_argument('workbook', nargs='?', default=default_path)
+    parser.add_argument('--output', help='Write all violations to this CSV file')
+    parser.add_argument('--cross-run', action='store_true',
+                        help='Instead, check generator runs against each other '
+                             '(e.g. one-month windows against a full year)')
+    args = parser.parse_args()
+    if args.cross_run:
+        sys.exit(1 if run_cross_run_checks() else 0)
+
+    df = load_cached_sheet(args.workbook, 'Emissions_Data')
+    try:
+        check_schema(df)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+
+    violations = validate_emissions(df)
+    print_violations(violations, len(df))
+    if args.output:
+        violations.to_csv(args.output, index=False)
+        print(f"[OK] Violations written to {args.output}")
+    sys.exit(1 if len(violations) else 0)
+
+
+if __name__ == "__main__":
+    main()